@@ -1,27 +1,124 @@
 from __future__ import annotations
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-import bcrypt
-import mysql.connector
+import asyncio
+import base64
+import collections
+import contextlib
+import time
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from database import initialize_database, get_db_connection
-from mysql.connector import Error
+import repository
+from database import get_pool, close_pool, add_query_hook, AsyncConnection, DatabaseError, IntegrityError, PoolTimeout
+from health import startup_state
+from passwords import DUMMY_HASH, hash_password, verify_password, needs_rehash, shutdown as shutdown_password_pool
+from serialization import dumps, JSONBytesResponse
+from security import create_access_token, decode_access_token, JWTError
+from cache import TTLCache, VersionWatcher
+from events import ChangeRelay, bulk_event, event_broker
+from history import status_history
+from loop_monitor import LoopBlockDetector
+from slow_queries import SlowQueryLog
+from metrics import MetricsMiddleware, observe_checkout, observe_inventory_rows, render as render_metrics
+from http_compression import CompressionMiddleware, precompress, precompressed_response
+from replicas import read_router, WRITE_POSITION_HEADER
+from prometheus_client import CONTENT_TYPE_LATEST
+from config import AUTH_CONFIG, CACHE_CONFIG, COMPRESSION_CONFIG, EVENTS_CONFIG, LOOP_MONITOR_CONFIG, SLOW_QUERY_CONFIG
 
 app = FastAPI()
+app.add_middleware(CompressionMiddleware, **COMPRESSION_CONFIG)
+# Added last so it runs outermost and its timings include compression
+app.add_middleware(MetricsMiddleware, routes=app.routes)
 
 @app.on_event("startup")
-def on_startup():
-    initialize_database()
+async def on_startup():
+    # Schema migrations run in the background; see /readyz
+    startup_state.start()
+    status_history.start()
+    reference_watcher.start()
+    if change_relay is not None:
+        change_relay.start()
 
-# Dependency to get the database session
-def get_db():
-    db = get_db_connection()
+loop_block_detector = LoopBlockDetector(LOOP_MONITOR_CONFIG['threshold_ms']) if LOOP_MONITOR_CONFIG['enabled'] else None
+
+slow_query_log = None
+if SLOW_QUERY_CONFIG['enabled']:
+    slow_query_log = SlowQueryLog(SLOW_QUERY_CONFIG['threshold_ms'], SLOW_QUERY_CONFIG['explain'])
+    add_query_hook(slow_query_log.observe)
+
+@app.on_event("startup")
+async def start_loop_block_detector():
+    if loop_block_detector is not None:
+        loop_block_detector.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if loop_block_detector is not None:
+        loop_block_detector.stop()
+    startup_state.stop()
+    await status_history.stop()
+    await reference_watcher.stop()
+    if change_relay is not None:
+        await change_relay.stop()
+    await read_router.close()
+    await close_pool()
+    shutdown_password_pool()
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/readyz")
+async def readyz():
+    readiness = await startup_state.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+def require_schema():
+    if not startup_state.schema_ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El servicio se está iniciando, intente nuevamente",
+            headers={"Retry-After": "5"},
+        )
+
+async def acquire_connection(pool) -> AsyncConnection:
+    """Checks a connection out of ``pool``, turning failures into a 503."""
+    require_schema()
+    started = time.perf_counter()
+    try:
+        db = await pool.acquire()
+    except (PoolTimeout, DatabaseError) as err:
+        print(f"Could not get a database connection: {err}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no disponible, intente nuevamente",
+        )
+    observe_checkout(time.perf_counter() - started)
+    return db
+
+@contextlib.asynccontextmanager
+async def pooled_connection():
+    pool = get_pool()
+    db = await acquire_connection(pool)
     try:
         yield db
+    except asyncio.CancelledError:
+        # A statement may have been cut off mid-result; don't reuse the connection
+        db.discard = True
+        raise
     finally:
-        db.close()
+        await pool.release(db)
+
+# Dependency to get the database session
+async def get_db():
+    async with pooled_connection() as db:
+        yield db
 
 class UserCreate(BaseModel):
     username: str
@@ -74,395 +171,881 @@ class InventoryItemOut(InventoryItemBase):
     item_code: ItemCode
     asignado_a: Optional[UserOut] = None
 
+class InventoryBulkCreate(BaseModel):
+    items: List[InventoryItemCreate]
+
+class BulkItemResult(BaseModel):
+    index: int
+    sn: str
+    ok: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class InventoryBulkResult(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user_from_token(token: str = Depends(oauth2_scheme), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM users WHERE username = %s", (token,))
-    user = cursor.fetchone()
-    cursor.close()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return user
+_user_status_cache = TTLCache(ttl=AUTH_CONFIG['revocation_check_ttl'])
+
+async def get_current_user_from_token(token: str = Depends(oauth2_scheme)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    # Signature and expiry checks are pure CPU and run on the event loop
+    try:
+        claims = decode_access_token(token)
+    except JWTError:
+        raise credentials_exception
+    # The user status is cached for a short TTL so revoked users and admin
+    # demotions take effect quickly.
+    user_status = _user_status_cache.get(claims['id'])
+    if user_status is None:
+        async with pooled_connection() as db:
+            user_status = await repository.get_user_status(db, claims['id'])
+        _user_status_cache.set(claims['id'], user_status)
+    if not user_status:
+        raise credentials_exception
+    return {
+        'id': claims['id'],
+        'username': claims['sub'],
+        'is_admin': user_status['is_admin'],
+    }
 
 async def get_current_admin_user(current_user: dict = Depends(get_current_user_from_token)):
     if not current_user.get('is_admin'):
         raise HTTPException(status_code=403, detail="Operation not permitted")
     return current_user
 
-@app.post("/auth")
-def authenticate_user(data: UserAuth, db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
-    # This is insecure and for demo purposes. In production, you'd compare password hashes.
-    cursor.execute(
-        "SELECT id, username, full_name, is_admin FROM users WHERE username = %s",
-        (data.username,)
-    )
-    user = cursor.fetchone()
-    cursor.close()
+@contextlib.asynccontextmanager
+async def read_connection(position: int = 0):
+    """A connection for read-only queries: a replica that has applied ``position``, else the primary."""
+    require_schema()
+    started = time.perf_counter()
+    replica = await read_router.acquire(position)
+    if replica is None:
+        async with pooled_connection() as db:
+            yield db
+        return
+    observe_checkout(time.perf_counter() - started)
+    pool, db = replica
+    try:
+        yield db
+    except asyncio.CancelledError:
+        db.discard = True
+        raise
+    finally:
+        await pool.release(db)
+
+async def get_read_db(request: Request, current_user: dict = Depends(get_current_user_from_token)):
+    """Like get_db(), for endpoints that only read; see replicas.py."""
+    position = read_router.required_position(current_user['id'], request.headers.get(WRITE_POSITION_HEADER))
+    async with read_connection(position) as db:
+        yield db
 
-    if not user:
+def remember_write(response: Response, user: dict, version: int):
+    """Keeps ``user`` reading from the primary until the replicas have applied ``version``."""
+    read_router.note_write(user['id'], version)
+    response.headers[WRITE_POSITION_HEADER] = str(version)
+
+@app.post("/auth")
+async def authenticate_user(data: UserAuth):
+    async with pooled_connection() as db:
+        user = await repository.get_login_user(db, data.username)
+    # Unknown usernames are checked against DUMMY_HASH so they take as long
+    valid = await verify_password(data.password, user['password_hash'] if user else DUMMY_HASH)
+    if not user or not valid:
         raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
 
-    # A placeholder for password verification
-    # In a real app: if not bcrypt.checkpw(data.password.encode('utf-8'), user['password_hash'].encode('utf-8')):
-    # For this demo, we are not checking password hash. The simplified token (username) is the auth.
-    # This endpoint is just to simulate a login flow.
-    # We add the access_token to the user dictionary to be used by the client.
-    user["access_token"] = user['username']
+    password_hash = user.pop('password_hash')
+    if needs_rehash(password_hash):
+        # The configured cost factor changed since this hash was made
+        new_hash = await hash_password(data.password)
+        try:
+            async with pooled_connection() as db:
+                await repository.set_password_hash(db, user['id'], new_hash)
+        except (HTTPException, DatabaseError) as err:
+            # Not fatal: we'll try again on the next login
+            print(f"Could not rehash password for user {user['id']}: {err}")
+
+    user['is_admin'] = bool(user['is_admin'])
+    # We add a signed access_token to the user dictionary to be used by the client.
+    user["access_token"] = create_access_token(user)
+    user["token_type"] = "bearer"
     return user
 
 @app.post("/users", status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, admin: dict = Depends(get_current_admin_user), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor()
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+async def create_user(user: UserCreate, response: Response, admin: dict = Depends(get_current_admin_user)):
+    hashed_password = await hash_password(user.password)
+    async with pooled_connection() as db:
+        try:
+            version = await repository.create_user(db, user.username, hashed_password, user.full_name, user.is_admin)
+        except DatabaseError as err:
+            raise HTTPException(status_code=400, detail=f"Error creating user: {err}")
+    invalidate_reference_data('technicians', position=version)
+    remember_write(response, admin, version)
+    return {"message": "User created successfully"}
+
+@app.get("/debug/pool")
+async def get_pool_stats(admin: dict = Depends(get_current_admin_user)):
+    return dict(get_pool().stats(), read_routing=read_router.stats())
+
+@app.get("/debug/loop-blocks")
+async def get_loop_blocks(admin: dict = Depends(get_current_admin_user)):
+    if loop_block_detector is None:
+        raise HTTPException(status_code=404, detail="Detector deshabilitado (DEBUG_LOOP_BLOCKING=1)")
+    return list(loop_block_detector.reports)
+
+@app.get("/debug/slow-queries")
+async def get_slow_queries(
+    top: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total_ms", pattern="^(total_ms|max_ms|count)$"),
+    admin: dict = Depends(get_current_admin_user),
+):
+    """Slowest statement shapes, by total time unless ``order_by`` says otherwise."""
+    if slow_query_log is None:
+        raise HTTPException(status_code=404, detail="Registro deshabilitado (SLOW_QUERY_LOG=1)")
+    return slow_query_log.top(top, order_by)
+
+@app.delete("/debug/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_slow_queries(admin: dict = Depends(get_current_admin_user)):
+    if slow_query_log is None:
+        raise HTTPException(status_code=404, detail="Registro deshabilitado (SLOW_QUERY_LOG=1)")
+    slow_query_log.reset()
+
+# Reference data changes rarely, so its encoded JSON is kept in memory and
+# served without touching the pool. Writers call invalidate_reference_data()
+# and record the write in reference_versions, which the other workers poll.
+_reference_cache = TTLCache(ttl=CACHE_CONFIG['reference_ttl'])
+# Change version of the last write to each key; reloads must see it
+_reference_positions = {}
+# Bumped by every invalidation: a load that started before one is not cached
+_reference_generations = collections.Counter()
+# key -> the load in flight, shared by concurrent misses
+_reference_loads = {}
+
+REFERENCE_LOADERS = {
+    'item_codes': repository.list_item_codes,
+    'technicians': repository.list_technicians,
+}
+
+def invalidate_reference_data(*keys: str, position: int = 0):
+    for key in keys or REFERENCE_LOADERS:
+        _reference_generations[key] += 1
+        _reference_loads.pop(key, None)
+        _reference_cache.pop(key)
+        _reference_positions[key] = max(position, _reference_positions.get(key, 0))
+
+async def _fetch_reference_versions() -> dict:
+    if not startup_state.schema_ready:
+        return {}
+    pool = get_pool()
+    conn = await pool.acquire()
     try:
-        cursor.execute(
-            "INSERT INTO users (username, password_hash, full_name, is_admin) VALUES (%s, %s, %s, %s)",
-            (user.username, hashed_password.decode('utf-8'), user.full_name, user.is_admin)
-        )
-        db.commit()
-    except mysql.connector.Error as err:
-        raise HTTPException(status_code=400, detail=f"Error creating user: {err}")
+        versions = await repository.get_reference_versions(conn)
+        await conn.rollback()
     finally:
-        cursor.close()
-    return {"message": "User created successfully"}
+        await pool.release(conn)
+    return versions
+
+def _reference_changed(key: str, version: int):
+    # Writes made by this worker were already invalidated
+    if key in REFERENCE_LOADERS and version > _reference_positions.get(key, 0):
+        invalidate_reference_data(key, position=version)
+
+reference_watcher = VersionWatcher(_fetch_reference_versions, _reference_changed, CACHE_CONFIG['reference_poll_interval'])
+
+async def _reference_entry(key: str) -> tuple:
+    """Returns the cached (rows, encoded JSON, compressed variants) for ``key``, loading it on a miss."""
+    entry = _reference_cache.get(key)
+    if entry is not None:
+        return entry
+    load = _reference_loads.get(key)
+    if load is None:
+        load = _reference_loads[key] = asyncio.ensure_future(_load_reference(key))
+
+        def forget(done):
+            if _reference_loads.get(key) is done:
+                del _reference_loads[key]
+            if not done.cancelled():
+                # Marks a failure as seen even if every waiter was cancelled
+                done.exception()
+
+        load.add_done_callback(forget)
+    # Shielded: a waiter that is cancelled doesn't cancel the others' load
+    return await asyncio.shield(load)
+
+async def _load_reference(key: str) -> tuple:
+    generation = _reference_generations[key]
+    async with read_connection(_reference_positions.get(key, 0)) as db:
+        rows = await REFERENCE_LOADERS[key](db)
+    body = dumps(rows)
+    entry = (rows, body, await precompress(body, COMPRESSION_CONFIG['minimum_size']))
+    if _reference_generations[key] == generation:
+        _reference_cache.set(key, entry)
+    return entry
+
+def _reference_response(request: Request, entry: tuple):
+    _, body, variants = entry
+    return precompressed_response(body, variants, request.headers.get('accept-encoding'))
 
 @app.get("/item-codes", response_model=List[ItemCode])
-def get_item_codes(current_user: dict = Depends(get_current_user_from_token), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, codigo, tipo, descripcion FROM item_codes ORDER BY codigo")
-    codes = cursor.fetchall()
-    cursor.close()
-    return codes
+async def get_item_codes(request: Request, current_user: dict = Depends(get_current_user_from_token)):
+    return _reference_response(request, await _reference_entry('item_codes'))
 
 @app.get("/users/technicians", response_model=List[UserOut])
-def get_technicians(admin: dict = Depends(get_current_admin_user), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, username, full_name, is_admin FROM users ORDER BY full_name")
-    technicians = cursor.fetchall()
-    cursor.close()
-    return technicians
+async def get_technicians(request: Request, admin: dict = Depends(get_current_admin_user)):
+    return _reference_response(request, await _reference_entry('technicians'))
+
+async def _create_error_detail(db: AsyncConnection, err: DatabaseError, item: InventoryItemBase) -> str:
+    """Maps constraint violations on inventory_items to the API's error messages (call after rolling back)."""
+    kind = getattr(err, 'kind', None)
+    if kind == 'duplicate':
+        return f"Ya existe un ítem con el número de serie: {item.sn}"
+    if kind == 'foreign_key':
+        if not await repository.existing_ids(db, "item_codes", {item.item_code_id}):
+            return f"El código de ítem {item.item_code_id} no existe"
+        if item.asignado_a_id is not None and not await repository.existing_ids(db, "users", {item.asignado_a_id}):
+            return f"El usuario {item.asignado_a_id} no existe"
+    return f"Error al crear el ítem: {err}"
 
 @app.post("/inventory", response_model=InventoryItemOut, status_code=status.HTTP_201_CREATED)
-def create_inventory_item(item: InventoryItemCreate, current_user: dict = Depends(get_current_user_from_token), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    print(f"Creating inventory item with data: {item.dict()}")  # Log de depuración
-    cursor = db.cursor(dictionary=True)
+async def create_inventory_item(item: InventoryItemCreate, response: Response, current_user: dict = Depends(get_current_user_from_token), db: AsyncConnection = Depends(get_db)):
+    require_history_room()
     try:
-        # Verificar si ya existe un ítem con el mismo SN
-        cursor.execute("SELECT id FROM inventory_items WHERE sn = %s", (item.sn,))
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail=f"Ya existe un ítem con el número de serie: {item.sn}")
-            
-        # Verificar que el item_code_id existe
-        cursor.execute("SELECT id FROM item_codes WHERE id = %s", (item.item_code_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=400, detail=f"El código de ítem {item.item_code_id} no existe")
-        
-        # Insertar el nuevo ítem
-        cursor.execute(
-            """
-            INSERT INTO inventory_items 
-            (sn, item_code_id, tipo_servicio, estado_actual, asignado_a_id, terminal_comercio) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """,
-            (item.sn, item.item_code_id, item.tipo_servicio, item.estado_actual, item.asignado_a_id, item.terminal_comercio)
-        )
-        db.commit()
-        item_id = cursor.lastrowid
+        version = await repository.next_change_versions(db)
+        # El índice UNIQUE de sn y la FK de item_code_id validan el ítem:
+        # no hace falta consultar antes de insertar.
+        item_id = await repository.insert_item(db, item, version)
         print(f"Item created successfully with ID: {item_id}")  # Log de depuración
-        
+        await repository.apply_stats_delta(db, added=[item])
+
         # Obtener el ítem recién creado
-        new_item = get_inventory_item_by_id(item_id, db)
-        if not new_item:
+        new_row = await repository.fetch_item(db, item_id)
+        if not new_row:
             raise HTTPException(status_code=500, detail="Error al recuperar el ítem recién creado")
-            
-        return new_item
-        
-    except mysql.connector.Error as err:
-        db.rollback()
+        await db.commit()
+        remember_write(response, current_user, version)
+        publish_item_event("created", version, item_id, item.asignado_a_id, row=new_row)
+        status_history.record(item_id, None, item.estado_actual, item.terminal_comercio, current_user['id'])
+        return _row_to_item(new_row)
+
+    except DatabaseError as err:
+        await db.rollback()
         print(f"Database error: {err}")  # Log de depuración
-        raise HTTPException(status_code=400, detail=f"Error al crear el ítem: {err}")
+        try:
+            detail = await _create_error_detail(db, err, item)
+        except DatabaseError:
+            detail = f"Error al crear el ítem: {err}"
+        raise HTTPException(status_code=400, detail=detail)
     except HTTPException:
         # Re-lanzar las excepciones HTTP que ya manejamos
+        await db.rollback()
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Unexpected error: {e}")  # Log de depuración
         raise HTTPException(status_code=500, detail=f"Error inesperado al crear el ítem: {str(e)}")
-    finally:
-        cursor.close()
 
-@app.get("/inventory", response_model=List[InventoryItemOut])
-def get_all_inventory_items(current_user: dict = Depends(get_current_user_from_token), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
-    query = """
-        SELECT 
-            i.id, i.fecha_ingreso, i.sn, i.tipo_servicio, i.estado_actual, i.terminal_comercio,
-            i.item_code_id, i.asignado_a_id,
-            ic.codigo as item_code_codigo, ic.tipo as item_code_tipo, ic.descripcion as item_code_descripcion,
-            u.username as user_username, u.full_name as user_full_name, u.is_admin as user_is_admin
-        FROM inventory_items i
-        JOIN item_codes ic ON i.item_code_id = ic.id
-        LEFT JOIN users u ON i.asignado_a_id = u.id
-        ORDER BY i.fecha_ingreso DESC
-    """
-    cursor.execute(query)
-    results = cursor.fetchall()
-    cursor.close()
-
-    items = []
-    for row in results:
-        item = InventoryItemOut(
-            id=row['id'],
-            fecha_ingreso=row['fecha_ingreso'],
-            sn=row['sn'],
-            tipo_servicio=row['tipo_servicio'],
-            estado_actual=row['estado_actual'],
-            terminal_comercio=row['terminal_comercio'],
-            item_code_id=row['item_code_id'],
-            asignado_a_id=row['asignado_a_id'],
-            item_code=ItemCode(
-                id=row['item_code_id'],
-                codigo=row['item_code_codigo'],
-                tipo=row['item_code_tipo'],
-                descripcion=row['item_code_descripcion']
-            ),
-            # Correctly handle cases where 'asignado_a_id' is None.
-            # The check must be done on the existence of the key in the row.
-            asignado_a=UserOut(
-                id=row['asignado_a_id'],
-                username=row['user_username'],
-                full_name=row['user_full_name'],
-                is_admin=row['user_is_admin']
-            ) if row.get('asignado_a_id') else None
-        )
-        items.append(item)
-    return items
+BULK_MAX_ITEMS = 10000
+BULK_CHUNK_SIZE = 500
+
+def _chunks(values: list, size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _sn_key(db: AsyncConnection, sn: str) -> str:
+    # Serial numbers that the sn UNIQUE index's collation considers equal
+    # (see the storage dialects) share a key
+    return db.dialect.collation_key(sn)
+
+async def _insert_bulk_chunk(db: AsyncConnection, chunk: list):
+    """Writes and commits one chunk of (index, item); returns its (item, version) pairs and ids by SN."""
+    # One version per row keeps GET /inventory/changes pageable
+    version = await repository.next_change_versions(db, len(chunk)) - len(chunk)
+    rows = []
+    for _, item in chunk:
+        version += 1
+        rows.append((item, version))
+    await repository.insert_items(db, rows)
+    # Auto-increment ids of a multi-row insert aren't guaranteed to be
+    # contiguous, so read them back by SN.
+    new_ids = dict(await repository.ids_by_sn(db, [item.sn for _, item in chunk]))
+    await repository.apply_stats_delta(db, added=[item for _, item in chunk])
+    await db.commit()
+    return rows, new_ids
 
-def get_inventory_item_by_id(item_id: int, db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
+async def _registered_sn_keys(db: AsyncConnection, chunk: list) -> set:
+    """Keys of the SNs in a chunk of (index, item) that are already stored."""
     try:
-        # Primero, obtener los datos básicos del ítem
-        query = """
-            SELECT * FROM inventory_items WHERE id = %s
-        """
-        cursor.execute(query, (item_id,))
-        item_row = cursor.fetchone()
-        
-        if not item_row:
-            return None
-            
-        # Obtener la información del código de ítem
-        cursor.execute("""
-            SELECT id, codigo, tipo, descripcion 
-            FROM item_codes 
-            WHERE id = %s
-        """, (item_row['item_code_id'],))
-        item_code_row = cursor.fetchone()
-        
-        if not item_code_row:
-            raise HTTPException(
-                status_code=404,
-                detail=f"No se encontró el código de ítem con ID {item_row['item_code_id']}"
-            )
-            
-        # Construir el objeto ItemCode
-        item_code = ItemCode(
-            id=item_code_row['id'],
-            codigo=item_code_row['codigo'],
-            tipo=item_code_row['tipo'],
-            descripcion=item_code_row['descripcion']
-        )
-        
-        # Obtener información del usuario asignado si existe
-        asignado_a = None
-        if item_row.get('asignado_a_id'):
-            cursor.execute("""
-                SELECT id, username, full_name, is_admin 
-                FROM users 
-                WHERE id = %s
-            """, (item_row['asignado_a_id'],))
-            
-            user_row = cursor.fetchone()
-            if user_row:
-                asignado_a = UserOut(
-                    id=user_row['id'],
-                    username=user_row['username'],
-                    full_name=user_row['full_name'],
-                    is_admin=bool(user_row['is_admin'])
-                )
-        
-        # Construir y retornar el objeto InventoryItemOut
-        return InventoryItemOut(
-            id=item_row['id'],
-            fecha_ingreso=item_row['fecha_ingreso'],
-            sn=item_row['sn'],
-            item_code_id=item_row['item_code_id'],
-            tipo_servicio=item_row['tipo_servicio'],
-            estado_actual=item_row['estado_actual'],
-            asignado_a_id=item_row.get('asignado_a_id'),
-            terminal_comercio=item_row.get('terminal_comercio'),
-            item_code=item_code,
-            asignado_a=asignado_a
-        )
-        
-    except Exception as e:
-        print(f"Error en get_inventory_item_by_id: {str(e)}")
+        keys = {_sn_key(db, sn) for sn in await repository.taken_sns(db, [item.sn for _, item in chunk])}
+    except DatabaseError:
+        keys = set()
+    await db.rollback()
+    return keys
+
+@app.post("/inventory/bulk", response_model=InventoryBulkResult)
+async def bulk_create_inventory_items(payload: InventoryBulkCreate, response: Response, current_user: dict = Depends(get_current_user_from_token), db: AsyncConnection = Depends(get_db)):
+    """Registers many items, committing every BULK_CHUNK_SIZE rows, and reports the outcome of each row."""
+    # Chunks are committed as they go, so after an error response some rows
+    # may be stored. Sending the same payload again is safe: those rows are
+    # then reported as duplicates.
+    items = payload.items
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Se permiten como máximo {BULK_MAX_ITEMS} ítems por lote")
+    require_history_room(len(items))
+
+    results = [None] * len(items)
+    try:
+        valid_codes = await repository.existing_ids(db, "item_codes", {item.item_code_id for item in items})
+        valid_users = await repository.existing_ids(db, "users", {item.asignado_a_id for item in items if item.asignado_a_id is not None})
+
+        taken_sns = set()
+        for sns in _chunks([item.sn for item in items], BULK_CHUNK_SIZE):
+            taken_sns.update(_sn_key(db, sn) for sn in await repository.taken_sns(db, sns))
+        # Ends the read-only transaction; each chunk below gets its own
+        await db.rollback()
+    except DatabaseError as err:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error al registrar el lote: {err}")
+
+    def failed(index, item, error):
+        results[index] = BulkItemResult(index=index, sn=item.sn, ok=False, error=error)
+
+    def duplicate(item):
+        return f"Ya existe un ítem con el número de serie: {item.sn}"
+
+    to_insert = []
+    for index, item in enumerate(items):
+        error = None
+        if _sn_key(db, item.sn) in taken_sns:
+            error = duplicate(item)
+        elif item.item_code_id not in valid_codes:
+            error = f"El código de ítem {item.item_code_id} no existe"
+        elif item.asignado_a_id is not None and item.asignado_a_id not in valid_users:
+            error = f"El usuario {item.asignado_a_id} no existe"
+        if error:
+            failed(index, item, error)
+        else:
+            taken_sns.add(_sn_key(db, item.sn))
+            to_insert.append((index, item))
+
+    created = 0
+    first_version = last_version = None
+    assignees = []
+    pending = collections.deque(_chunks(to_insert, BULK_CHUNK_SIZE))
+    while pending:
+        chunk = pending.popleft()
+        try:
+            rows, new_ids = await _insert_bulk_chunk(db, chunk)
+        except DatabaseError as err:
+            await db.rollback()
+            if not isinstance(err, IntegrityError):
+                for index, item in chunk:
+                    failed(index, item, f"Error al registrar el lote: {err}")
+            elif len(chunk) == 1:
+                index, item = chunk[0]
+                failed(index, item, duplicate(item) if err.kind == 'duplicate' else f"Error al registrar el lote: {err}")
+            else:
+                # Another request registered some of these SNs after our
+                # check: report those rows and retry the rest. If none is
+                # found, the database's own rule (the same one a single POST
+                # /inventory hits) decides, one row at a time.
+                conflicts = await _registered_sn_keys(db, chunk)
+                remaining = []
+                for index, item in chunk:
+                    if _sn_key(db, item.sn) in conflicts:
+                        failed(index, item, duplicate(item))
+                    else:
+                        remaining.append((index, item))
+                if len(remaining) < len(chunk):
+                    if remaining:
+                        pending.appendleft(remaining)
+                else:
+                    pending.extendleft([row] for row in reversed(chunk))
+            continue
+
+        created += len(chunk)
+        first_version = first_version or rows[0][1]
+        last_version = rows[-1][1]
+        for index, item in chunk:
+            item_id = new_ids.get(item.sn)
+            results[index] = BulkItemResult(index=index, sn=item.sn, ok=True, id=item_id)
+            status_history.record(item_id, None, item.estado_actual, item.terminal_comercio, current_user['id'])
+            assignees.append(item.asignado_a_id)
+
+    if last_version is not None:
+        remember_write(response, current_user, last_version)
+        # One event for the whole batch; subscribers fetch the rows from
+        # /inventory/changes
+        publish_bulk_event(first_version, last_version, assignees)
+    return InventoryBulkResult(created=created, failed=len(items) - created, results=results)
+
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(fecha_ingreso: datetime, item_id: int) -> str:
+    raw = f"{fecha_ingreso.isoformat()}|{item_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        fecha, item_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(fecha), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+def _row_to_item(row: dict) -> InventoryItemOut:
+    return InventoryItemOut(
+        id=row['id'],
+        fecha_ingreso=row['fecha_ingreso'],
+        sn=row['sn'],
+        tipo_servicio=row['tipo_servicio'],
+        estado_actual=row['estado_actual'],
+        terminal_comercio=row['terminal_comercio'],
+        item_code_id=row['item_code_id'],
+        asignado_a_id=row['asignado_a_id'],
+        item_code=ItemCode(
+            id=row['item_code_id'],
+            codigo=row['item_code_codigo'],
+            tipo=row['item_code_tipo'],
+            descripcion=row['item_code_descripcion']
+        ),
+        asignado_a=UserOut(
+            id=row['asignado_a_id'],
+            username=row['user_username'],
+            full_name=row['user_full_name'],
+            is_admin=bool(row['user_is_admin'])
+        ) if row.get('asignado_a_id') else None
+    )
+
+def _row_to_dict(row: dict) -> dict:
+    """Same JSON shape as InventoryItemOut, built without Pydantic."""
+    return {
+        "sn": row['sn'],
+        "item_code_id": row['item_code_id'],
+        "tipo_servicio": row['tipo_servicio'],
+        "estado_actual": row['estado_actual'],
+        "asignado_a_id": row['asignado_a_id'],
+        "terminal_comercio": row['terminal_comercio'],
+        "id": row['id'],
+        "fecha_ingreso": row['fecha_ingreso'].isoformat(),
+        "item_code": {
+            "id": row['item_code_id'],
+            "codigo": row['item_code_codigo'],
+            "tipo": row['item_code_tipo'],
+            "descripcion": row['item_code_descripcion'],
+        },
+        "asignado_a": {
+            "id": row['asignado_a_id'],
+            "username": row['user_username'],
+            "full_name": row['user_full_name'],
+            "is_admin": bool(row['user_is_admin']),
+        } if row.get('asignado_a_id') else None,
+    }
+
+class InventoryFilters:
+    """Optional query parameters shared by the inventory list endpoints."""
+
+    def __init__(
+        self,
+        estado_actual: Optional[str] = None,
+        item_code_id: Optional[int] = None,
+        asignado_a_id: Optional[int] = None,
+        tipo_servicio: Optional[str] = None,
+        terminal_comercio: Optional[str] = None,
+        fecha_desde: Optional[datetime] = None,
+        fecha_hasta: Optional[datetime] = None,
+    ):
+        self.estado_actual = estado_actual
+        self.item_code_id = item_code_id
+        self.asignado_a_id = asignado_a_id
+        self.tipo_servicio = tipo_servicio
+        self.terminal_comercio = terminal_comercio
+        self.fecha_desde = fecha_desde
+        self.fecha_hasta = fecha_hasta
+
+    def to_sql(self):
+        """Returns the WHERE conditions and parameters for the filters that were given."""
+        conditions = []
+        params = []
+        for column in ('estado_actual', 'item_code_id', 'asignado_a_id', 'tipo_servicio', 'terminal_comercio'):
+            value = getattr(self, column)
+            if value is not None:
+                conditions.append(f"i.{column} = %s")
+                params.append(value)
+        if self.fecha_desde is not None:
+            conditions.append("i.fecha_ingreso >= %s")
+            params.append(self.fecha_desde)
+        if self.fecha_hasta is not None:
+            conditions.append("i.fecha_ingreso < %s")
+            params.append(self.fecha_hasta)
+        return conditions, params
+
+
+async def _list_inventory(db, conditions: list, params: list, limit: Optional[int], cursor: Optional[str]):
+    """Lists items newest first, one keyset page at a time; the next cursor goes in ``X-Next-Cursor``."""
+    conditions = list(conditions)
+    params = list(params)
+    if cursor:
+        fecha, last_id = decode_cursor(cursor)
+        conditions.append("(i.fecha_ingreso < %s OR (i.fecha_ingreso = %s AND i.id < %s))")
+        params.extend([fecha, fecha, last_id])
+
+    # One extra row tells us whether there is a next page
+    results = await repository.list_items(db, conditions, params, limit + 1 if limit else None)
+
+    headers = {}
+    observe_inventory_rows(min(len(results), limit or len(results)))
+    if limit and len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last['fecha_ingreso'], last['id'])
+
+    return JSONBytesResponse(dumps([_row_to_dict(row) for row in results]), headers=headers)
+
+@app.get("/inventory", response_model=List[InventoryItemOut])
+async def get_all_inventory_items(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    filters: InventoryFilters = Depends(),
+    current_user: dict = Depends(get_current_user_from_token),
+    db: AsyncConnection = Depends(get_read_db),
+):
+    conditions, params = filters.to_sql()
+    return await _list_inventory(db, conditions, params, limit, cursor)
+
+change_relay = ChangeRelay(event_broker, _row_to_dict, EVENTS_CONFIG['poll_interval']) if EVENTS_CONFIG['relay'] else None
+
+def publish_item_event(event_type: str, version: int, item_id: int, asignado_a_id: Optional[int],
+                       previous_asignado_a_id: Optional[int] = None, row: Optional[dict] = None):
+    """Pushes a committed change to GET /inventory/events subscribers."""
+    if change_relay is not None:
+        # The relay publishes it from the database, in version order
+        return
+    event_broker.publish({
+        "type": event_type,
+        "version": version,
+        "item_id": item_id,
+        "asignado_a_id": asignado_a_id,
+        "previous_asignado_a_id": previous_asignado_a_id,
+        "item": _row_to_dict(row) if row else None,
+    })
+
+def publish_bulk_event(from_version: int, version: int, asignado_a_ids: list):
+    """Like publish_item_event, for every change in [from_version, version] at once."""
+    if change_relay is None:
+        event_broker.publish(bulk_event(from_version, version, asignado_a_ids))
+
+def require_history_room(count: int = 1):
+    """Refuses a write whose estado_actual transitions couldn't be recorded (history buffer full)."""
+    if not status_history.has_room(count):
         raise HTTPException(
-            status_code=500,
-            detail=f"Error al recuperar el ítem: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Historial de estados no disponible, intente nuevamente",
         )
-    finally:
-        cursor.close()
 
-@app.put("/inventory/{item_id}", response_model=InventoryItemOut)
-def update_inventory_item(item_id: int, item: InventoryItemUpdate, current_user: dict = Depends(get_current_user_from_token), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
+def record_status_change(previous: dict, row: dict, user: dict):
+    """Queues an inventory_status_history row if estado_actual changed (call after commit)."""
+    if previous['estado_actual'] != row['estado_actual']:
+        status_history.record(row['id'], previous['estado_actual'], row['estado_actual'], row['terminal_comercio'], user['id'])
+
+EXPORT_CHUNK_SIZE = 1000
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that closes its body generator, then awaits ``on_close()``, once sent.
+
+    Both happen even when the client left before the body was first iterated.
+    """
+
+    def __init__(self, content, on_close=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            if self.on_close is not None:
+                await self.on_close()
+
+def _ndjson(rows: list) -> bytes:
+    return b"".join(dumps(_row_to_dict(row)) + b"\n" for row in rows)
+
+@app.get("/inventory/export")
+async def export_inventory(filters: InventoryFilters = Depends(), admin: dict = Depends(get_current_admin_user)):
+    """Streams the matching inventory as NDJSON, EXPORT_CHUNK_SIZE rows at a time."""
+    # Own connection: the body is produced after the request dependencies are torn down
+    conditions, params = filters.to_sql()
+    pool = get_pool()
+    db = await acquire_connection(pool)
+    chunks = repository.stream_items(db, conditions, params, EXPORT_CHUNK_SIZE)
+    # Produce the first chunk up front so a failing query is still reported
+    # with a proper status code
     try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = []
+    except BaseException as err:
+        await chunks.aclose()
+        await pool.release(db)
+        if isinstance(err, DatabaseError):
+            print(f"Could not start inventory export: {err}")
+            raise HTTPException(status_code=500, detail=f"Error al exportar el inventario: {err}")
+        raise
+
+    async def body():
+        yield _ndjson(first_chunk)
+        async for rows in chunks:
+            yield _ndjson(rows)
+
+    async def release():
+        # A client that goes away mid-stream leaves unread rows behind;
+        # release() then discards the connection.
+        await chunks.aclose()
+        await pool.release(db)
+
+    return ClosingStreamingResponse(body(), release, media_type="application/x-ndjson")
+
+@app.put("/inventory/{item_id}", response_model=InventoryItemOut)
+async def update_inventory_item(item_id: int, item: InventoryItemUpdate, response: Response, current_user: dict = Depends(get_current_user_from_token), db: AsyncConnection = Depends(get_db)):
+    is_admin = bool(current_user.get('is_admin'))
+
+    def check_access(item):
         # Verificar si el ítem existe y el usuario tiene permiso para editarlo
-        cursor.execute(
-            "SELECT * FROM inventory_items WHERE id = %s",
-            (item_id,)
-        )
-        existing_item = cursor.fetchone()
-        
-        if not existing_item:
+        if not item:
             raise HTTPException(status_code=404, detail="Item no encontrado")
-            
         # Solo el admin o el usuario asignado pueden editar
-        if not current_user.get('is_admin') and existing_item.get('asignado_a_id') != current_user.get('id'):
+        if not is_admin and item.get('asignado_a_id') != current_user.get('id'):
             raise HTTPException(status_code=403, detail="No tiene permiso para editar este ítem")
-        
-        # Si el usuario no es admin, solo puede modificar ciertos campos
-        update_fields = []
-        update_values = []
-        
+
+    require_history_room()
+    try:
+        existing_item = await repository.lock_item(db, item_id)
+        check_access(existing_item)
+        version = await repository.next_change_versions(db)
+
         # Campos que todos pueden modificar
-        update_fields.append("estado_actual = %s")
-        update_values.append(item.estado_actual)
-        
+        update_fields = {"estado_actual": item.estado_actual}
+
         # Solo admin puede modificar estos campos
-        if current_user.get('is_admin'):
-            update_fields.extend([
-                "sn = %s", "item_code_id = %s", "tipo_servicio = %s",
-                "asignado_a_id = %s", "terminal_comercio = %s"
-            ])
-            update_values.extend([
-                item.sn, item.item_code_id, item.tipo_servicio,
-                item.asignado_a_id, item.terminal_comercio
-            ])
-        
-        # Construir y ejecutar la consulta dinámica
-        update_query = """
-            UPDATE inventory_items 
-            SET """ + ", ".join(update_fields) + """
-            WHERE id = %s
-        """
-        update_values.append(item_id)
-        
-        cursor.execute(update_query, update_values)
-        db.commit()
-    except mysql.connector.Error as err:
+        if is_admin:
+            update_fields.update(
+                sn=item.sn, item_code_id=item.item_code_id, tipo_servicio=item.tipo_servicio,
+                asignado_a_id=item.asignado_a_id, terminal_comercio=item.terminal_comercio,
+            )
+            previous_owner = existing_item.get('asignado_a_id')
+            if previous_owner is not None and previous_owner != item.asignado_a_id:
+                # The item leaves the previous technician's view
+                await repository.add_tombstone(db, version, item_id, previous_owner, deleted=False)
+
+        await repository.update_item(db, item_id, version, update_fields)
+        updated_row = await repository.fetch_item(db, item_id)
+        await repository.apply_stats_delta(db, removed=[existing_item], added=[updated_row])
+        await db.commit()
+    except DatabaseError as err:
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Error updating item: {err}")
-    finally:
-        cursor.close()
-    return get_inventory_item_by_id(item_id, db)
+    remember_write(response, current_user, version)
+    publish_item_event("updated", version, item_id, updated_row['asignado_a_id'],
+                       previous_asignado_a_id=existing_item['asignado_a_id'], row=updated_row)
+    record_status_change(existing_item, updated_row, current_user)
+    return _row_to_item(updated_row)
+
+@app.get("/inventory/{item_id}/history")
+async def get_item_history(item_id: int, current_user: dict = Depends(get_current_user_from_token), db: AsyncConnection = Depends(get_db)):
+    """estado_actual transitions of an item, oldest first."""
+    if not current_user.get('is_admin'):
+        item = await repository.fetch_item(db, item_id)
+        if item is None:
+            raise HTTPException(status_code=404, detail="Item no encontrado")
+        if item['asignado_a_id'] != current_user['id']:
+            raise HTTPException(status_code=403, detail="No tiene permiso para ver este ítem")
+
+    async with status_history.no_commits():
+        # Fresh snapshot: batches committed since this request's first read
+        # have already left the buffer
+        await db.rollback()
+        entries = await repository.get_status_history(db, item_id)
+        pending = status_history.pending_for(item_id)
+    for entry in pending:
+        entries.append(dict(entry, id=None, changed_by_username=None))
+    if not entries and current_user.get('is_admin') and not await repository.item_exists(db, item_id):
+        raise HTTPException(status_code=404, detail="Item no encontrado")
+    for entry in entries:
+        entry['changed_at'] = entry['changed_at'].isoformat()
+    return JSONBytesResponse(entries)
 
 @app.delete("/inventory/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_inventory_item(item_id: int, current_user: dict = Depends(get_current_user_from_token), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
+async def delete_inventory_item(item_id: int, response: Response, current_user: dict = Depends(get_current_user_from_token), db: AsyncConnection = Depends(get_db)):
     try:
-        # Verificar si el ítem existe
-        cursor.execute("SELECT * FROM inventory_items WHERE id = %s", (item_id,))
-        item = cursor.fetchone()
-        
-        if not item:
-            raise HTTPException(status_code=404, detail="Item no encontrado")
-            
         # Solo el admin puede eliminar ítems
         if not current_user.get('is_admin'):
+            if not await repository.item_exists(db, item_id):
+                raise HTTPException(status_code=404, detail="Item no encontrado")
             raise HTTPException(status_code=403, detail="Solo los administradores pueden eliminar ítems")
-            
-        cursor.execute("DELETE FROM inventory_items WHERE id = %s", (item_id,))
-        db.commit()
-    except mysql.connector.Error as err:
+
+        item = await repository.lock_item(db, item_id)
+        if not item:
+            raise HTTPException(status_code=404, detail="Item no encontrado")
+
+        version = await repository.next_change_versions(db)
+        await repository.add_tombstone(db, version, item_id, item['asignado_a_id'], deleted=True)
+        await repository.delete_item(db, item_id)
+        await repository.apply_stats_delta(db, removed=[item])
+        await db.commit()
+    except DatabaseError as err:
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Error deleting item: {err}")
-    finally:
-        cursor.close()
+    remember_write(response, current_user, version)
+    publish_item_event("deleted", version, item_id, None, previous_asignado_a_id=item['asignado_a_id'])
     return
 
 @app.get("/inventory/my-items", response_model=List[InventoryItemOut])
-def get_my_inventory_items(current_user: dict = Depends(get_current_user_from_token), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
-    user_id = current_user['id']
-    query = """
-        SELECT 
-            i.id, i.fecha_ingreso, i.sn, i.tipo_servicio, i.estado_actual, i.terminal_comercio,
-            ic.id as item_code_id, ic.codigo as item_code_codigo, ic.tipo as item_code_tipo, ic.descripcion as item_code_descripcion,
-            u.id as user_id, u.username as user_username, u.full_name as user_full_name, u.is_admin as user_is_admin
-        FROM inventory_items i
-        JOIN item_codes ic ON i.item_code_id = ic.id
-        LEFT JOIN users u ON i.asignado_a_id = u.id
-        WHERE i.asignado_a_id = %s
-        ORDER BY i.fecha_ingreso DESC
-    """
-    cursor.execute(query, (user_id,))
-    results = cursor.fetchall()
-    cursor.close()
-
-    items = []
-    for row in results:
-        item = InventoryItemOut(
-            id=row['id'],
-            fecha_ingreso=row['fecha_ingreso'],
-            sn=row['sn'],
-            tipo_servicio=row['tipo_servicio'],
-            estado_actual=row['estado_actual'],
-            terminal_comercio=row['terminal_comercio'],
-            item_code_id=row['item_code_id'],
-            asignado_a_id=row['user_id'],
-            item_code=ItemCode(
-                id=row['item_code_id'],
-                codigo=row['item_code_codigo'],
-                tipo=row['item_code_tipo'],
-                descripcion=row['item_code_descripcion']
-            ),
-            asignado_a=UserOut(
-                id=row['user_id'],
-                username=row['user_username'],
-                full_name=row['user_full_name'],
-                is_admin=row['user_is_admin']
-            ) if row['user_id'] else None
-        )
-        items.append(item)
-    return items
+async def get_my_inventory_items(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    filters: InventoryFilters = Depends(),
+    current_user: dict = Depends(get_current_user_from_token),
+    db: AsyncConnection = Depends(get_read_db),
+):
+    # A technician only ever sees their own items, whatever asignado_a_id says
+    filters.asignado_a_id = current_user['id']
+    conditions, params = filters.to_sql()
+    return await _list_inventory(db, conditions, params, limit, cursor)
+
+@app.get("/inventory/stats")
+async def get_inventory_stats(admin: dict = Depends(get_current_admin_user)):
+    """Item counts by estado_actual, item code and technician, from the inventory_stats counters."""
+    # Resolved first: a cache miss checks out a connection of its own, and
+    # holding ours meanwhile would need two per request
+    codes = {str(code['id']): code for code in (await _reference_entry('item_codes'))[0]}
+    users = {str(user['id']): user for user in (await _reference_entry('technicians'))[0]}
+    async with pooled_connection() as db:
+        counters = await repository.get_stats_counters(db)
+
+    por_estado, por_codigo, por_tecnico = {}, [], []
+    for counter in counters:
+        bucket, total = counter['bucket'], counter['total']
+        if counter['dimension'] == 'estado':
+            por_estado[bucket] = total
+        elif counter['dimension'] == 'item_code':
+            code = codes.get(bucket, {})
+            por_codigo.append({"item_code_id": int(bucket), "codigo": code.get('codigo'), "total": total})
+        elif counter['dimension'] == 'tecnico':
+            user = users.get(bucket, {})
+            por_tecnico.append({"asignado_a_id": int(bucket) if bucket else None, "full_name": user.get('full_name'), "total": total})
+
+    return {
+        "total": sum(por_estado.values()),
+        "por_estado": por_estado,
+        "por_codigo": sorted(por_codigo, key=lambda entry: entry['codigo'] or ''),
+        "por_tecnico": sorted(por_tecnico, key=lambda entry: entry['full_name'] or ''),
+    }
+
+@app.post("/inventory/stats/rebuild")
+async def rebuild_stats(admin: dict = Depends(get_current_admin_user), db: AsyncConnection = Depends(get_db)):
+    """Recomputes the counters behind /inventory/stats from scratch (repair tool)."""
+    try:
+        # Holding the change counter lock keeps writers out while we rebuild
+        await repository.next_change_versions(db, 0)
+        await repository.rebuild_stats(db)
+        await db.commit()
+    except DatabaseError as err:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error al reconstruir las estadísticas: {err}")
+    return {"message": "Estadísticas reconstruidas"}
+
+EVENTS_KEEPALIVE_SECONDS = 15
+
+@app.get("/inventory/events")
+async def inventory_events(request: Request, current_user: dict = Depends(get_current_user_from_token)):
+    """Server-Sent Events stream of inventory changes; each event's ``id`` is its change version."""
+    async def stream():
+        # Subscribed here, not in the handler: a stream that never starts
+        # must not leave a subscription behind
+        subscription = event_broker.subscribe(current_user)
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line: keeps proxies and mobile NATs from closing the connection
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # Fell too far behind; the client reconnects and resyncs
+                    break
+                yield f"id: {event['version']}\nevent: {event['type']}\ndata: {dumps(event).decode('utf-8')}\n\n"
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return ClosingStreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/inventory/changes")
+async def get_inventory_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user_from_token),
+    db: AsyncConnection = Depends(get_db),
+):
+    """Inventory changes after version ``since``: apply ``deleted``, upsert ``items``, repeat while ``has_more``."""
+    user_id = None if current_user.get('is_admin') else current_user['id']
+    current_version, rows, tombstones = await repository.get_changes(db, since, limit, user_id)
+
+    # When a list was cut short, stop both lists at its last version so the
+    # next call resumes from a consistent point.
+    version = current_version
+    if len(rows) > limit:
+        version = min(version, rows[limit - 1]['row_version'])
+    if len(tombstones) > limit:
+        version = min(version, tombstones[limit - 1]['row_version'])
+
+    return JSONBytesResponse({
+        "version": version,
+        "has_more": version < current_version,
+        "deleted": [t['item_id'] for t in tombstones if t['row_version'] <= version],
+        "items": [_row_to_dict(row) for row in rows if row['row_version'] <= version],
+    })
 
 @app.patch("/inventory/{item_id}/status", response_model=InventoryItemOut)
-def update_item_status(item_id: int, status_update: ItemStatusUpdate, current_user: dict = Depends(get_current_user_from_token), db: mysql.connector.connection.MySQLConnection = Depends(get_db)):
-    cursor = db.cursor(dictionary=True)
+async def update_item_status(item_id: int, status_update: ItemStatusUpdate, response: Response, current_user: dict = Depends(get_current_user_from_token), db: AsyncConnection = Depends(get_db)):
     user_id = current_user['id']
 
-    # Primero, verificar que el item pertenece al usuario
-    cursor.execute("SELECT id FROM inventory_items WHERE id = %s AND asignado_a_id = %s", (item_id, user_id))
-    if cursor.fetchone() is None:
-        cursor.close()
-        raise HTTPException(status_code=403, detail="Not authorized to update this item")
+    def check_access(item):
+        if item is None or item['asignado_a_id'] != user_id:
+            raise HTTPException(status_code=403, detail="Not authorized to update this item")
 
-    # Si pertenece, actualizar el estado
+    require_history_room()
     try:
-        cursor.execute(
-            "UPDATE inventory_items SET estado_actual = %s, terminal_comercio = %s WHERE id = %s",
-            (status_update.estado_actual, status_update.terminal_comercio, item_id)
-        )
-        db.commit()
-    except mysql.connector.Error as err:
+        # Primero, verificar que el item pertenece al usuario
+        existing_item = await repository.lock_item(db, item_id)
+        check_access(existing_item)
+        version = await repository.next_change_versions(db)
+
+        # Si pertenece, actualizar el estado
+        await repository.update_item(db, item_id, version, {
+            "estado_actual": status_update.estado_actual,
+            "terminal_comercio": status_update.terminal_comercio,
+        })
+        await repository.apply_stats_delta(db, removed=[existing_item], added=[dict(existing_item, estado_actual=status_update.estado_actual)])
+        updated_row = await repository.fetch_item(db, item_id)
+        await db.commit()
+    except DatabaseError as err:
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Error updating status: {err}")
-    finally:
-        cursor.close()
     
-    return get_inventory_item_by_id(item_id, db)
+    remember_write(response, current_user, version)
+    publish_item_event("status", version, item_id, user_id, row=updated_row)
+    record_status_change(existing_item, updated_row, current_user)
+    return _row_to_item(updated_row)
@@ -0,0 +1,83 @@
+"""Benchmark for the inventory list serialization paths.
+
+Compares the old path (one InventoryItemOut per row, then FastAPI's
+jsonable_encoder + json.dumps as done for response_model) against the lean
+path used by the list endpoints now (_row_to_dict + serialization.dumps).
+No database is needed: rows are synthetic but shaped like INVENTORY_SELECT.
+
+    python bench_serialization.py --rows 50000 --repeat 5
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from api import _row_to_dict, _row_to_item
+from serialization import dumps, orjson
+
+
+def make_rows(count):
+    base = datetime(2024, 1, 1)
+    rows = []
+    for n in range(count):
+        assigned = n % 3 != 0
+        rows.append({
+            'id': n + 1,
+            'fecha_ingreso': base + timedelta(minutes=n),
+            'sn': f"SN{n:09d}",
+            'tipo_servicio': 'implementacion',
+            'estado_actual': 'Asignado a Tecnico' if assigned else 'En Bodega',
+            'terminal_comercio': f"T{n % 5000:05d}" if assigned else None,
+            'item_code_id': n % 3 + 1,
+            'asignado_a_id': n % 40 + 2 if assigned else None,
+            'item_code_codigo': 'POS',
+            'item_code_tipo': 'Punto de Venta',
+            'item_code_descripcion': 'Terminal para transacciones comerciales',
+            'user_username': f"tecnico{n % 40}" if assigned else None,
+            'user_full_name': f"Tecnico {n % 40}" if assigned else None,
+            'user_is_admin': 0 if assigned else None,
+        })
+    return rows
+
+
+def pydantic_path(rows):
+    items = [_row_to_item(row) for row in rows]
+    return json.dumps(jsonable_encoder(items)).encode('utf-8')
+
+
+def lean_path(rows):
+    return dumps([_row_to_dict(row) for row in rows])
+
+
+def measure(func, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    # Both paths must produce the same document
+    assert json.loads(pydantic_path(rows[:100])) == json.loads(lean_path(rows[:100]))
+
+    print(f"rows={args.rows} repeat={args.repeat} encoder={'orjson' if orjson else 'json'}")
+    results = {}
+    for name, func in (('pydantic', pydantic_path), ('lean', lean_path)):
+        seconds = measure(func, rows, args.repeat)
+        results[name] = args.rows / seconds
+        print(f"{name:>9}: {seconds * 1000:9.1f} ms  {results[name]:12,.0f} rows/s")
+    print(f"  speedup: {results['lean'] / results['pydantic']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
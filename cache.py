@@ -0,0 +1,78 @@
+"""Small process-local caches used by the API."""
+import collections
+import threading
+import time
+
+from periodic import PeriodicTask
+
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire ``ttl`` seconds after being set.
+
+    When more than ``maxsize`` keys are stored the oldest one is evicted.
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires_at, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class VersionWatcher:
+    """Polls a {key: version} mapping and reports the keys whose version went up.
+
+    Lets every worker process drop a cached entry that another worker
+    invalidated: writers record a version per key in the database and
+    ``fetch()`` reads them back. ``on_change(key, version)`` is called for
+    each increase, and for every key with a version on the first poll. An
+    ``interval`` of 0 disables polling.
+    """
+
+    def __init__(self, fetch, on_change, interval=2.0):
+        self.fetch = fetch
+        self.on_change = on_change
+        self.interval = interval
+        self.versions = {}
+        self._poller = PeriodicTask(self.poll, interval, "check cached data versions")
+
+    def start(self):
+        if self.interval > 0:
+            self._poller.start()
+
+    async def stop(self):
+        await self._poller.stop()
+
+    async def poll(self):
+        for key, version in (await self.fetch()).items():
+            if version > self.versions.get(key, 0):
+                self.versions[key] = version
+                self.on_change(key, version)
@@ -1,3 +1,6 @@
+import os
+import secrets
+
 # Database configuration
 DB_CONFIG = {
     'host': 'localhost',
@@ -7,3 +10,125 @@ DB_CONFIG = {
     'raise_on_warnings': True,
     'auth_plugin': 'mysql_native_password'
 }
+
+# Storage backend (see storage.py): 'mysql' uses DB_CONFIG; 'sqlite' keeps
+# everything in one local file, for benchmarks and offline development
+STORAGE_CONFIG = {
+    'backend': os.getenv('DB_BACKEND', 'mysql').lower(),
+    'sqlite_path': os.getenv('SQLITE_PATH', 'flet_inv.db'),
+    # Seconds a statement waits for another connection's write lock
+    'sqlite_busy_timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', '5')),
+}
+
+# Read replicas for the list endpoints (see replicas.py). Writes always go
+# to the primary above.
+REPLICA_CONFIG = {
+    # Comma-separated host[:port] entries (MySQL, same credentials as
+    # DB_CONFIG) or database file paths (SQLite); empty disables routing
+    'replicas': [entry.strip() for entry in os.getenv('DB_REPLICAS', '').split(',') if entry.strip()],
+    # After a write, the user reads from the primary until a replica has
+    # applied it, for at most this long (clients can extend it by sending
+    # back the X-Write-Position header)
+    'write_position_ttl': float(os.getenv('READ_YOUR_WRITES_SECONDS', '60')),
+    # A replica that failed a checkout is skipped for this long
+    'retry_seconds': float(os.getenv('DB_REPLICA_RETRY_SECONDS', '5')),
+}
+
+# Connection pool used by the API (see database.AsyncConnectionPool)
+POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+    # Seconds a request waits for a free connection before getting a 503
+    'acquire_timeout': float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '5')),
+    # Connections older than this are closed and replaced on checkout
+    'recycle_seconds': float(os.getenv('DB_POOL_RECYCLE_SECONDS', '1800')),
+    # Connections idle for longer than this are pinged before being handed out
+    'ping_after_seconds': float(os.getenv('DB_POOL_PING_AFTER_SECONDS', '30')),
+}
+
+# Access tokens issued by /auth (see security.py)
+_secret_key = os.getenv('SECRET_KEY')
+if not _secret_key:
+    print("WARNING: SECRET_KEY is not set; using a random key. Tokens won't survive "
+          "restarts or be accepted by other workers.")
+    _secret_key = secrets.token_urlsafe(32)
+
+AUTH_CONFIG = {
+    'secret_key': _secret_key,
+    'algorithm': 'HS256',
+    'access_token_expire_minutes': int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', '720')),
+    # How long a user's "still exists / still admin" lookup is trusted
+    'revocation_check_ttl': float(os.getenv('TOKEN_REVOCATION_CHECK_TTL', '60')),
+}
+
+# Process-local caches (see cache.py)
+CACHE_CONFIG = {
+    # /item-codes and /users/technicians bodies; also dropped on writes
+    'reference_ttl': float(os.getenv('REFERENCE_CACHE_TTL', '300')),
+    # How often a worker checks reference_versions for writes made by the
+    # others; 0 (a single process) only drops entries on its own writes.
+    # gunicorn.conf.py turns it on when it runs more than one worker
+    'reference_poll_interval': float(os.getenv('REFERENCE_CACHE_POLL_SECONDS', '0')),
+}
+
+# Background schema initialization and readiness checks (see health.py)
+STARTUP_CONFIG = {
+    # Retry delays when the database is unreachable at boot (exponential backoff)
+    'retry_initial_seconds': float(os.getenv('STARTUP_RETRY_INITIAL_SECONDS', '1')),
+    'retry_max_seconds': float(os.getenv('STARTUP_RETRY_MAX_SECONDS', '30')),
+    # /readyz reuses a database ping for this long
+    'ping_cache_seconds': float(os.getenv('READINESS_PING_CACHE_SECONDS', '2')),
+}
+
+# Password hashing (see passwords.py)
+PASSWORD_CONFIG = {
+    # bcrypt cost factor for new hashes; stored hashes with another cost are
+    # rehashed on the user's next successful login
+    'bcrypt_rounds': int(os.getenv('BCRYPT_ROUNDS', '12')),
+    # Size of the hashing process pool; 0 means one process per CPU
+    'workers': int(os.getenv('PASSWORD_HASH_WORKERS', '0')),
+}
+
+# Buffered inventory_status_history writes (see history.py)
+HISTORY_CONFIG = {
+    'flush_interval': float(os.getenv('STATUS_HISTORY_FLUSH_SECONDS', '1')),
+    # Rows per INSERT; a full batch is flushed without waiting for the interval
+    'batch_size': int(os.getenv('STATUS_HISTORY_BATCH_SIZE', '500')),
+    # Oldest transitions are dropped beyond this while the database is down
+    'max_pending': int(os.getenv('STATUS_HISTORY_MAX_PENDING', '50000')),
+}
+
+# Push channel at GET /inventory/events (see events.py)
+EVENTS_CONFIG = {
+    # Publish changes from the database instead of in-process, so every
+    # worker's subscribers get every worker's writes; gunicorn.conf.py turns
+    # it on when it runs more than one worker
+    'relay': os.getenv('EVENTS_RELAY', '').lower() in ('1', 'true', 'yes'),
+    # How often the relay checks for new changes (the extra event latency)
+    'poll_interval': float(os.getenv('EVENTS_POLL_SECONDS', '0.5')),
+}
+
+# Response compression (see http_compression.py)
+COMPRESSION_CONFIG = {
+    # Smaller bodies are sent as they are: the headers would eat the savings
+    'minimum_size': int(os.getenv('COMPRESSION_MIN_BYTES', '1024')),
+    # 1 (fastest) to 9; 6 gets most of the gain of 9 at a fraction of the CPU
+    'gzip_level': int(os.getenv('COMPRESSION_GZIP_LEVEL', '6')),
+    # 0 to 11; 4 compresses better than gzip 6 at similar speed
+    'brotli_level': int(os.getenv('COMPRESSION_BROTLI_LEVEL', '4')),
+}
+
+# Event-loop blocking detector, for debugging only (see loop_monitor.py)
+LOOP_MONITOR_CONFIG = {
+    'enabled': os.getenv('DEBUG_LOOP_BLOCKING', '').lower() in ('1', 'true', 'yes'),
+    # Report when the loop hasn't run a heartbeat for this long
+    'threshold_ms': float(os.getenv('DEBUG_LOOP_BLOCKING_THRESHOLD_MS', '100')),
+}
+
+# Slow-query log, opt-in (see slow_queries.py)
+SLOW_QUERY_CONFIG = {
+    'enabled': os.getenv('SLOW_QUERY_LOG', '').lower() in ('1', 'true', 'yes'),
+    'threshold_ms': float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200')),
+    # Capture an EXPLAIN plan for each new slow SELECT
+    'explain': os.getenv('SLOW_QUERY_EXPLAIN', '1').lower() in ('1', 'true', 'yes'),
+}
@@ -1,105 +1,364 @@
-import mysql.connector
-from mysql.connector import Error
-from config import DB_CONFIG
-import bcrypt
-
-import mysql.connector
-from mysql.connector import Error
-from config import DB_CONFIG
-import bcrypt
+from config import POOL_CONFIG
+import abc
+import asyncio
+import collections
 import time
-import sys
-
-_connection = None
 
 def get_db_connection():
-    """Gets a new database connection."""
-    try:
-        return mysql.connector.connect(**DB_CONFIG)
-    except Error as e:
-        print(f"\nError connecting to MySQL: {e}")
-        print("\nTroubleshooting tips:")
-        print(f"1. Check if MySQL server is running on {DB_CONFIG['host']}")
-        print(f"2. Verify the username '{DB_CONFIG['user']}' and password in config.py")
-        sys.exit(1)
+    """Gets a new synchronous DB-API connection to the configured storage backend.
+
+    With MySQL it raises mysql.connector.Error on failure.
+    """
+    # storage builds on this module, so it is imported on use
+    import storage
+    return storage.get_storage().connect()
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available before the acquire timeout."""
+
+
+class DatabaseError(Exception):
+    """A failed statement, independent of the driver; ``errno`` is the MySQL error code."""
+
+    def __init__(self, errno, msg):
+        super().__init__(f"{errno}: {msg}" if errno else msg)
+        self.errno = errno
+        self.msg = msg
+
+
+class IntegrityError(DatabaseError):
+    """A constraint violation; ``kind`` is 'duplicate', 'foreign_key' or None."""
+
+    def __init__(self, errno, msg, kind=None):
+        super().__init__(errno, msg)
+        self.kind = kind
+
+
+ExecResult = collections.namedtuple('ExecResult', 'rowcount lastrowid')
+
+# Callables run after every statement as hook(sql, params, seconds);
+# they must be cheap and must not raise.
+_query_hooks = []
+
+def add_query_hook(hook):
+    _query_hooks.append(hook)
+
+
+class AsyncConnection(abc.ABC):
+    """A pooled connection as used by repository.py; see storage.py for the implementations.
+
+    Statements are written with %s placeholders whatever the driver's style,
+    rows come back as dicts and failures raise DatabaseError. ``dialect``
+    describes the backend's SQL (see storage.MySQLDialect). Every statement
+    goes through _execute(), which runs the query hooks (see
+    add_query_hook). Set ``discard`` when the connection may be left
+    mid-result so the pool closes it instead of reusing it. A backend must
+    implement every abstract method, or it can't be instantiated.
+    """
+
+    dialect = None
+
+    def __init__(self):
+        self.discard = False
+
+    async def _execute(self, sql, params, run):
+        """Awaits ``run()`` (the driver call for ``sql``) and reports its timing to the hooks."""
+        started = time.perf_counter()
+        try:
+            return await run()
+        finally:
+            if _query_hooks:
+                elapsed = time.perf_counter() - started
+                for hook in _query_hooks:
+                    hook(sql, params, elapsed)
+
+    @abc.abstractmethod
+    async def execute(self, sql, params=None):
+        """Runs a statement and returns its ExecResult(rowcount, lastrowid)."""
+
+    @abc.abstractmethod
+    async def executemany(self, sql, seq_params):
+        """Runs a statement once per parameter set, batched where the driver can."""
+
+    @abc.abstractmethod
+    async def fetchone(self, sql, params=None):
+        ...
+
+    @abc.abstractmethod
+    async def fetchall(self, sql, params=None):
+        ...
+
+    @abc.abstractmethod
+    async def fetchcolumn(self, sql, params=None):
+        """Returns the first column of every row."""
+
+    @abc.abstractmethod
+    def stream(self, sql, params=None, size=1000):
+        """Async iterator over lists of up to ``size`` rows, read as the caller consumes them."""
+
+    @abc.abstractmethod
+    async def begin_write(self):
+        """Opens a write transaction if none is open yet.
+
+        Backends without row locks take their write lock here (see
+        repository.lock_item); with row locks it does nothing.
+        """
+
+    @abc.abstractmethod
+    async def commit(self):
+        ...
+
+    @abc.abstractmethod
+    async def rollback(self):
+        ...
+
+    @abc.abstractmethod
+    async def ping(self):
+        """Raises DatabaseError if the connection is no longer usable."""
+
+    @abc.abstractmethod
+    def close(self):
+        ...
+
+    @property
+    @abc.abstractmethod
+    def closed(self):
+        ...
+
+
+class AsyncConnectionPool:
+    """Bounded pool of AsyncConnections shared by the API request handlers.
+
+    ``connect`` is a coroutine function opening a new connection (see
+    storage.py). Connections are handed out LIFO so the hottest ones get reused, pinged
+    before use when they have been idle for a while, and replaced once they
+    are older than ``recycle_seconds``. Waiting for a connection suspends
+    the request's coroutine, not a thread. Create and use it from the
+    server's event loop only.
+    """
+
+    def __init__(self, connect, min_size=2, max_size=10, acquire_timeout=5.0,
+                 recycle_seconds=1800.0, ping_after_seconds=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size=%s max_size=%s" % (min_size, max_size))
+        self._open = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.recycle_seconds = recycle_seconds
+        self.ping_after_seconds = ping_after_seconds
+
+        self._cond = asyncio.Condition()
+        self._idle = collections.deque()  # (conn, released_at)
+        self._created_at = {}             # id(conn) -> monotonic creation time
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        # Cumulative counters exposed through stats()
+        self._acquired_total = 0
+        self._waits_total = 0
+        self._wait_seconds_total = 0.0
+        self._timeouts_total = 0
+        self._recycled_total = 0
+        self._broken_total = 0
+
+    async def _connect(self):
+        conn = await self._open()
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        conn.close()
+
+    async def fill(self):
+        """Opens connections until the pool holds ``min_size`` of them."""
+        while not self._closed and self._size < self.min_size:
+            self._size += 1
+            try:
+                conn = await self._connect()
+            except DatabaseError:
+                async with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            async with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    async def acquire(self):
+        """Checks a connection out of the pool, waiting up to ``acquire_timeout``."""
+        deadline = time.monotonic() + self.acquire_timeout
+        conn = None
+        released_at = None
+        async with self._cond:
+            if self._closed:
+                raise PoolTimeout("Connection pool is closed")
+            waited_since = None
+            while True:
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts_total += 1
+                    raise PoolTimeout(
+                        "No database connection available after %.1fs" % self.acquire_timeout
+                    )
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    self._waits_total += 1
+                self._waiting += 1
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    self._waiting -= 1
+            if waited_since is not None:
+                self._wait_seconds_total += time.monotonic() - waited_since
+            self._in_use += 1
+            self._acquired_total += 1
+
+        try:
+            if conn is None:
+                return await self._connect()
+            return await self._validate(conn, released_at)
+        except BaseException:
+            async with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    async def _validate(self, conn, released_at):
+        now = time.monotonic()
+        if now - self._created_at.get(id(conn), now) > self.recycle_seconds:
+            self._recycled_total += 1
+            self._discard(conn)
+            return await self._connect()
+        if now - released_at > self.ping_after_seconds:
+            try:
+                await conn.ping()
+            except DatabaseError:
+                self._broken_total += 1
+                self._discard(conn)
+                return await self._connect()
+        return conn
+
+    async def release(self, conn):
+        """Returns a connection to the pool, ending any transaction left open."""
+        healthy = not conn.discard and not conn.closed
+        if healthy:
+            try:
+                # Plain SELECTs also open a transaction; rolling back releases
+                # its snapshot so the next request doesn't read stale data.
+                await conn.rollback()
+            except DatabaseError:
+                healthy = False
+        async with self._cond:
+            self._in_use -= 1
+            if healthy and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+                if not healthy:
+                    self._broken_total += 1
+            self._cond.notify()
+        if not healthy or self._closed:
+            self._discard(conn)
+
+    async def close(self):
+        """Closes idle connections; checked-out ones are closed on release."""
+        async with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": self._size,
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "waiting": self._waiting,
+            "acquired_total": self._acquired_total,
+            "waits_total": self._waits_total,
+            "wait_seconds_total": round(self._wait_seconds_total, 6),
+            "timeouts_total": self._timeouts_total,
+            "recycled_total": self._recycled_total,
+            "broken_total": self._broken_total,
+        }
+
+
+_pool = None
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it on first use (from the event loop)."""
+    global _pool
+    if _pool is None:
+        import storage
+        _pool = AsyncConnectionPool(storage.get_storage().open_connection, **POOL_CONFIG)
+    return _pool
+
+def pool_stats():
+    """stats() of the process-wide pool, or None if it hasn't been created."""
+    return _pool.stats() if _pool is not None else None
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+# Statements that recompute inventory_stats, valid on every storage backend;
+# shared by the migration (sync cursor) and POST /inventory/stats/rebuild.
+REBUILD_STATS_STATEMENTS = (
+    "DELETE FROM inventory_stats",
+    """
+    INSERT INTO inventory_stats (dimension, bucket, total)
+    SELECT 'estado', estado_actual, COUNT(*) FROM inventory_items GROUP BY estado_actual
+    """,
+    """
+    INSERT INTO inventory_stats (dimension, bucket, total)
+    SELECT 'item_code', CAST(item_code_id AS CHAR), COUNT(*) FROM inventory_items GROUP BY item_code_id
+    """,
+    """
+    INSERT INTO inventory_stats (dimension, bucket, total)
+    SELECT 'tecnico', COALESCE(CAST(asignado_a_id AS CHAR), ''), COUNT(*) FROM inventory_items GROUP BY asignado_a_id
+    """,
+)
+
+def rebuild_inventory_stats(cursor):
+    """Recomputes inventory_stats from inventory_items with GROUP BY queries.
+
+    Run it inside a transaction that holds the inventory_sync lock so no
+    write lands between the DELETE and the INSERTs.
+    """
+    for statement in REBUILD_STATS_STATEMENTS:
+        cursor.execute(statement)
 
 def initialize_database():
-    """Creates tables and populates them if they don't exist."""
+    """Brings the schema up to date by applying pending migrations.
+
+    When the schema is already current this is a single version query.
+    """
+    import migrations
     conn = get_db_connection()
-    cursor = conn.cursor()
-    print("Database connected. Initializing tables...")
-
-
-    db_name = DB_CONFIG['database']
-
-    tables = {
-        'users': """
-            CREATE TABLE users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(255) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                full_name VARCHAR(255) NOT NULL,
-                is_admin BOOLEAN DEFAULT FALSE
-            )
-        """,
-        'item_codes': """
-            CREATE TABLE item_codes (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                codigo VARCHAR(50) UNIQUE NOT NULL,
-                tipo VARCHAR(50),
-                descripcion TEXT
-            )
-        """,
-        'inventory_items': """
-            CREATE TABLE inventory_items (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                fecha_ingreso DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                sn VARCHAR(255) NOT NULL UNIQUE,
-                item_code_id INT NOT NULL,
-                tipo_servicio VARCHAR(50) NOT NULL,
-                estado_actual VARCHAR(50) NOT NULL DEFAULT 'En Bodega',
-                asignado_a_id INT NULL,
-                terminal_comercio VARCHAR(255) NULL,
-                FOREIGN KEY (item_code_id) REFERENCES item_codes(id),
-                FOREIGN KEY (asignado_a_id) REFERENCES users(id)
-            )
-        """
-    }
-
-    for table_name, create_stmt in tables.items():
-        cursor.execute("SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s", (db_name, table_name))
-        if cursor.fetchone()[0] == 0:
-            print(f"Creating table '{table_name}'...")
-            cursor.execute(create_stmt)
-        else:
-            print(f"Table '{table_name}' already exists.")
-
-    # Populate users with a default admin if not exists
-    cursor.execute("SELECT * FROM users WHERE username = 'admin'")
-    if cursor.fetchone() is None:
-        hashed_password = bcrypt.hashpw(b'admin', bcrypt.gensalt())
-        cursor.execute(
-            "INSERT INTO users (username, password_hash, full_name, is_admin) VALUES (%s, %s, %s, %s)",
-            ('admin', hashed_password.decode('utf-8'), 'Admin User', True)
-        )
-        print("Default admin user created.")
-    else:
-        print("Admin user already exists.")
-
-    # Pre-populate item_codes if the table is empty
-    cursor.execute("SELECT COUNT(*) FROM item_codes")
-    if cursor.fetchone()[0] == 0:
-        print("Populating item_codes table...")
-        item_codes_to_add = [
-            ('POS', 'Punto de Venta', 'Terminal para transacciones comerciales'),
-            ('PINPAD', 'Pinpad', 'Dispositivo para ingreso de PIN'),
-            ('SIM', 'Tarjeta SIM', 'Tarjeta para conectividad celular')
-        ]
-        cursor.executemany("INSERT INTO item_codes (codigo, tipo, descripcion) VALUES (%s, %s, %s)", item_codes_to_add)
-        print(f"{cursor.rowcount} item codes inserted.")
-
-    # Commit all changes and close the connection
-    conn.commit()
-    cursor.close()
-    conn.close()
+    try:
+        version = migrations.migrate(conn)
+    finally:
+        conn.close()
     print("Database initialization complete.")
+    return version
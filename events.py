@@ -0,0 +1,197 @@
+"""Fan-out of inventory change events to the push channel.
+
+Write endpoints call ``event_broker.publish()`` after committing; every
+connection to GET /inventory/events holds a subscription and receives the
+events its user is allowed to see. Many rows written at once (a bulk
+chunk, a busy relay page) go out as one "bulk" event with the version
+range instead of one event per row, so they can't fill a subscriber's
+queue; clients fetch the rows from GET /inventory/changes.
+
+The broker only reaches subscribers connected to the same worker process.
+With several workers (EVENTS_RELAY, set by gunicorn.conf.py) each one runs
+a ChangeRelay instead: it polls the inventory_sync version and publishes
+every committed change from the database, its own writes included, in
+version order, so a client resuming from its last event id misses nothing.
+"""
+import asyncio
+
+import repository
+from database import get_pool
+from periodic import PeriodicTask
+
+
+class Subscription:
+    def __init__(self, user_id, is_admin, queue_size):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def wants(self, event):
+        if self.is_admin:
+            return True
+        if self.user_id in event.get("asignado_a_ids", ()):
+            return True
+        return self.user_id in (event.get("asignado_a_id"), event.get("previous_asignado_a_id"))
+
+
+def bulk_event(from_version, version, asignado_a_ids):
+    """One event standing for every change in [from_version, version]."""
+    return {
+        "type": "bulk", "version": version, "from_version": from_version, "item_id": None,
+        "asignado_a_id": None, "previous_asignado_a_id": None,
+        "asignado_a_ids": sorted(user_id for user_id in set(asignado_a_ids) if user_id is not None),
+        "item": None,
+    }
+
+
+class EventBroker:
+    """Delivers published events to subscriptions on the server's event loop.
+
+    A subscriber that falls ``queue_size`` events behind is disconnected
+    (it receives ``None``) so one slow client can't grow memory unbounded;
+    it is expected to catch up through GET /inventory/changes.
+    """
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscriptions = set()
+        self._loop = None
+
+    def subscribe(self, user):
+        """Must be called from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(user['id'], bool(user.get('is_admin')), self.queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        """Called on the event loop by the write endpoints and ChangeRelay; other threads are handed to the loop."""
+        loop = self._loop
+        if loop is None or not self._subscriptions:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(event)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _dispatch(self, event):
+        for subscription in list(self._subscriptions):
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._subscriptions.discard(subscription)
+                # Make room for the disconnect marker
+                subscription.queue.get_nowait()
+                subscription.queue.put_nowait(None)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscriptions)
+
+
+class ChangeRelay:
+    """Publishes the changes committed by any worker to this worker's broker.
+
+    Relayed events are coalesced like GET /inventory/changes: ``item`` is the
+    current state of the item, so their type is "updated" (or "deleted"),
+    and an item written twice between polls produces one event.
+    """
+
+    def __init__(self, broker, item_to_dict, poll_interval=0.5, page_size=500, coalesce_above=32):
+        self.broker = broker
+        self.item_to_dict = item_to_dict
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        # Pages with more events than this are published as one bulk event
+        self.coalesce_above = min(coalesce_above, broker.queue_size // 2)
+        self.version = None     # last version relayed; None until the first poll
+        self.relayed_total = 0
+        self._poller = PeriodicTask(self._relay, poll_interval, "relay inventory events")
+
+    def start(self):
+        self._poller.start()
+
+    async def stop(self):
+        await self._poller.stop()
+
+    async def _relay(self):
+        pool = get_pool()
+        conn = await pool.acquire()
+        try:
+            await self._poll(conn)
+        finally:
+            await pool.release(conn)
+
+    async def _poll(self, conn):
+        while True:
+            if self.version is None or not self.broker.subscriber_count:
+                # Nobody to deliver older changes to; start from the current version
+                row = await conn.fetchone("SELECT version FROM inventory_sync WHERE id = 1")
+                self.version = row['version']
+                await conn.rollback()
+                return
+            current, items, tombstones = await repository.get_change_log(conn, self.version, self.page_size)
+            # Ends the read snapshot, so the next poll sees newer commits
+            await conn.rollback()
+            # Same cut as GET /inventory/changes when a list was cut short
+            upto = current
+            if len(items) > self.page_size:
+                upto = min(upto, items[self.page_size - 1]['row_version'])
+            if len(tombstones) > self.page_size:
+                upto = min(upto, tombstones[self.page_size - 1]['row_version'])
+            events = self._events(items, tombstones, upto)
+            if len(events) > self.coalesce_above:
+                assignees = [user_id for event in events for user_id in (event['asignado_a_id'], event['previous_asignado_a_id'])]
+                events = [bulk_event(self.version + 1, upto, assignees)]
+            for event in events:
+                self.broker.publish(event)
+                self.relayed_total += 1
+            self.version = upto
+            if upto == current:
+                return
+
+    def _events(self, items, tombstones, upto):
+        reassigned = {}
+        events = []
+        for tombstone in tombstones:
+            if tombstone['row_version'] > upto:
+                break
+            if not tombstone['deleted']:
+                # Sent with the item's own event when it is part of this page
+                reassigned[(tombstone['item_id'], tombstone['row_version'])] = tombstone
+                continue
+            events.append({
+                "type": "deleted", "version": tombstone['row_version'], "item_id": tombstone['item_id'],
+                "asignado_a_id": None, "previous_asignado_a_id": tombstone['asignado_a_id'], "item": None,
+            })
+        for row in items:
+            if row['row_version'] > upto:
+                break
+            tombstone = reassigned.pop((row['id'], row['row_version']), None)
+            events.append({
+                "type": "updated", "version": row['row_version'], "item_id": row['id'],
+                "asignado_a_id": row['asignado_a_id'],
+                "previous_asignado_a_id": tombstone['asignado_a_id'] if tombstone else None,
+                "item": self.item_to_dict(row),
+            })
+        # Reassignments whose item was written again later (or deleted):
+        # the previous technician still learns the item left their view
+        for (item_id, version), tombstone in reassigned.items():
+            events.append({
+                "type": "updated", "version": version, "item_id": item_id,
+                "asignado_a_id": None, "previous_asignado_a_id": tombstone['asignado_a_id'], "item": None,
+            })
+        events.sort(key=lambda event: event['version'])
+        return events
+
+
+event_broker = EventBroker()
@@ -0,0 +1,147 @@
+"""Production launcher settings: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py api:app
+
+One async worker per available CPU (WEB_CONCURRENCY overrides it). The
+app is imported once in the master (preload_app) and the schema is
+migrated there before the workers are forked, so workers start ready and
+share the master's copy of the imported code.
+
+Workers are recycled after GUNICORN_MAX_REQUESTS requests (with jitter so
+they don't all restart together) and when their resident memory goes over
+WORKER_MAX_MEMORY_MB; a recycled worker finishes its in-flight requests
+first. ``kill -HUP <master pid>`` re-reads this file and replaces every
+worker the same graceful way, which frees memory without dropping
+requests. Note that with preload_app HUP does not load new code; deploys
+restart the master.
+
+SECRET_KEY must be set: every worker has to verify the tokens the others
+issued, and they must stay valid across restarts, so the random per-process
+fallback in config.py is refused here.
+
+run_server.py remains the single-process launcher for development.
+"""
+import math
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+
+def _available_cpus():
+    """CPUs this process may use, honoring affinity masks and container CPU quotas."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        cpus = os.cpu_count() or 1
+    try:
+        # cgroup v2 quota, e.g. "150000 100000" for 1.5 CPUs or "max 100000"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+if not os.getenv('SECRET_KEY'):
+    raise RuntimeError("SECRET_KEY is not set. Workers would sign tokens with random keys that "
+                       "other workers reject and that change on every restart.")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Async workers don't sit idle while waiting on the database, so one per
+# CPU is enough; Render sets WEB_CONCURRENCY from the instance type
+workers = int(os.getenv('WEB_CONCURRENCY') or _available_cpus())
+
+# Every worker runs its own bcrypt process pool; split the CPUs between them
+# instead of giving each worker one hashing process per CPU
+os.environ.setdefault('PASSWORD_HASH_WORKERS', str(max(1, _available_cpus() // workers)))
+
+# SSE subscribers of one worker must also get the other workers' writes,
+# and cached reference data must be dropped when another worker changes it
+if workers > 1:
+    os.environ.setdefault('EVENTS_RELAY', '1')
+    os.environ.setdefault('REFERENCE_CACHE_POLL_SECONDS', '2')
+
+preload_app = True
+
+# Workers write their Prometheus samples to files in this directory and
+# /metrics merges them (see metrics.py). It must be set before the app (and
+# prometheus_client) is imported and must start empty, so each master gets
+# a new one unless PROMETHEUS_MULTIPROC_DIR is given; HUP keeps it.
+_METRICS_DIR_PREFIX = 'flet-inv-metrics-'
+if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(
+        prefix=_METRICS_DIR_PREFIX, dir='/dev/shm' if os.path.isdir('/dev/shm') else None,
+    )
+
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', str(max_requests // 10)))
+# Seconds a stopping worker gets to finish its requests (open SSE streams
+# are cut after this)
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# A worker whose event loop doesn't check in for this long is restarted
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Worker heartbeat files on tmpfs: a slow disk mustn't make workers look hung
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+WORKER_MAX_MEMORY_MB = int(os.getenv('WORKER_MAX_MEMORY_MB', '0'))
+MEMORY_CHECK_SECONDS = 10
+
+
+def on_starting(server):
+    # The master already imported api.py (preload_app); migrate once here
+    # instead of in every worker. A failure is not fatal: each worker then
+    # retries in the background as without the launcher.
+    from health import startup_state
+    if startup_state.initialize_now():
+        server.log.info("Database schema ready (version %s)", startup_state.schema_version)
+    else:
+        server.log.warning("Database initialization failed in the master: %s", startup_state.last_error)
+
+
+def _resident_memory_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _watch_memory(worker):
+    while True:
+        time.sleep(MEMORY_CHECK_SECONDS)
+        rss = _resident_memory_mb()
+        if rss is not None and rss > WORKER_MAX_MEMORY_MB:
+            worker.log.warning("Worker %s uses %.0f MB (limit %s MB), restarting it", worker.pid, rss, WORKER_MAX_MEMORY_MB)
+            # Same graceful shutdown as max_requests; the master replaces it
+            os.kill(worker.pid, signal.SIGTERM)
+            return
+
+
+def child_exit(server, worker):
+    # Drops the exited worker's gauge samples ("live" gauges only count running workers)
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    if os.path.basename(metrics_dir).startswith(_METRICS_DIR_PREFIX):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def post_worker_init(worker):
+    if WORKER_MAX_MEMORY_MB > 0:
+        threading.Thread(target=_watch_memory, args=(worker,), name="memory-watch", daemon=True).start()
@@ -0,0 +1,121 @@
+"""Process liveness and readiness.
+
+The schema is brought up to date in a background thread so the server
+starts answering immediately, even when MySQL is slow or down at boot.
+Request handlers that need the database get a 503 until it is ready, and
+/readyz reports why the process isn't ready yet.
+"""
+import asyncio
+import threading
+import time
+
+from config import STARTUP_CONFIG
+from database import initialize_database, get_pool, DatabaseError
+
+
+class StartupState:
+    """Runs initialize_database() with retries and remembers the outcome."""
+
+    def __init__(self, retry_initial_seconds=1.0, retry_max_seconds=30.0, ping_cache_seconds=2.0):
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.ping_cache_seconds = ping_cache_seconds
+        self.schema_ready = False
+        self.schema_version = None
+        self.attempts = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._ping_lock = None
+        self._ping = None  # (checked_at, result)
+
+    def start(self):
+        """Starts the initialization thread; call it from the server's event loop."""
+        if self.schema_ready:
+            # Already done by initialize_now() before this worker was forked
+            asyncio.get_running_loop().create_task(self._fill_pool())
+            return
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._thread = threading.Thread(target=self._initialize, name="schema-init", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def initialize_now(self):
+        """Makes one initialization attempt in the calling thread; returns True on success.
+
+        gunicorn.conf.py calls it in the master process so that migrations run
+        once rather than once per worker. If it fails, start() keeps retrying
+        in each worker as usual.
+        """
+        self.attempts += 1
+        try:
+            self.schema_version = initialize_database()
+        except Exception as err:
+            self.last_error = str(err)
+            return False
+        self.last_error = None
+        self.schema_ready = True
+        return True
+
+    def _initialize(self):
+        delay = self.retry_initial_seconds
+        while not self._stop.is_set():
+            if not self.initialize_now():
+                print(f"Database initialization failed (attempt {self.attempts}): {self.last_error}. Retrying in {delay:.0f}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.retry_max_seconds)
+                continue
+            # The pool lives on the event loop
+            asyncio.run_coroutine_threadsafe(self._fill_pool(), self._loop)
+            return
+
+    async def _fill_pool(self):
+        try:
+            await get_pool().fill()
+        except DatabaseError as err:
+            # Not fatal: the pool opens connections on demand
+            print(f"Could not pre-open pool connections: {err}")
+
+    async def ping(self):
+        """Returns the result of a recent ``SELECT 1``; at most one runs per ping_cache_seconds."""
+        if self._ping_lock is None:
+            self._ping_lock = asyncio.Lock()
+        async with self._ping_lock:
+            now = time.monotonic()
+            if self._ping is not None and now - self._ping[0] < self.ping_cache_seconds:
+                return self._ping[1]
+            result = {"ok": False, "latency_ms": None, "error": None}
+            pool = get_pool()
+            started = time.perf_counter()
+            try:
+                conn = await pool.acquire()
+                try:
+                    await conn.fetchall("SELECT 1")
+                finally:
+                    await pool.release(conn)
+                result["ok"] = True
+                result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            except Exception as err:
+                result["error"] = str(err)
+            self._ping = (time.monotonic(), result)
+            return result
+
+    async def readiness(self):
+        database = await self.ping() if self.schema_ready else None
+        return {
+            "ready": self.schema_ready and bool(database and database["ok"]),
+            "schema": {
+                "ready": self.schema_ready,
+                "version": self.schema_version,
+                "attempts": self.attempts,
+                "last_error": self.last_error,
+            },
+            "database": database,
+        }
+
+
+startup_state = StartupState(**STARTUP_CONFIG)
@@ -0,0 +1,114 @@
+"""Buffered writer for inventory_status_history.
+
+Write endpoints call ``status_history.record()`` after committing, which
+only appends to an in-memory list. A background task inserts the buffer
+with one multi-row INSERT every ``flush_interval`` seconds, or sooner once
+``batch_size`` transitions are waiting, so recording history adds no
+database round trip to the request. Transitions still buffered when the
+process is killed (not stopped) are lost.
+
+While the database is unreachable the buffer grows up to ``max_pending``
+transitions. Write endpoints check has_room() first and refuse the write
+with a 503 once it is full, so audit entries aren't lost to overflow;
+dropping the oldest entries is only a last resort (a burst racing that
+check) and is counted in dropped_total, exported as a metric.
+"""
+import asyncio
+import contextlib
+from datetime import datetime
+
+import repository
+from config import HISTORY_CONFIG
+from database import get_pool, DatabaseError, PoolTimeout
+from periodic import PeriodicTask
+
+
+class StatusHistoryBuffer:
+    def __init__(self, flush_interval=1.0, batch_size=500, max_pending=50000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = []
+        self._inflight = []     # batch being inserted; still readable through pending_for
+        self._commit_lock = None
+        self._flusher = PeriodicTask(self._flush, flush_interval, "write status history")
+        self.written_total = 0
+        self.dropped_total = 0
+
+    def record(self, item_id, estado_anterior, estado_nuevo, terminal_comercio, changed_by_id):
+        """Queues one transition; ``estado_anterior`` is None when the item was created."""
+        self._pending.append({
+            "item_id": item_id,
+            "estado_anterior": estado_anterior,
+            "estado_nuevo": estado_nuevo,
+            "terminal_comercio": terminal_comercio,
+            "changed_by_id": changed_by_id,
+            "changed_at": datetime.now(),
+        })
+        if len(self._pending) > self.max_pending:
+            # The database has been unreachable for a while; keep the newest
+            overflow = len(self._pending) - self.max_pending
+            del self._pending[:overflow]
+            self.dropped_total += overflow
+            print(f"Status history buffer full, dropped {overflow} transitions")
+        if len(self._pending) >= self.batch_size:
+            self._flusher.wake()
+
+    def has_room(self, count=1):
+        """Whether ``count`` more transitions fit in the buffer."""
+        return self.pending_count + count <= self.max_pending
+
+    @property
+    def pending_count(self):
+        return len(self._pending) + len(self._inflight)
+
+    @contextlib.asynccontextmanager
+    async def no_commits(self):
+        """Holds off batch commits: a history read inside plus pending_for() sees each transition once."""
+        if self._commit_lock is None:
+            yield
+        else:
+            async with self._commit_lock:
+                yield
+
+    def pending_for(self, item_id):
+        """Transitions of ``item_id`` not committed yet, oldest first."""
+        return [entry for entry in self._inflight + self._pending if entry["item_id"] == item_id]
+
+    def start(self):
+        if not self._flusher.running:
+            self._commit_lock = asyncio.Lock()
+            self._flusher.start()
+
+    async def stop(self):
+        """Writes whatever is still buffered and stops the flush task."""
+        await self._flusher.stop()
+        if self._pending:
+            print(f"{len(self._pending)} status history transitions were not written")
+
+    async def _flush(self):
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:len(batch)]
+            # Readers keep seeing the batch through pending_for until its
+            # INSERT is committed
+            self._inflight = batch
+            pool = get_pool()
+            try:
+                conn = await pool.acquire()
+                try:
+                    async with self._commit_lock:
+                        await repository.insert_status_history(conn, batch)
+                        await conn.commit()
+                        self._inflight = []
+                finally:
+                    await pool.release(conn)
+            except (PoolTimeout, DatabaseError):
+                # Put the batch back in order and retry on the next tick
+                self._pending[:0] = batch
+                self._inflight = []
+                raise
+            self.written_total += len(batch)
+
+
+status_history = StatusHistoryBuffer(**HISTORY_CONFIG)
@@ -0,0 +1,175 @@
+"""Negotiated gzip/brotli compression of API responses.
+
+Inventory pages repeat the same nested item_code and asignado_a objects on
+every row, so they compress very well. CompressionMiddleware is plain ASGI
+(like metrics.MetricsMiddleware): it picks brotli or gzip from the
+request's Accept-Encoding and compresses complete bodies of at least
+``minimum_size`` bytes. Streamed bodies (the NDJSON export) are compressed
+chunk by chunk, flushing after each so the client still receives rows as
+they are produced; Server-Sent Events are left alone, since a compressed
+event stream can sit in proxy buffers.
+
+Reference data cached in memory is compressed once, at the highest levels,
+with precompress(); precompressed_response() serves the matching variant
+and the middleware passes it through untouched.
+"""
+import asyncio
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from serialization import JSONBytesResponse
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is offered on its own
+    brotli = None
+
+# Preferred first when the client accepts several with the same q-value
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# Bodies larger than this are compressed on a worker thread (zlib and
+# brotli release the GIL) instead of blocking the event loop
+_OFFLOAD_BYTES = 64 * 1024
+
+_SKIPPED_TYPES = ('text/event-stream',)
+
+
+def negotiate(accept_encoding, available=ENCODINGS):
+    """Returns the encoding in ``available`` the client prefers, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            # wbits 16 + MAX_WBITS writes a gzip header and trailer
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data, final):
+        """Compresses ``data`` and flushes, so everything so far can be decoded."""
+        if self.encoding == 'br':
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+async def _run(compressor, data, final):
+    if len(data) > _OFFLOAD_BYTES:
+        return await asyncio.get_running_loop().run_in_executor(None, compressor.compress, data, final)
+    return compressor.compress(data, final)
+
+
+def _compress_all(body, levels):
+    return {encoding: _Compressor(encoding, levels[encoding]).compress(body, True) for encoding in ENCODINGS}
+
+
+async def precompress(body, minimum_size=0):
+    """Returns {encoding: compressed body} for every supported encoding, at maximum levels.
+
+    Always runs on a worker thread: brotli's highest level takes tens of
+    milliseconds even for small bodies, and this is never on a hot path.
+    """
+    if len(body) < minimum_size:
+        return {}
+    levels = {'br': 11, 'gzip': 9}
+    return await asyncio.get_running_loop().run_in_executor(None, _compress_all, body, levels)
+
+
+def precompressed_response(body, variants, accept_encoding):
+    """JSON response using the precompressed variant the client accepts, if any."""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate(accept_encoding, tuple(variants))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        body = variants[encoding]
+    return JSONBytesResponse(body, headers=headers)
+
+
+class CompressionMiddleware:
+    """Compresses responses the client accepts gzip or brotli for."""
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_level=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {'gzip': gzip_level, 'br': brotli_level}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get('accept-encoding'))
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                if ('content-encoding' in headers
+                        or headers.get('content-type', '').startswith(_SKIPPED_TYPES)
+                        or message['status'] in (204, 304)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held back until we know whether the body gets compressed
+                    start = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if start is not None:
+                headers = MutableHeaders(raw=start['headers'])
+                # precompressed_response() already negotiated (and said so)
+                vary = [value.strip().lower() for value in headers.get('vary', '').split(',')]
+                if 'accept-encoding' not in vary:
+                    headers.add_vary_header('Accept-Encoding')
+                if encoding is not None and (more_body or len(body) >= self.minimum_size):
+                    compressor = _Compressor(encoding, self.levels[encoding])
+                    headers['Content-Encoding'] = encoding
+                    if more_body:
+                        del headers['Content-Length']
+                    else:
+                        body = await _run(compressor, body, True)
+                        headers['Content-Length'] = str(len(body))
+                        compressor = None
+                    message = dict(message, body=body)
+                await send(start)
+                start = None
+                if compressor is None:
+                    passthrough = True
+                    await send(message)
+                    return
+            await send(dict(message, body=await _run(compressor, body, not more_body)))
+
+        await self.app(scope, receive, send_compressed)
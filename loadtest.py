@@ -0,0 +1,413 @@
+"""Load test for the API: seeds a database at a given scale, then drives a request mix.
+
+Seeding writes straight to the database configured in config.py (after
+applying migrations), MySQL or SQLite (DB_BACKEND=sqlite). Scale 1 is 100k
+inventory items spread over 50 technicians (lt_tecnico_0001...); items get
+serial numbers LT-<n>, so a seed can be grown or removed without touching
+real data.
+
+    python loadtest.py seed --scale 1
+    python loadtest.py seed --scale 10            # grows the same data set to 1M items
+    python loadtest.py seed --scale 1 --reset     # drops LT-/LTB- items first
+
+The run command logs in as the admin and as the seeded technicians and
+keeps ``--concurrency`` virtual users busy with a weighted mix of admin
+/inventory pages, technician /inventory/my-items pages, PATCH .../status
+and bulk creates. Throughput and latency percentiles per route are
+printed as JSON (and written to ``--output``); ``--compare`` checks them
+against an earlier result and exits with status 1 on a regression.
+
+    python loadtest.py run --base-url http://127.0.0.1:8000 --duration 60 --output result.json
+    python loadtest.py run --compare result.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ITEMS_PER_SCALE = 100_000
+TECHNICIANS_PER_SCALE = 50
+SEED_CHUNK_SIZE = 5000
+RESET_BATCH_SIZE = 5000
+ASSIGNED_STATES = ('Asignado a Tecnico', 'En Comercio', 'Reversado')
+DEFAULT_MIX = "admin_inventory=20,my_items=50,patch_status=25,bulk_create=5"
+
+
+def technician_username(n):
+    return f"lt_tecnico_{n:04d}"
+
+
+# --- Seeding ---------------------------------------------------------------
+
+def _ensure_technicians(cursor, count, password):
+    import bcrypt
+
+    cursor.execute("SELECT username, id FROM users WHERE username LIKE 'lt!_tecnico!_%' ESCAPE '!'")
+    existing = dict(cursor.fetchall())
+    missing = [technician_username(n) for n in range(1, count + 1) if technician_username(n) not in existing]
+    if missing:
+        # One hash for all of them: seeding shouldn't take minutes of bcrypt
+        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        cursor.executemany(
+            "INSERT INTO users (username, password_hash, full_name, is_admin) VALUES (%s, %s, %s, %s)",
+            [(username, password_hash, f"Tecnico de carga {username[-4:]}", False) for username in missing]
+        )
+        cursor.execute("SELECT username, id FROM users WHERE username LIKE 'lt!_tecnico!_%' ESCAPE '!'")
+        existing = dict(cursor.fetchall())
+    return [existing[technician_username(n)] for n in range(1, count + 1)]
+
+
+def _reset(conn, cursor, dialect):
+    """Deletes the LT-/LTB- items RESET_BATCH_SIZE at a time, as DELETE /inventory/{id} would.
+
+    Every item gets a change version and a tombstone, so delta-sync
+    clients learn through GET /inventory/changes that it is gone.
+    """
+    deleted = 0
+    while True:
+        # Rows first, then the counter: the same lock order as the API
+        cursor.execute(
+            "SELECT id, asignado_a_id FROM inventory_items WHERE sn LIKE 'LT-%' OR sn LIKE 'LTB-%' "
+            f"ORDER BY id LIMIT {RESET_BATCH_SIZE}" + dialect.for_update
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            conn.commit()
+            return deleted
+        version = _reserve_versions(cursor, dialect, len(rows)) - len(rows)
+        cursor.executemany(
+            "INSERT INTO inventory_tombstones (row_version, item_id, asignado_a_id, deleted) VALUES (%s, %s, %s, %s)",
+            [(version + offset + 1, item_id, asignado_a_id, True) for offset, (item_id, asignado_a_id) in enumerate(rows)]
+        )
+        placeholders = ", ".join(["%s"] * len(rows))
+        cursor.execute(f"DELETE FROM inventory_items WHERE id IN ({placeholders})", [item_id for item_id, _ in rows])
+        conn.commit()
+        deleted += len(rows)
+
+
+def _reserve_versions(cursor, dialect, count):
+    """Sync counterpart of repository.next_change_versions()."""
+    cursor.execute(dialect.increment_counter("inventory_sync", "version", "id = 1"), (count,))
+    if dialect.counter_in_lastrowid:
+        return cursor.lastrowid
+    cursor.execute("SELECT version FROM inventory_sync WHERE id = 1")
+    return cursor.fetchone()[0]
+
+
+def _item_rows(start, stop, seed, code_ids, technician_ids):
+    rng = random.Random(f"{seed}-{start}")
+    now = datetime.now().replace(microsecond=0)
+    rows = []
+    for n in range(start, stop):
+        fecha = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        if rng.random() < 0.3:
+            estado, asignado, terminal = 'En Bodega', None, None
+        else:
+            estado = rng.choice(ASSIGNED_STATES)
+            asignado = rng.choice(technician_ids)
+            terminal = f"T{rng.randrange(100000):05d}" if estado == 'En Comercio' else None
+        rows.append((fecha, f"LT-{n:08d}", rng.choice(code_ids), 'implementacion', estado, asignado, terminal))
+    return rows
+
+
+def seed(args):
+    from database import get_db_connection, initialize_database, rebuild_inventory_stats
+    from storage import get_storage
+
+    initialize_database()
+    target_items = args.items if args.items is not None else int(args.scale * ITEMS_PER_SCALE)
+    target_technicians = args.technicians if args.technicians is not None else max(1, int(args.scale * TECHNICIANS_PER_SCALE))
+
+    dialect = get_storage().dialect
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if args.reset:
+            print(f"Removed {_reset(conn, cursor, dialect)} load-test items")
+
+        technician_ids = _ensure_technicians(cursor, target_technicians, args.password)
+        cursor.execute("SELECT id FROM item_codes ORDER BY id")
+        code_ids = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+
+        cursor.execute("SELECT COUNT(*) FROM inventory_items WHERE sn LIKE 'LT-%'")
+        existing = cursor.fetchone()[0]
+        conn.commit()
+        if existing >= target_items:
+            print(f"{existing} load-test items already present, nothing to insert")
+        started = time.perf_counter()
+        for start in range(existing, target_items, SEED_CHUNK_SIZE):
+            stop = min(start + SEED_CHUNK_SIZE, target_items)
+            rows = _item_rows(start, stop, args.seed, code_ids, technician_ids)
+            # Same version bookkeeping as the API, so delta sync stays consistent
+            version = _reserve_versions(cursor, dialect, len(rows)) - len(rows)
+            cursor.executemany(
+                """
+                INSERT INTO inventory_items
+                (fecha_ingreso, sn, item_code_id, tipo_servicio, estado_actual, asignado_a_id, terminal_comercio, row_version)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                [row + (version + offset + 1,) for offset, row in enumerate(rows)]
+            )
+            conn.commit()
+            print(f"  {stop}/{target_items} items ({(stop - existing) / (time.perf_counter() - started):.0f} rows/s)")
+
+        # Lock the counter so no API write lands during the rebuild
+        _reserve_versions(cursor, dialect, 0)
+        rebuild_inventory_stats(cursor)
+        conn.commit()
+        print(f"Seed ready: {target_items} items, {target_technicians} technicians (password '{args.password}')")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# --- Load generation -------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # route -> list of latencies (s)
+        self.errors = {}   # route -> {status: count}
+        self.recording = False
+
+    def add(self, route, seconds, status_code):
+        if not self.recording:
+            return
+        self.samples.setdefault(route, []).append(seconds)
+        if status_code >= 400:
+            by_status = self.errors.setdefault(route, {})
+            by_status[str(status_code)] = by_status.get(str(status_code), 0) + 1
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        values = sorted(samples)
+        errors = recorder.errors.get(route, {})
+        routes[route] = {
+            "requests": len(values),
+            "errors": sum(errors.values()),
+            "errors_by_status": errors,
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(sum(values) / len(values) * 1000, 2),
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+            "p90_ms": round(_percentile(values, 0.90) * 1000, 2),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    total = sum(route["requests"] for route in routes.values())
+    return {
+        "total_requests": total,
+        "total_errors": sum(route["errors"] for route in routes.values()),
+        "throughput_rps": round(total / elapsed, 2),
+        "routes": routes,
+    }
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    def __init__(self, client, args, recorder):
+        self.client = client
+        self.args = args
+        self.recorder = recorder
+        self.rng = random.Random(args.seed)
+        self.run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+        self.bulk_counter = 0
+        self.admin_headers = None
+        self.technicians = []  # (headers, [item ids])
+
+    async def request(self, route, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status_code = response.status_code
+        except Exception:
+            response, status_code = None, 599
+        self.recorder.add(route, time.perf_counter() - started, status_code)
+        return response
+
+    async def login(self, username, password):
+        response = await self.client.post("/auth", json={"username": username, "password": password})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def setup(self):
+        self.admin_headers = await self.login(self.args.admin_user, self.args.admin_password)
+
+        async def technician(n):
+            headers = await self.login(technician_username(n), self.args.password)
+            response = await self.client.get("/inventory/my-items", params={"limit": 200}, headers=headers)
+            response.raise_for_status()
+            return headers, [item['id'] for item in response.json()]
+
+        self.technicians = await asyncio.gather(*(technician(n) for n in range(1, self.args.technicians + 1)))
+        if not any(ids for _, ids in self.technicians):
+            print("Warning: the technicians have no items; run 'seed' first", file=sys.stderr)
+
+    async def admin_inventory(self):
+        params = {"limit": self.args.page_size}
+        if self.rng.random() < 0.25:
+            params["estado_actual"] = self.rng.choice(ASSIGNED_STATES + ('En Bodega',))
+        response = await self.request("GET /inventory", "GET", "/inventory", params=params, headers=self.admin_headers)
+        # A third of the admins page forward once
+        if response is not None and response.headers.get("X-Next-Cursor") and self.rng.random() < 0.33:
+            params["cursor"] = response.headers["X-Next-Cursor"]
+            await self.request("GET /inventory", "GET", "/inventory", params=params, headers=self.admin_headers)
+
+    async def my_items(self):
+        headers, _ = self.rng.choice(self.technicians)
+        await self.request("GET /inventory/my-items", "GET", "/inventory/my-items",
+                           params={"limit": self.args.page_size}, headers=headers)
+
+    async def patch_status(self):
+        headers, item_ids = self.rng.choice(self.technicians)
+        if not item_ids:
+            return await self.my_items()
+        estado = self.rng.choice(ASSIGNED_STATES)
+        await self.request(
+            "PATCH /inventory/{item_id}/status", "PATCH", f"/inventory/{self.rng.choice(item_ids)}/status",
+            json={"estado_actual": estado, "terminal_comercio": "T00001" if estado == 'En Comercio' else None},
+            headers=headers,
+        )
+
+    async def bulk_create(self):
+        items = []
+        for _ in range(self.args.bulk_size):
+            self.bulk_counter += 1
+            items.append({"sn": f"LTB-{self.run_id}-{self.bulk_counter:08d}", "item_code_id": 1})
+        await self.request("POST /inventory/bulk", "POST", "/inventory/bulk",
+                           json={"items": items}, headers=self.admin_headers)
+
+    async def virtual_user(self, mix, deadline):
+        names, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            await SCENARIOS[self.rng.choices(names, weights)[0]](self)
+
+
+SCENARIOS = {
+    "admin_inventory": LoadTest.admin_inventory,
+    "my_items": LoadTest.my_items,
+    "patch_status": LoadTest.patch_status,
+    "bulk_create": LoadTest.bulk_create,
+}
+
+
+async def _run(args):
+    import httpx
+
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        test = LoadTest(client, args, recorder)
+        await test.setup()
+        deadline = time.monotonic() + args.warmup + args.duration
+        users = [asyncio.ensure_future(test.virtual_user(mix, deadline)) for _ in range(args.concurrency)]
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        started = time.monotonic()
+        await asyncio.gather(*users)
+        elapsed = time.monotonic() - started
+
+    result = summarize(recorder, elapsed)
+    result["config"] = {
+        "base_url": args.base_url, "concurrency": args.concurrency, "duration_s": args.duration,
+        "warmup_s": args.warmup, "mix": mix, "technicians": args.technicians,
+        "page_size": args.page_size, "bulk_size": args.bulk_size,
+    }
+    result["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    return result
+
+
+def compare(result, baseline, max_regression):
+    """Returns the regressions of ``result`` against ``baseline`` as readable lines."""
+    regressions = []
+    for route, before in baseline["routes"].items():
+        after = result["routes"].get(route)
+        if after is None:
+            continue
+        if after["p99_ms"] > before["p99_ms"] * (1 + max_regression):
+            regressions.append(f"{route}: p99 {before['p99_ms']} ms -> {after['p99_ms']} ms")
+        if after["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{route}: throughput {before['throughput_rps']} -> {after['throughput_rps']} req/s")
+        if after["errors"] > before["errors"]:
+            regressions.append(f"{route}: errors {before['errors']} -> {after['errors']}")
+    return regressions
+
+
+def run(args):
+    result = asyncio.run(_run(args))
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="populate the configured database")
+    seed_parser.add_argument("--scale", type=float, default=1.0, help=f"1 = {ITEMS_PER_SCALE} items, {TECHNICIANS_PER_SCALE} technicians")
+    seed_parser.add_argument("--items", type=int, help="exact item count (overrides --scale)")
+    seed_parser.add_argument("--technicians", type=int, help="exact technician count (overrides --scale)")
+    seed_parser.add_argument("--password", default="loadtest", help="password of the seeded technicians")
+    seed_parser.add_argument("--seed", type=int, default=42, help="random seed for the generated rows")
+    seed_parser.add_argument("--reset", action="store_true", help="delete load-test items first")
+    seed_parser.set_defaults(func=seed)
+
+    run_parser = commands.add_parser("run", help="drive the request mix against a running server")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--admin-user", default="admin")
+    run_parser.add_argument("--admin-password", default="admin")
+    run_parser.add_argument("--password", default="loadtest", help="password of the seeded technicians")
+    run_parser.add_argument("--technicians", type=int, default=20, help="technician accounts to log in as")
+    run_parser.add_argument("--concurrency", type=int, default=50, help="virtual users")
+    run_parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before that")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight list")
+    run_parser.add_argument("--page-size", type=int, default=100)
+    run_parser.add_argument("--bulk-size", type=int, default=100)
+    run_parser.add_argument("--timeout", type=float, default=30)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--output", help="also write the JSON result here")
+    run_parser.add_argument("--compare", help="baseline JSON result to check for regressions")
+    run_parser.add_argument("--max-regression", type=float, default=0.2,
+                            help="tolerated p99/throughput change vs. the baseline (0.2 = 20%%)")
+    run_parser.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Debug-mode detector for code that blocks the asyncio event loop.
+
+A heartbeat coroutine stamps the time on every loop iteration it gets; a
+watchdog thread checks the stamp and, when the loop has been stuck for
+longer than the threshold, captures the loop thread's current stack. That
+stack points at the coroutine (or sync call inside one) that is blocking.
+
+Enable with DEBUG_LOOP_BLOCKING=1; reports are printed and kept for
+GET /debug/loop-blocks.
+"""
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+
+
+class LoopBlockDetector:
+
+    def __init__(self, threshold_ms=100.0, max_reports=50):
+        self.threshold = threshold_ms / 1000.0
+        # Check a few times per threshold so short stalls aren't missed
+        self.interval = self.threshold / 4
+        self.reports = collections.deque(maxlen=max_reports)
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._task = None
+        self._thread = None
+
+    def start(self):
+        """Must be called from the event loop to monitor."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-block-detector", daemon=True)
+        self._thread.start()
+        print(f"Event-loop blocking detector enabled (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self._last_beat
+            blocked_for = time.monotonic() - beat
+            # The heartbeat itself sleeps for one interval between stamps
+            if blocked_for - self.interval < self.threshold or beat == reported_beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported_beat = beat
+            stack = "".join(traceback.format_stack(frame))
+            self.reports.append({
+                "detected_at": time.time(),
+                "blocked_ms": round(blocked_for * 1000, 1),
+                "stack": stack,
+            })
+            print(f"\n=== Event loop blocked for {blocked_for * 1000:.0f} ms ===\n{stack}")
@@ -24,6 +24,11 @@ def main(page: ft.Page):
         page.snack_bar.open = True
         page.update()
 
+    # Versión de la última escritura (X-Write-Position): se reenvía en cada
+    # solicitud para que, con varios workers, las lecturas vean los cambios
+    # propios aunque las atienda otro proceso (ver replicas.py)
+    write_position = {"value": 0}
+
     def httpx_request(method: str, endpoint: str, token: Optional[str] = None, json_data: Optional[dict] = None):
         # Obtener el token de la sesión si no se proporciona
         if token is None:
@@ -32,6 +37,8 @@ def main(page: ft.Page):
         headers = {"Content-Type": "application/json"}
         if token:
             headers["Authorization"] = f"Bearer {token}"
+        if write_position["value"]:
+            headers["X-Write-Position"] = str(write_position["value"])
 
         # Log de depuración
         print(f"\n=== Solicitud HTTP ===")
@@ -70,6 +77,10 @@ def main(page: ft.Page):
 
                 response.raise_for_status()  # Lanza una excepción para respuestas 4xx/5xx
 
+                position = response.headers.get("X-Write-Position")
+                if position and position.isdigit():
+                    write_position["value"] = max(write_position["value"], int(position))
+
                 if response.status_code == 204:  # Éxito sin contenido
                     return response
                 
@@ -0,0 +1,204 @@
+"""Prometheus metrics for the API, served at /metrics.
+
+MetricsMiddleware is plain ASGI: per request it resolves the route
+template (so /inventory/{item_id} is one series, not one per id), times
+the request and counts it. Database statements are counted through a
+query hook into a context variable set by the middleware, so each request
+reports how many queries it ran and how long they took in total.
+
+Under gunicorn every worker is a separate process. gunicorn.conf.py then
+sets PROMETHEUS_MULTIPROC_DIR: each worker writes its samples to files
+there and render() merges all of them, so a scrape answered by any one
+worker reports the whole server. Pool and status history buffer statistics
+live in each worker's memory, so they are copied into regular metrics (summed over the live
+workers) at most once per second while the worker serves requests, and
+on every scrape.
+"""
+import contextvars
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from starlette.routing import Match
+
+import database
+from history import status_history
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests handled', ['method', 'route', 'status'],
+)
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time to handle an HTTP request, body included', ['method', 'route'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests (and open streams) being handled', ['method', 'route'],
+    multiprocess_mode='livesum',
+)
+REQUEST_QUERIES = Histogram(
+    'db_queries_per_request', 'Database statements run by one request', ['route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_QUERY_SECONDS = Histogram(
+    'db_query_seconds_per_request', 'Total database statement time of one request', ['route'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'Time of a single database statement',
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+CHECKOUT_SECONDS = Histogram(
+    'db_pool_checkout_seconds', 'Time a request waited for a pooled connection (connect included)',
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .25, .5, 1, 2.5, 5),
+)
+INVENTORY_ROWS = Histogram(
+    'inventory_rows_returned', 'Items returned by one inventory list request', ['route'],
+    buckets=(0, 1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+
+
+class _RequestMetrics:
+    __slots__ = ('route', 'queries', 'query_seconds')
+
+    def __init__(self, route):
+        self.route = route
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def _observe_query(sql, params, seconds):
+    QUERY_SECONDS.observe(seconds)
+    state = _current.get()
+    if state is not None:
+        state.queries += 1
+        state.query_seconds += seconds
+
+
+database.add_query_hook(_observe_query)
+
+
+def observe_checkout(seconds):
+    CHECKOUT_SECONDS.observe(seconds)
+
+
+def observe_inventory_rows(count):
+    state = _current.get()
+    INVENTORY_ROWS.labels(state.route if state is not None else 'unknown').observe(count)
+
+
+class MetricsMiddleware:
+    """Records latency, status and in-flight count per (method, route template)."""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def _route_for(self, scope):
+        partial = None
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        # Unknown paths share one label so scanners can't blow up cardinality
+        return partial or 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        state = _RequestMetrics(self._route_for(scope))
+        token = _current.set(state)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        in_progress = IN_PROGRESS.labels(method, state.route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_SECONDS.labels(method, state.route).observe(time.perf_counter() - started)
+            REQUESTS.labels(method, state.route, str(status_code)).inc()
+            in_progress.dec()
+            REQUEST_QUERIES.labels(state.route).observe(state.queries)
+            REQUEST_QUERY_SECONDS.labels(state.route).observe(state.query_seconds)
+            _current.reset(token)
+            sync_process_stats()
+
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+SYNC_INTERVAL_SECONDS = 1.0
+
+POOL_GAUGES = {
+    key: Gauge(f'db_pool_{key}', f'Connection pool {key.replace("_", " ")}', multiprocess_mode='livesum')
+    for key in ('size', 'max_size', 'in_use', 'idle', 'waiting')
+}
+POOL_COUNTERS = {
+    key: Counter(f'db_pool_{key}', documentation)
+    for key, documentation in {
+        'acquired': 'Connections checked out of the pool',
+        'waits': 'Checkouts that had to wait for a free connection',
+        'timeouts': 'Checkouts that gave up after the acquire timeout',
+        'recycled': 'Connections replaced for being older than the recycle age',
+        'broken': 'Connections discarded after a failed ping or rollback',
+    }.items()
+}
+
+HISTORY_PENDING = Gauge(
+    'status_history_pending', 'estado_actual transitions buffered, not written yet', multiprocess_mode='livesum',
+)
+HISTORY_WRITTEN = Counter('status_history_written', 'estado_actual transitions written to inventory_status_history')
+HISTORY_DROPPED = Counter('status_history_dropped', 'estado_actual transitions dropped because the buffer was full')
+
+_last_sync = 0.0
+_counted = {}   # counter key -> total already added to the Counter
+
+
+def _add_total(counter, key, total):
+    """Increments ``counter`` by what ``total`` grew since the last call for ``key``."""
+    counted = _counted.get(key, 0)
+    if total < counted:  # the source was recreated and started over
+        counted = 0
+    if total > counted:
+        counter.inc(total - counted)
+    _counted[key] = total
+
+
+def sync_process_stats(force=False):
+    """Copies this process's pool and history buffer statistics into the metrics above."""
+    global _last_sync
+    now = time.monotonic()
+    if not force and now - _last_sync < SYNC_INTERVAL_SECONDS:
+        return
+    _last_sync = now
+    stats = database.pool_stats()
+    if stats is not None:
+        for key, gauge in POOL_GAUGES.items():
+            gauge.set(stats[key])
+        for key, counter in POOL_COUNTERS.items():
+            _add_total(counter, f'pool_{key}', stats[f'{key}_total'])
+    HISTORY_PENDING.set(status_history.pending_count)
+    _add_total(HISTORY_WRITTEN, 'history_written', status_history.written_total)
+    _add_total(HISTORY_DROPPED, 'history_dropped', status_history.dropped_total)
+
+
+def render():
+    """The /metrics body: this process's metrics, or every worker's under gunicorn."""
+    sync_process_stats(force=True)
+    if not MULTIPROCESS:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
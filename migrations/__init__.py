@@ -0,0 +1,147 @@
+"""Versioned schema migrations.
+
+Every ``mNNNN_<name>.py`` module in this package defines ``VERSION`` (its
+NNNN), a one-line ``DESCRIPTION`` and ``upgrade(cursor)``. ``migrate()``
+applies the migrations newer than the highest version recorded in the
+``schema_version`` table, in order, committing after each one. When the
+schema is current it costs a single query.
+
+Migrations must be safe to run against a database that already has some of
+their objects (databases created before this table existed); the helpers
+below probe the schema so that they are. DDL is written for MySQL and
+translated by the storage backend's dialect (see storage.py), so CREATE
+TABLE statements stick to what both backends understand: indexes go
+through create_index() rather than inline INDEX clauses.
+"""
+import importlib
+import pkgutil
+
+import storage
+
+_migrations = None
+
+
+def load_migrations():
+    """Returns the migration modules sorted by VERSION."""
+    global _migrations
+    if _migrations is None:
+        modules = []
+        for info in pkgutil.iter_modules(__path__):
+            if info.name.startswith('m') and info.name[1:5].isdigit():
+                modules.append(importlib.import_module(f"{__name__}.{info.name}"))
+        modules.sort(key=lambda module: module.VERSION)
+        versions = [module.VERSION for module in modules]
+        if len(set(versions)) != len(versions):
+            raise RuntimeError(f"Duplicate migration versions: {versions}")
+        _migrations = modules
+    return _migrations
+
+
+def latest_version():
+    migrations = load_migrations()
+    return migrations[-1].VERSION if migrations else 0
+
+
+def current_version(cursor):
+    """Returns the applied schema version, or None if schema_version doesn't exist yet."""
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+    except Exception as err:
+        if _dialect().is_no_such_table(err):
+            return None
+        raise
+    return cursor.fetchone()[0] or 0
+
+
+def migrate(conn):
+    """Applies pending migrations on ``conn`` and returns the resulting schema version."""
+    target = latest_version()
+    cursor = conn.cursor()
+    try:
+        version = current_version(cursor)
+        # End the read snapshot so the re-check below sees other workers' commits
+        conn.rollback()
+        if version == target:
+            print(f"Database schema is up to date (version {version}).")
+            return version
+        if version is not None and version > target:
+            raise RuntimeError(f"Database schema version {version} is newer than this code ({target})")
+
+        # Workers starting together must not migrate concurrently
+        with storage.get_storage().migration_lock(conn):
+            version = current_version(cursor)
+            conn.rollback()
+            if version is None:
+                cursor.execute(_dialect().ddl("""
+                    CREATE TABLE schema_version (
+                        version INT PRIMARY KEY,
+                        description VARCHAR(255) NOT NULL,
+                        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    )
+                """))
+                version = 0
+
+            for migration in load_migrations():
+                if migration.VERSION <= version:
+                    continue
+                print(f"Applying migration {migration.VERSION:04d}: {migration.DESCRIPTION}...")
+                migration.upgrade(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (migration.VERSION, migration.DESCRIPTION)
+                )
+                conn.commit()
+                version = migration.VERSION
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    print(f"Database schema migrated to version {version}.")
+    return version
+
+
+# --- Helpers for migration modules ---
+
+def _dialect():
+    return storage.get_storage().dialect
+
+
+def table_exists(cursor, table_name):
+    return _dialect().table_exists(cursor, table_name)
+
+
+def column_exists(cursor, table_name, column_name):
+    return _dialect().column_exists(cursor, table_name, column_name)
+
+
+def index_exists(cursor, table_name, index_name):
+    return _dialect().index_exists(cursor, table_name, index_name)
+
+
+def create_table(cursor, table_name, create_stmt):
+    """Runs ``create_stmt`` unless the table exists; returns True if it was created."""
+    if table_exists(cursor, table_name):
+        print(f"Table '{table_name}' already exists.")
+        return False
+    print(f"Creating table '{table_name}'...")
+    cursor.execute(_dialect().ddl(create_stmt))
+    return True
+
+
+def add_column(cursor, table_name, column_name, column_definition):
+    """Adds the column unless it exists; returns True if it was added."""
+    if column_exists(cursor, table_name, column_name):
+        return False
+    print(f"Adding column '{column_name}' to '{table_name}'...")
+    cursor.execute(_dialect().ddl(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}"))
+    return True
+
+
+def create_index(cursor, table_name, index_name, columns):
+    """Creates the index unless it exists; returns True if it was created."""
+    if index_exists(cursor, table_name, index_name):
+        return False
+    print(f"Creating index '{index_name}' on '{table_name}'...")
+    cursor.execute(f"CREATE INDEX {index_name} ON {table_name} ({columns})")
+    return True
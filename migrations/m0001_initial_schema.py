@@ -0,0 +1,38 @@
+from migrations import create_table
+
+VERSION = 1
+DESCRIPTION = "Create users, item_codes and inventory_items"
+
+
+def upgrade(cursor):
+    create_table(cursor, 'users', """
+        CREATE TABLE users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(255) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            full_name VARCHAR(255) NOT NULL,
+            is_admin BOOLEAN DEFAULT FALSE
+        )
+    """)
+    create_table(cursor, 'item_codes', """
+        CREATE TABLE item_codes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            codigo VARCHAR(50) UNIQUE NOT NULL,
+            tipo VARCHAR(50),
+            descripcion TEXT
+        )
+    """)
+    create_table(cursor, 'inventory_items', """
+        CREATE TABLE inventory_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            fecha_ingreso DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sn VARCHAR(255) NOT NULL UNIQUE,
+            item_code_id INT NOT NULL,
+            tipo_servicio VARCHAR(50) NOT NULL,
+            estado_actual VARCHAR(50) NOT NULL DEFAULT 'En Bodega',
+            asignado_a_id INT NULL,
+            terminal_comercio VARCHAR(255) NULL,
+            FOREIGN KEY (item_code_id) REFERENCES item_codes(id),
+            FOREIGN KEY (asignado_a_id) REFERENCES users(id)
+        )
+    """)
@@ -0,0 +1,27 @@
+import bcrypt
+
+VERSION = 2
+DESCRIPTION = "Seed the default admin user and item codes"
+
+
+def upgrade(cursor):
+    # Populate users with a default admin if not exists
+    cursor.execute("SELECT id FROM users WHERE username = 'admin'")
+    if cursor.fetchone() is None:
+        hashed_password = bcrypt.hashpw(b'admin', bcrypt.gensalt())
+        cursor.execute(
+            "INSERT INTO users (username, password_hash, full_name, is_admin) VALUES (%s, %s, %s, %s)",
+            ('admin', hashed_password.decode('utf-8'), 'Admin User', True)
+        )
+        print("Default admin user created.")
+
+    # Pre-populate item_codes if the table is empty
+    cursor.execute("SELECT COUNT(*) FROM item_codes")
+    if cursor.fetchone()[0] == 0:
+        item_codes_to_add = [
+            ('POS', 'Punto de Venta', 'Terminal para transacciones comerciales'),
+            ('PINPAD', 'Pinpad', 'Dispositivo para ingreso de PIN'),
+            ('SIM', 'Tarjeta SIM', 'Tarjeta para conectividad celular')
+        ]
+        cursor.executemany("INSERT INTO item_codes (codigo, tipo, descripcion) VALUES (%s, %s, %s)", item_codes_to_add)
+        print(f"{cursor.rowcount} item codes inserted.")
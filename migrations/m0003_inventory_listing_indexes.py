@@ -0,0 +1,21 @@
+from migrations import create_index
+
+VERSION = 3
+DESCRIPTION = "Add keyset and filter indexes for the inventory listings"
+
+# Listing endpoints filter on one column and page with a (fecha_ingreso, id)
+# keyset, so every listing index ends with those columns and a filtered page
+# is a single index range scan.
+INDEXES = {
+    'idx_inventory_fecha_id': "fecha_ingreso, id",
+    'idx_inventory_asignado_fecha_id': "asignado_a_id, fecha_ingreso, id",
+    'idx_inventory_estado_fecha_id': "estado_actual, fecha_ingreso, id",
+    'idx_inventory_code_fecha_id': "item_code_id, fecha_ingreso, id",
+    'idx_inventory_servicio_fecha_id': "tipo_servicio, fecha_ingreso, id",
+    'idx_inventory_terminal_fecha_id': "terminal_comercio, fecha_ingreso, id",
+}
+
+
+def upgrade(cursor):
+    for index_name, columns in INDEXES.items():
+        create_index(cursor, 'inventory_items', index_name, columns)
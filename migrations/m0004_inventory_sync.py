@@ -0,0 +1,36 @@
+from migrations import add_column, create_index, create_table
+
+VERSION = 4
+DESCRIPTION = "Track inventory change versions and tombstones for delta sync"
+
+
+def upgrade(cursor):
+    if add_column(cursor, 'inventory_items', 'row_version', "BIGINT NOT NULL DEFAULT 0"):
+        # Existing rows get row_version = id so a client syncing from version 0
+        # receives them all.
+        cursor.execute("UPDATE inventory_items SET row_version = id")
+    create_index(cursor, 'inventory_items', 'idx_inventory_row_version', "row_version")
+    create_index(cursor, 'inventory_items', 'idx_inventory_asignado_version', "asignado_a_id, row_version")
+
+    # Single-row counter handing out inventory change versions
+    if create_table(cursor, 'inventory_sync', """
+        CREATE TABLE inventory_sync (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    """):
+        cursor.execute("INSERT INTO inventory_sync (id, version) SELECT 1, COALESCE(MAX(row_version), 0) FROM inventory_items")
+
+    # Items that left someone's view: deleted (deleted = TRUE) or reassigned
+    # away from asignado_a_id (deleted = FALSE)
+    create_table(cursor, 'inventory_tombstones', """
+        CREATE TABLE inventory_tombstones (
+            row_version BIGINT NOT NULL,
+            item_id INT NOT NULL,
+            asignado_a_id INT NULL,
+            deleted BOOLEAN NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (row_version, item_id)
+        )
+    """)
+    create_index(cursor, 'inventory_tombstones', 'idx_tombstones_asignado_version', "asignado_a_id, row_version")
@@ -0,0 +1,20 @@
+from database import rebuild_inventory_stats
+from migrations import create_table
+
+VERSION = 5
+DESCRIPTION = "Add the inventory_stats counters behind /inventory/stats"
+
+
+def upgrade(cursor):
+    # Item counts per estado_actual, item_code_id and asignado_a_id ('' when
+    # unassigned), kept current by the write endpoints
+    if create_table(cursor, 'inventory_stats', """
+        CREATE TABLE inventory_stats (
+            dimension VARCHAR(20) NOT NULL,
+            bucket VARCHAR(255) NOT NULL,
+            total BIGINT NOT NULL,
+            PRIMARY KEY (dimension, bucket)
+        )
+    """):
+        print("Building inventory_stats from existing items...")
+        rebuild_inventory_stats(cursor)
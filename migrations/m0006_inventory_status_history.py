@@ -0,0 +1,21 @@
+from migrations import create_index, create_table
+
+VERSION = 6
+DESCRIPTION = "Add the append-only inventory_status_history table"
+
+
+def upgrade(cursor):
+    # One row per estado_actual transition, written in batches by history.py.
+    # No foreign keys: the history of a deleted item (or user) is kept.
+    create_table(cursor, 'inventory_status_history', """
+        CREATE TABLE inventory_status_history (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            item_id INT NOT NULL,
+            estado_anterior VARCHAR(50) NULL,
+            estado_nuevo VARCHAR(50) NOT NULL,
+            terminal_comercio VARCHAR(255) NULL,
+            changed_by_id INT NULL,
+            changed_at DATETIME(6) NOT NULL
+        )
+    """)
+    create_index(cursor, 'inventory_status_history', 'idx_status_history_item', "item_id, changed_at, id")
@@ -0,0 +1,19 @@
+from migrations import create_table
+
+VERSION = 7
+DESCRIPTION = "Track reference data versions for cross-worker cache invalidation"
+
+
+def upgrade(cursor):
+    # Change version of the last write to each cached reference data set
+    # (see api.py); workers poll it to drop their stale copies
+    if create_table(cursor, 'reference_versions', """
+        CREATE TABLE reference_versions (
+            name VARCHAR(50) PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    """):
+        cursor.executemany(
+            "INSERT INTO reference_versions (name, version) VALUES (%s, %s)",
+            [('item_codes', 0), ('technicians', 0)]
+        )
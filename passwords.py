@@ -0,0 +1,75 @@
+"""bcrypt hashing and verification on a dedicated process pool.
+
+bcrypt is tens of milliseconds of CPU per call and holds the GIL while it
+runs, so doing it in request threads stalls every other request on the
+worker. The pool lets logins use every core while the event loop keeps
+serving.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from config import PASSWORD_CONFIG
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Checked when the username doesn't exist, so that a login costs the same
+# bcrypt work either way and its timing doesn't reveal valid usernames.
+# Any well-formed hash does; the cost factor is the configured one.
+DUMMY_HASH = f"$2b${PASSWORD_CONFIG['bcrypt_rounds']:02d}$tnpDAvngvD8EhcF5nTyhhuKtXR1OxUGpqapNRF2WuLpdyBwgVIfyy"
+
+
+def _hash(password: bytes, rounds: int) -> str:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password: bytes, hashed: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = PASSWORD_CONFIG['workers'] or os.cpu_count() or 1
+                # spawn: forking a process that already runs server threads is unsafe
+                _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _hash, password.encode('utf-8'), PASSWORD_CONFIG['bcrypt_rounds'])
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _verify, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True when ``hashed`` wasn't produced with the configured cost factor."""
+    # bcrypt hashes look like $2b$12$<salt+digest>
+    parts = hashed.split('$')
+    try:
+        return int(parts[2]) != PASSWORD_CONFIG['bcrypt_rounds']
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,61 @@
+"""Background loop shared by the pollers and buffered writers of the API."""
+import asyncio
+
+
+class PeriodicTask:
+    """Awaits ``step()`` every ``interval`` seconds on the event loop, or sooner after wake().
+
+    The task is never cancelled: stop() lets the current step finish, or
+    runs one last step if the loop was waiting, so no statement is cut off
+    mid-flight. An exception from a step is printed (once until the message
+    changes) and the loop carries on.
+    """
+
+    def __init__(self, step, interval, description):
+        self.step = step
+        self.interval = interval
+        self.description = description
+        self.last_error = None
+        self._wakeup = None
+        self._stopping = False
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def start(self):
+        """Starts the loop; call it from the server's event loop."""
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def wake(self):
+        """Runs the next step now instead of at the end of the interval."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.step()
+                self.last_error = None
+            except Exception as err:
+                if str(err) != self.last_error:
+                    print(f"Could not {self.description}: {err}")
+                    self.last_error = str(err)
+            if self._stopping:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
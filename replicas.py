@@ -0,0 +1,144 @@
+"""Routes the read-only list endpoints to read replicas, with read-your-writes.
+
+Replication is asynchronous, so a replica may not have applied a write
+the user just made yet. Every write reserves a version from the
+inventory_sync counter (see repository.next_change_versions) and that
+counter row replicates like any other, so a replica's copy of it says how
+far it has caught up. The router remembers each user's last write version
+(their "write position") for READ_YOUR_WRITES_SECONDS. That memory is per
+worker process, so clients also get the position in the X-Write-Position
+response header and send the highest one back on every request (main.py
+does); that is what carries it to the other workers. A read needing
+position P only uses a replica whose counter is at P or later; otherwise
+it stays on the primary.
+
+Checking costs one primary-key SELECT on the replica, and only for users
+with a pending write position; the version each replica was last seen at
+is remembered, so once it has caught up the check is skipped.
+
+To try it locally, run two database instances with the second replicating
+from the first (or, with DB_BACKEND=sqlite, point DB_REPLICAS at a copy of
+the database file made with ``sqlite3 flet_inv.db ".backup replica.db"``)
+and set DB_REPLICAS to the second one.
+"""
+import time
+
+import storage
+from cache import TTLCache
+from config import POOL_CONFIG, REPLICA_CONFIG
+from database import AsyncConnectionPool, DatabaseError, PoolTimeout
+
+WRITE_POSITION_HEADER = "X-Write-Position"
+
+
+class _Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.version = 0            # highest inventory_sync version seen applied
+        self.skip_until = 0.0       # monotonic time; set after a failure
+        self.last_error = None
+
+
+class ReadRouter:
+    def __init__(self, backends, names, write_position_ttl=60.0, retry_seconds=5.0):
+        self._storages = list(zip(names, backends))
+        self._replicas = None
+        self._positions = TTLCache(ttl=write_position_ttl, maxsize=100000)
+        self.retry_seconds = retry_seconds
+        self._next = 0
+        # Cumulative counters exposed through stats()
+        self.routed = {"replica": 0, "primary_lagging": 0, "primary_unavailable": 0}
+
+    @property
+    def enabled(self):
+        return bool(self._storages)
+
+    def _get_replicas(self):
+        # Pools are created on first use, from the event loop
+        if self._replicas is None:
+            self._replicas = [
+                _Replica(name, AsyncConnectionPool(backend.open_connection, **POOL_CONFIG))
+                for name, backend in self._storages
+            ]
+        return self._replicas
+
+    def note_write(self, user_id, version):
+        """Records that ``user_id`` committed a write at ``version`` (call after commit)."""
+        if version > self._positions.get(user_id, 0):
+            self._positions.set(user_id, version)
+
+    def required_position(self, user_id, header_value=None):
+        """The version a read by ``user_id`` must see: their last write here or the one they sent."""
+        position = self._positions.get(user_id, 0)
+        if header_value:
+            try:
+                position = max(position, int(header_value))
+            except ValueError:
+                pass
+        return position
+
+    async def acquire(self, position=0):
+        """Returns (pool, connection) on a replica that has applied ``position``, or None.
+
+        None means the read should go to the primary: no replica is
+        configured, none has caught up, or none is reachable.
+        """
+        if not self.enabled:
+            return None
+        replicas = self._get_replicas()
+        now = time.monotonic()
+        lagging = False
+        for offset in range(len(replicas)):
+            replica = replicas[(self._next + offset) % len(replicas)]
+            if replica.skip_until > now:
+                continue
+            try:
+                conn = await replica.pool.acquire()
+            except (PoolTimeout, DatabaseError) as err:
+                self._mark_failed(replica, err)
+                continue
+            if position > replica.version:
+                try:
+                    # Also starts the snapshot the caller's reads will use
+                    row = await conn.fetchone("SELECT version FROM inventory_sync WHERE id = 1")
+                except DatabaseError as err:
+                    await replica.pool.release(conn)
+                    self._mark_failed(replica, err)
+                    continue
+                replica.version = max(replica.version, row['version'] if row else 0)
+                if position > replica.version:
+                    await replica.pool.release(conn)
+                    lagging = True
+                    continue
+            self._next = (self._next + offset + 1) % len(replicas)
+            self.routed["replica"] += 1
+            return replica.pool, conn
+        self.routed["primary_lagging" if lagging else "primary_unavailable"] += 1
+        return None
+
+    def _mark_failed(self, replica, err):
+        print(f"Read replica {replica.name} unavailable, using the primary for {self.retry_seconds:.0f}s: {err}")
+        replica.skip_until = time.monotonic() + self.retry_seconds
+        replica.last_error = str(err)
+
+    async def close(self):
+        if self._replicas is not None:
+            for replica in self._replicas:
+                await replica.pool.close()
+            self._replicas = None
+
+    def stats(self):
+        replicas = []
+        for replica in self._replicas or ():
+            replicas.append(dict(
+                replica.pool.stats(), name=replica.name, version=replica.version,
+                skipped=replica.skip_until > time.monotonic(), last_error=replica.last_error,
+            ))
+        return {"routed_total": dict(self.routed), "replicas": replicas}
+
+
+read_router = ReadRouter(
+    storage.get_replica_storages(), REPLICA_CONFIG['replicas'],
+    REPLICA_CONFIG['write_position_ttl'], REPLICA_CONFIG['retry_seconds'],
+)
@@ -0,0 +1,290 @@
+"""SQL used by the API endpoints, on top of database.AsyncConnection.
+
+Every function takes the request's connection as its first argument and
+leaves transaction boundaries (commit/rollback) to the caller, except for
+the single-statement user writes that commit themselves.
+"""
+import collections
+from typing import Optional
+
+from database import REBUILD_STATS_STATEMENTS
+
+# --- Users -----------------------------------------------------------------
+
+async def get_user_status(db, user_id: int) -> dict:
+    """Returns {'is_admin': ...} for an existing user, or {} if it was removed."""
+    row = await db.fetchone("SELECT is_admin FROM users WHERE id = %s", (user_id,))
+    return {'is_admin': bool(row['is_admin'])} if row else {}
+
+async def get_login_user(db, username: str) -> Optional[dict]:
+    return await db.fetchone(
+        "SELECT id, username, full_name, is_admin, password_hash FROM users WHERE username = %s",
+        (username,)
+    )
+
+async def set_password_hash(db, user_id: int, password_hash: str):
+    await db.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+    await db.commit()
+
+async def create_user(db, username: str, password_hash: str, full_name: str, is_admin: bool) -> int:
+    """Creates a user and returns the change version of the write (see replicas.py)."""
+    await db.execute(
+        "INSERT INTO users (username, password_hash, full_name, is_admin) VALUES (%s, %s, %s, %s)",
+        (username, password_hash, full_name, is_admin)
+    )
+    version = await next_change_versions(db)
+    await set_reference_version(db, 'technicians', version)
+    await db.commit()
+    return version
+
+# --- Reference data --------------------------------------------------------
+
+async def get_reference_versions(db) -> dict:
+    """Returns {name: change version of its last write} for the cached reference data."""
+    rows = await db.fetchall("SELECT name, version FROM reference_versions")
+    return {row['name']: row['version'] for row in rows}
+
+async def set_reference_version(db, name: str, version: int):
+    await db.execute("UPDATE reference_versions SET version = %s WHERE name = %s", (version, name))
+
+async def list_item_codes(db) -> list:
+    return await db.fetchall("SELECT id, codigo, tipo, descripcion FROM item_codes ORDER BY codigo")
+
+async def list_technicians(db) -> list:
+    rows = await db.fetchall("SELECT id, username, full_name, is_admin FROM users ORDER BY full_name")
+    for row in rows:
+        row['is_admin'] = bool(row['is_admin'])
+    return rows
+
+async def existing_ids(db, table: str, ids: set) -> set:
+    """Returns which of ``ids`` exist in ``table`` (users or item_codes)."""
+    if not ids:
+        return set()
+    placeholders = ", ".join(["%s"] * len(ids))
+    return set(await db.fetchcolumn(f"SELECT id FROM {table} WHERE id IN ({placeholders})", list(ids)))
+
+# --- Inventory reads -------------------------------------------------------
+
+INVENTORY_SELECT = """
+    SELECT
+        i.id, i.fecha_ingreso, i.sn, i.tipo_servicio, i.estado_actual, i.terminal_comercio,
+        i.item_code_id, i.asignado_a_id, i.row_version,
+        ic.codigo as item_code_codigo, ic.tipo as item_code_tipo, ic.descripcion as item_code_descripcion,
+        u.username as user_username, u.full_name as user_full_name, u.is_admin as user_is_admin
+    FROM inventory_items i
+    JOIN item_codes ic ON i.item_code_id = ic.id
+    LEFT JOIN users u ON i.asignado_a_id = u.id
+"""
+
+def _inventory_query(conditions: list, order_by: str) -> str:
+    query = INVENTORY_SELECT
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + " ORDER BY " + order_by
+
+async def list_items(db, conditions: list, params: list, limit: Optional[int] = None) -> list:
+    """INVENTORY_SELECT rows matching ``conditions``, newest first."""
+    query = _inventory_query(conditions, "i.fecha_ingreso DESC, i.id DESC")
+    params = list(params)
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return await db.fetchall(query, params)
+
+def stream_items(db, conditions: list, params: list, chunk_size: int):
+    """Async iterator over the matching rows in id order, ``chunk_size`` rows at a time."""
+    return db.stream(_inventory_query(conditions, "i.id"), params, chunk_size)
+
+async def fetch_item(db, item_id: int) -> Optional[dict]:
+    """Fetches one item with its item code and assigned user in a single query."""
+    return await db.fetchone(INVENTORY_SELECT + " WHERE i.id = %s", (item_id,))
+
+async def item_exists(db, item_id: int) -> bool:
+    return await db.fetchone("SELECT id FROM inventory_items WHERE id = %s", (item_id,)) is not None
+
+async def taken_sns(db, sns: list) -> list:
+    """Returns which of ``sns`` are already registered (as stored)."""
+    placeholders = ", ".join(["%s"] * len(sns))
+    return await db.fetchcolumn(f"SELECT sn FROM inventory_items WHERE sn IN ({placeholders})", sns)
+
+async def ids_by_sn(db, sns: list) -> list:
+    """Returns (sn, id) rows for the given serial numbers."""
+    placeholders = ", ".join(["%s"] * len(sns))
+    rows = await db.fetchall(f"SELECT sn, id FROM inventory_items WHERE sn IN ({placeholders})", sns)
+    return [(row['sn'], row['id']) for row in rows]
+
+async def get_changes(db, since: int, limit: int, user_id: Optional[int] = None):
+    """Returns (current_version, items, tombstones) for GET /inventory/changes.
+
+    Both lists hold up to ``limit + 1`` entries with a version in
+    (since, current_version], in version order. With ``user_id`` only that
+    technician's items and tombstones are returned; without it, only the
+    tombstones of deleted items.
+    """
+    # Everything below reads from the same snapshot as this version
+    row = await db.fetchone("SELECT version FROM inventory_sync WHERE id = 1")
+    current_version = row['version']
+
+    item_conditions = ["i.row_version > %s", "i.row_version <= %s"]
+    tombstone_conditions = ["row_version > %s", "row_version <= %s"]
+    params = [since, current_version]
+    if user_id is None:
+        tombstone_conditions.append("deleted")
+    else:
+        item_conditions.append("i.asignado_a_id = %s")
+        tombstone_conditions.append("asignado_a_id = %s")
+        params.append(user_id)
+
+    items = await db.fetchall(
+        INVENTORY_SELECT + " WHERE " + " AND ".join(item_conditions) + " ORDER BY i.row_version LIMIT %s",
+        params + [limit + 1]
+    )
+    tombstones = await db.fetchall(
+        "SELECT item_id, row_version FROM inventory_tombstones WHERE " + " AND ".join(tombstone_conditions) + " ORDER BY row_version LIMIT %s",
+        params + [limit + 1]
+    )
+    return current_version, items, tombstones
+
+async def get_change_log(db, since: int, limit: int):
+    """Returns (current_version, items, tombstones) for the event relay (see events.py).
+
+    Like get_changes for an admin, but with every tombstone, reassignments
+    included, and its previous assignee.
+    """
+    row = await db.fetchone("SELECT version FROM inventory_sync WHERE id = 1")
+    current_version = row['version']
+    items = await db.fetchall(
+        INVENTORY_SELECT + " WHERE i.row_version > %s AND i.row_version <= %s ORDER BY i.row_version LIMIT %s",
+        (since, current_version, limit + 1)
+    )
+    tombstones = await db.fetchall(
+        """
+        SELECT item_id, row_version, asignado_a_id, deleted FROM inventory_tombstones
+        WHERE row_version > %s AND row_version <= %s ORDER BY row_version LIMIT %s
+        """,
+        (since, current_version, limit + 1)
+    )
+    return current_version, items, tombstones
+
+async def get_status_history(db, item_id: int) -> list:
+    """Transitions of one item, oldest first (served by idx_status_history_item)."""
+    return await db.fetchall(
+        """
+        SELECT h.id, h.item_id, h.estado_anterior, h.estado_nuevo, h.terminal_comercio,
+               h.changed_by_id, u.username AS changed_by_username, h.changed_at
+        FROM inventory_status_history h
+        LEFT JOIN users u ON h.changed_by_id = u.id
+        WHERE h.item_id = %s
+        ORDER BY h.changed_at, h.id
+        """,
+        (item_id,)
+    )
+
+async def get_stats_counters(db) -> list:
+    return await db.fetchall("SELECT dimension, bucket, total FROM inventory_stats WHERE total <> 0")
+
+# --- Inventory writes ------------------------------------------------------
+
+async def next_change_versions(db, count: int = 1) -> int:
+    """Reserves ``count`` inventory change versions and returns the highest one.
+
+    The counter row stays locked until the caller commits, so versions become
+    visible in increasing order and GET /inventory/changes never skips a
+    write that commits late. Every writer queues on that one lock, so call
+    this last, right before writing: after the checks that may reject the
+    request and after lock_item, and commit soon after. Writers then all take
+    item locks before the counter, never the other way round.
+    """
+    result = await db.execute(db.dialect.increment_counter("inventory_sync", "version", "id = 1"), (count,))
+    if db.dialect.counter_in_lastrowid:
+        return result.lastrowid
+    row = await db.fetchone("SELECT version FROM inventory_sync WHERE id = 1")
+    return row['version']
+
+ITEM_STATE_SELECT = "SELECT id, item_code_id, estado_actual, asignado_a_id FROM inventory_items WHERE id = %s"
+
+async def lock_item(db, item_id: int) -> Optional[dict]:
+    """Reads the current state of an item and locks it until commit."""
+    await db.begin_write()
+    return await db.fetchone(ITEM_STATE_SELECT + db.dialect.for_update, (item_id,))
+
+INSERT_ITEM = """
+    INSERT INTO inventory_items
+    (sn, item_code_id, tipo_servicio, estado_actual, asignado_a_id, terminal_comercio, row_version)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+def _item_values(item, version: int) -> tuple:
+    return (item.sn, item.item_code_id, item.tipo_servicio, item.estado_actual, item.asignado_a_id, item.terminal_comercio, version)
+
+async def insert_item(db, item, version: int) -> int:
+    """Inserts an InventoryItemCreate and returns its id."""
+    result = await db.execute(INSERT_ITEM, _item_values(item, version))
+    return result.lastrowid
+
+async def insert_items(db, items_with_versions: list):
+    """Inserts (InventoryItemCreate, version) pairs with one multi-row INSERT."""
+    await db.executemany(INSERT_ITEM, [_item_values(item, version) for item, version in items_with_versions])
+
+async def update_item(db, item_id: int, version: int, fields: dict):
+    """Sets the given columns (trusted names) and the row version of one item."""
+    assignments = ", ".join(f"{column} = %s" for column in fields)
+    await db.execute(
+        f"UPDATE inventory_items SET row_version = %s, {assignments} WHERE id = %s",
+        [version, *fields.values(), item_id]
+    )
+
+async def delete_item(db, item_id: int):
+    await db.execute("DELETE FROM inventory_items WHERE id = %s", (item_id,))
+
+async def add_tombstone(db, version: int, item_id: int, asignado_a_id: Optional[int], deleted: bool):
+    await db.execute(
+        "INSERT INTO inventory_tombstones (row_version, item_id, asignado_a_id, deleted) VALUES (%s, %s, %s, %s)",
+        (version, item_id, asignado_a_id, deleted)
+    )
+
+STATS_DIMENSIONS = (
+    ('estado', 'estado_actual'),
+    ('item_code', 'item_code_id'),
+    ('tecnico', 'asignado_a_id'),
+)
+
+async def apply_stats_delta(db, removed=(), added=()):
+    """Moves inventory_stats counters from the ``removed`` item states to the ``added`` ones.
+
+    Items are dicts (or models) with estado_actual, item_code_id and
+    asignado_a_id. All counter changes go out as one multi-row upsert.
+    """
+    deltas = collections.Counter()
+    for sign, items in ((-1, removed), (1, added)):
+        for item in items:
+            for dimension, field in STATS_DIMENSIONS:
+                value = item[field] if isinstance(item, dict) else getattr(item, field)
+                deltas[(dimension, '' if value is None else str(value))] += sign
+    rows = [(dimension, bucket, total) for (dimension, bucket), total in deltas.items() if total]
+    if rows:
+        # Built by hand: the driver only batches executemany() INSERTs
+        # without a row alias
+        placeholders = ", ".join(["(%s, %s, %s)"] * len(rows))
+        upsert = db.dialect.upsert_increment("inventory_stats", ("dimension", "bucket"), "total")
+        await db.execute(
+            f"INSERT INTO inventory_stats (dimension, bucket, total) VALUES {placeholders} {upsert}",
+            [value for row in rows for value in row]
+        )
+
+async def insert_status_history(db, entries: list):
+    """Appends buffered transitions (dicts from history.py) with one multi-row INSERT."""
+    await db.executemany(
+        """
+        INSERT INTO inventory_status_history
+        (item_id, estado_anterior, estado_nuevo, terminal_comercio, changed_by_id, changed_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """,
+        [(e['item_id'], e['estado_anterior'], e['estado_nuevo'], e['terminal_comercio'], e['changed_by_id'], e['changed_at'])
+         for e in entries]
+    )
+
+async def rebuild_stats(db):
+    """Async counterpart of database.rebuild_inventory_stats()."""
+    for statement in REBUILD_STATS_STATEMENTS:
+        await db.execute(statement)
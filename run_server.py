@@ -2,6 +2,8 @@ import uvicorn
 from api import app
 
 if __name__ == "__main__":
+    # Servidor de desarrollo (un solo proceso). En producción se usa
+    # gunicorn -c gunicorn.conf.py api:app (ver gunicorn.conf.py)
     # Ejecutar el servidor en 0.0.0.0 para hacerlo accesible en la red local
     # El puerto 8000 es el predeterminado
     uvicorn.run(app, host="0.0.0.0", port=8000)
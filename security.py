@@ -0,0 +1,32 @@
+"""Signed access tokens for the API.
+
+Tokens are HS256 JWTs carrying the user's id and admin flag, so checking
+one is pure CPU work; see api.get_current_user_from_token.
+"""
+from datetime import datetime, timedelta, timezone
+
+from jose import jwt, JWTError
+
+from config import AUTH_CONFIG
+
+__all__ = ["create_access_token", "decode_access_token", "JWTError"]
+
+
+def create_access_token(user: dict) -> str:
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": user['username'],
+        "id": user['id'],
+        "is_admin": bool(user['is_admin']),
+        "iat": now,
+        "exp": now + timedelta(minutes=AUTH_CONFIG['access_token_expire_minutes']),
+    }
+    return jwt.encode(claims, AUTH_CONFIG['secret_key'], algorithm=AUTH_CONFIG['algorithm'])
+
+
+def decode_access_token(token: str) -> dict:
+    """Returns the token claims; raises JWTError if it's forged, malformed or expired."""
+    claims = jwt.decode(token, AUTH_CONFIG['secret_key'], algorithms=[AUTH_CONFIG['algorithm']])
+    if not isinstance(claims.get("id"), int) or "sub" not in claims:
+        raise JWTError("Token is missing required claims")
+    return claims
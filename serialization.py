@@ -0,0 +1,32 @@
+"""JSON encoding for the API's hot list endpoints.
+
+Endpoints that return large lists build plain dicts straight from the
+database rows and encode them here, instead of going through Pydantic
+models and FastAPI's response_model validation.
+"""
+import json
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json is ~3x slower but correct
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    """Encodes ``obj`` as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class JSONBytesResponse(Response):
+    """Response whose content is already-encoded JSON bytes, or anything dumps() accepts."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
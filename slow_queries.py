@@ -0,0 +1,130 @@
+"""Opt-in log of slow SQL statements, aggregated by statement shape.
+
+Installed as a database query hook. Statements slower than the threshold
+are grouped by fingerprint (whitespace collapsed, IN lists and multi-row
+VALUES folded), with call counts, timings and the shape of the last
+parameters (types and lengths, never the values). The first time a slow
+SELECT is seen, its EXPLAIN plan is captured in the background on a spare
+pooled connection, so a missing index shows up next to the statement
+(``type: ALL`` on MySQL, ``SCAN`` with SQLite's EXPLAIN QUERY PLAN).
+
+Enable with SLOW_QUERY_LOG=1; the aggregate is served at
+GET /debug/slow-queries.
+"""
+import asyncio
+import re
+import time
+from datetime import datetime
+
+from database import get_pool, pool_stats, DatabaseError, PoolTimeout
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(VALUES \([^()]*\))(?:, \([^()]*\))+", re.IGNORECASE)
+
+
+def fingerprint(sql):
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _VALUES_ROWS.sub(r"\1, ...", sql)
+
+
+def _value_shape(value):
+    if value is None:
+        return "None"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def param_shape(params):
+    """Describes parameters without their values, e.g. ['int', 'str(12)'] or '500 x [...]'."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _value_shape(value) for key, value in params.items()}
+    params = list(params)
+    if params and isinstance(params[0], (list, tuple)):
+        # executemany()
+        return f"{len(params)} x {[_value_shape(value) for value in params[0]]}"
+    return [_value_shape(value) for value in params]
+
+
+class SlowQueryLog:
+
+    def __init__(self, threshold_ms=200.0, explain=True, max_statements=500):
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self.max_statements = max_statements
+        self.statements = {}  # fingerprint -> aggregate dict
+        self._explaining = False
+
+    def observe(self, sql, params, seconds):
+        """Query hook (see database.add_query_hook)."""
+        if seconds < self.threshold:
+            return
+        key = fingerprint(sql)
+        if key.upper().startswith("EXPLAIN"):
+            # Our own plan captures
+            return
+        entry = self.statements.get(key)
+        if entry is None:
+            if len(self.statements) >= self.max_statements:
+                return
+            entry = self.statements[key] = {
+                "statement": key,
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "last_seen": None,
+                "params": None,
+                "explain": None,
+            }
+            print(f"Slow query ({seconds * 1000:.0f} ms): {key}")
+        entry["count"] += 1
+        entry["total_ms"] += seconds * 1000
+        entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+        entry["last_seen"] = datetime.now().isoformat()
+        entry["params"] = param_shape(params)
+        if self.explain and entry["explain"] is None and not self._explaining and key.upper().startswith("SELECT"):
+            self._schedule_explain(entry, sql, params)
+
+    def _schedule_explain(self, entry, sql, params):
+        stats = pool_stats()
+        if stats is None or stats["idle"] == 0:
+            # Don't compete with requests for a connection; retry next time
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._explaining = True
+        loop.create_task(self._explain(entry, sql, params))
+
+    async def _explain(self, entry, sql, params):
+        pool = get_pool()
+        try:
+            conn = await pool.acquire()
+            try:
+                started = time.perf_counter()
+                # EXPLAIN doesn't run the statement (nor take FOR UPDATE locks)
+                plan = await conn.fetchall(conn.dialect.explain_prefix + sql, params)
+                entry["explain"] = plan
+                entry["explain_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            finally:
+                await pool.release(conn)
+        except (PoolTimeout, DatabaseError) as err:
+            entry["explain"] = {"error": str(err)}
+        finally:
+            self._explaining = False
+
+    def top(self, limit=20, order_by="total_ms"):
+        entries = sorted(self.statements.values(), key=lambda entry: entry[order_by], reverse=True)
+        return [
+            dict(entry, avg_ms=round(entry["total_ms"] / entry["count"], 2),
+                 total_ms=round(entry["total_ms"], 2), max_ms=round(entry["max_ms"], 2))
+            for entry in entries[:limit]
+        ]
+
+    def reset(self):
+        self.statements.clear()
@@ -0,0 +1,546 @@
+"""Storage backends behind database.py: MySQL, and SQLite for offline work.
+
+A backend opens the synchronous connection used by the migrations, the
+async connections pooled for the API (database.AsyncConnection) and the
+lock that serializes migrations. Its dialect covers the SQL that differs
+between the two: placeholders, DDL, row locks, upserts, the version
+counter and schema introspection. SQL elsewhere is written once, in the
+MySQL flavour with %s placeholders, and only asks the dialect for the
+parts that differ.
+
+Select the backend with DB_BACKEND=mysql (default) or DB_BACKEND=sqlite;
+the SQLite file (SQLITE_PATH) is opened in WAL mode so readers don't
+block the writer. SQLite needs no server, which makes it handy for
+benchmarks and local runs; it serializes writers, so it isn't meant for
+production.
+"""
+import asyncio
+import contextlib
+import re
+import sqlite3
+import string
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from config import DB_CONFIG, REPLICA_CONFIG, STORAGE_CONFIG
+from database import AsyncConnection, DatabaseError, ExecResult, IntegrityError
+
+try:
+    import aiomysql
+    from pymysql.constants import ER
+except ImportError:  # only needed with DB_BACKEND=mysql
+    aiomysql = None
+
+# Named lock so that workers starting together don't migrate concurrently
+MIGRATION_LOCK_NAME = 'flet_inv_schema_migrations'
+MIGRATION_LOCK_TIMEOUT_SECONDS = 120
+
+
+# --- Dialects --------------------------------------------------------------
+
+class MySQLDialect:
+    name = 'mysql'
+    # Appended to a SELECT to lock the rows it reads until commit
+    for_update = " FOR UPDATE"
+    explain_prefix = "EXPLAIN "
+    # The counter statement returns the new value as the result's lastrowid
+    counter_in_lastrowid = True
+
+    def ddl(self, statement):
+        return statement
+
+    def increment_counter(self, table, column, where):
+        """UPDATE adding %s to ``column``; see counter_in_lastrowid."""
+        return f"UPDATE {table} SET {column} = LAST_INSERT_ID({column} + %s) WHERE {where}"
+
+    def upsert_increment(self, table, keys, column):
+        """Clause turning a multi-row INSERT into "add ``column`` to the existing row"."""
+        return f"AS delta ON DUPLICATE KEY UPDATE {column} = {table}.{column} + delta.{column}"
+
+    def is_no_such_table(self, err):
+        return getattr(err, 'errno', None) == 1146  # ER_NO_SUCH_TABLE
+
+    def collation_key(self, value):
+        """Approximates utf8mb4_unicode_ci (setup_database.py): case and accents are ignored.
+
+        Only an approximation; the UNIQUE index has the last word.
+        """
+        decomposed = unicodedata.normalize('NFKD', value)
+        return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+    def table_exists(self, cursor, table_name):
+        cursor.execute(
+            "SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (table_name,)
+        )
+        return cursor.fetchone()[0] > 0
+
+    def column_exists(self, cursor, table_name, column_name):
+        cursor.execute(
+            "SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (table_name, column_name)
+        )
+        return cursor.fetchone()[0] > 0
+
+    def index_exists(self, cursor, table_name, index_name):
+        cursor.execute(
+            "SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+            (table_name, index_name)
+        )
+        return cursor.fetchone()[0] > 0
+
+
+_AUTO_INCREMENT_PK = re.compile(r"\b(?:BIG)?INT AUTO_INCREMENT PRIMARY KEY\b", re.IGNORECASE)
+_VARCHAR = re.compile(r"\bVARCHAR\(\d+\)", re.IGNORECASE)
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+class SQLiteDialect:
+    name = 'sqlite'
+    # Writers take the database lock when their transaction starts (BEGIN
+    # IMMEDIATE), so there are no row locks to ask for
+    for_update = ""
+    explain_prefix = "EXPLAIN QUERY PLAN "
+    counter_in_lastrowid = False
+
+    def ddl(self, statement):
+        """Translates MySQL DDL: AUTO_INCREMENT keys and case-insensitive VARCHARs.
+
+        MySQL compares VARCHARs case-insensitively (the default collation),
+        so usernames and serial numbers stay unique regardless of case.
+        """
+        statement = _AUTO_INCREMENT_PK.sub("INTEGER PRIMARY KEY AUTOINCREMENT", statement)
+        return _VARCHAR.sub(lambda match: match.group(0) + " COLLATE NOCASE", statement)
+
+    def increment_counter(self, table, column, where):
+        return f"UPDATE {table} SET {column} = {column} + %s WHERE {where}"
+
+    def upsert_increment(self, table, keys, column):
+        return f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {column} = {table}.{column} + excluded.{column}"
+
+    def is_no_such_table(self, err):
+        return isinstance(err, sqlite3.OperationalError) and str(err).startswith("no such table")
+
+    def collation_key(self, value):
+        """Equal for values that COLLATE NOCASE considers equal: only ASCII letters fold."""
+        return value.translate(_ASCII_LOWER)
+
+    def table_exists(self, cursor, table_name):
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s", (table_name,))
+        return cursor.fetchone()[0] > 0
+
+    def column_exists(self, cursor, table_name, column_name):
+        cursor.execute("SELECT COUNT(*) FROM pragma_table_info(%s) WHERE name = %s", (table_name, column_name))
+        return cursor.fetchone()[0] > 0
+
+    def index_exists(self, cursor, table_name, index_name):
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+            (table_name, index_name)
+        )
+        return cursor.fetchone()[0] > 0
+
+
+# --- MySQL -----------------------------------------------------------------
+
+def _wrap_mysql_error(err):
+    """Turns an aiomysql (PyMySQL) exception into a DatabaseError."""
+    args = err.args
+    errno = args[0] if args and isinstance(args[0], int) else None
+    msg = args[1] if len(args) > 1 else str(err)
+    if isinstance(err, aiomysql.IntegrityError):
+        if errno == ER.DUP_ENTRY:
+            kind = 'duplicate'
+        elif errno in (ER.NO_REFERENCED_ROW, ER.NO_REFERENCED_ROW_2):
+            kind = 'foreign_key'
+        else:
+            kind = None
+        return IntegrityError(errno, msg, kind)
+    return DatabaseError(errno, msg)
+
+
+def _aiomysql_config(config):
+    """Maps a mysql.connector config dict to aiomysql.connect() arguments."""
+    return {
+        'host': config['host'],
+        'port': config.get('port', 3306),
+        'user': config['user'],
+        'password': config['password'],
+        'db': config['database'],
+        'auth_plugin': config.get('auth_plugin', ''),
+        'charset': 'utf8mb4',
+        'autocommit': False,
+    }
+
+
+class MySQLConnection(AsyncConnection):
+    """An aiomysql connection; ``raw`` is the driver's connection."""
+
+    dialect = MySQLDialect()
+
+    def __init__(self, raw):
+        super().__init__()
+        self.raw = raw
+
+    async def _run(self, cursor, sql, params, many=False):
+        async def run():
+            try:
+                if many:
+                    await cursor.executemany(sql, params)
+                else:
+                    await cursor.execute(sql, params)
+            except aiomysql.MySQLError as err:
+                raise _wrap_mysql_error(err) from err
+        await self._execute(sql, params, run)
+
+    async def execute(self, sql, params=None):
+        async with self.raw.cursor() as cursor:
+            await self._run(cursor, sql, params)
+            return ExecResult(cursor.rowcount, cursor.lastrowid)
+
+    async def executemany(self, sql, seq_params):
+        """Runs a statement once per parameter set; INSERTs become one multi-row statement."""
+        async with self.raw.cursor() as cursor:
+            await self._run(cursor, sql, seq_params, many=True)
+            return ExecResult(cursor.rowcount, cursor.lastrowid)
+
+    async def fetchone(self, sql, params=None):
+        async with self.raw.cursor(aiomysql.DictCursor) as cursor:
+            await self._run(cursor, sql, params)
+            return await cursor.fetchone()
+
+    async def fetchall(self, sql, params=None):
+        async with self.raw.cursor(aiomysql.DictCursor) as cursor:
+            await self._run(cursor, sql, params)
+            return list(await cursor.fetchall())
+
+    async def fetchcolumn(self, sql, params=None):
+        async with self.raw.cursor() as cursor:
+            await self._run(cursor, sql, params)
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def stream(self, sql, params=None, size=1000):
+        """Yields lists of up to ``size`` rows read from an unbuffered cursor.
+
+        Rows are pulled from the server as the caller consumes them instead
+        of materializing the whole result set. If the caller stops early the
+        connection still has unread rows, so it is marked for discard.
+        """
+        self.discard = True
+        cursor = await self.raw.cursor(aiomysql.SSDictCursor)
+        await self._run(cursor, sql, params)
+        while True:
+            try:
+                rows = await cursor.fetchmany(size)
+            except aiomysql.MySQLError as err:
+                raise _wrap_mysql_error(err) from err
+            if not rows:
+                break
+            yield rows
+        await cursor.close()
+        self.discard = False
+
+    async def begin_write(self):
+        # InnoDB locks the rows each statement touches (for_update)
+        pass
+
+    async def commit(self):
+        try:
+            await self.raw.commit()
+        except aiomysql.MySQLError as err:
+            raise _wrap_mysql_error(err) from err
+
+    async def rollback(self):
+        try:
+            await self.raw.rollback()
+        except (aiomysql.MySQLError, OSError) as err:
+            raise DatabaseError(None, str(err)) from err
+
+    async def ping(self):
+        try:
+            await self.raw.ping(reconnect=False)
+        except (aiomysql.MySQLError, OSError) as err:
+            raise DatabaseError(None, str(err)) from err
+
+    def close(self):
+        self.raw.close()
+
+    @property
+    def closed(self):
+        return self.raw.closed
+
+
+class MySQLStorage:
+    dialect = MySQLDialect()
+
+    def __init__(self, config):
+        self.config = config
+
+    def connect(self):
+        """Synchronous mysql.connector connection; raises mysql.connector.Error on failure."""
+        import mysql.connector
+        try:
+            return mysql.connector.connect(**self.config)
+        except mysql.connector.Error as e:
+            print(f"\nError connecting to MySQL: {e}")
+            print("\nTroubleshooting tips:")
+            print(f"1. Check if MySQL server is running on {self.config['host']}")
+            print(f"2. Verify the username '{self.config['user']}' and password in config.py")
+            raise
+
+    async def open_connection(self):
+        config = _aiomysql_config(self.config)
+        try:
+            raw = await aiomysql.connect(**config)
+        except aiomysql.MySQLError as err:
+            raise _wrap_mysql_error(err) from err
+        except OSError as err:
+            raise DatabaseError(None, f"Can't connect to MySQL server on {config['host']}: {err}") from err
+        return MySQLConnection(raw)
+
+    @contextlib.contextmanager
+    def migration_lock(self, conn):
+        """Holds a server-wide named lock on ``conn``."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT_SECONDS))
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError("Timed out waiting for the schema migration lock")
+            try:
+                yield
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+                cursor.fetchone()
+        finally:
+            cursor.close()
+
+
+# --- SQLite ----------------------------------------------------------------
+
+def _qmark(sql):
+    return sql.replace("%s", "?")
+
+
+# DATETIME columns are stored as ISO text ("2024-05-01 13:45:00"), the same
+# format as CURRENT_TIMESTAMP, so they sort and compare as text
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+
+class _SQLiteCursor(sqlite3.Cursor):
+    """Cursor accepting the %s placeholders used everywhere else."""
+
+    def execute(self, sql, params=()):
+        return super().execute(_qmark(sql), params)
+
+    def executemany(self, sql, seq_params):
+        return super().executemany(_qmark(sql), seq_params)
+
+
+class _SQLiteConnection(sqlite3.Connection):
+    def cursor(self, factory=_SQLiteCursor):
+        return super().cursor(factory)
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _wrap_sqlite_error(err):
+    msg = str(err)
+    if isinstance(err, sqlite3.IntegrityError):
+        if msg.startswith("UNIQUE constraint failed"):
+            kind = 'duplicate'
+        elif msg.startswith("FOREIGN KEY constraint failed"):
+            kind = 'foreign_key'
+        else:
+            kind = None
+        return IntegrityError(None, msg, kind)
+    return DatabaseError(None, msg)
+
+
+class SQLiteConnection(AsyncConnection):
+    """A sqlite3 connection driven from its own thread.
+
+    sqlite3 calls block, so each connection runs them on a dedicated
+    single-thread executor; the event loop only awaits the result.
+    """
+
+    dialect = SQLiteDialect()
+
+    def __init__(self, raw, executor):
+        super().__init__()
+        self.raw = raw
+        self._executor = executor
+        self._closed = False
+
+    async def _call(self, function, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        except sqlite3.Error as err:
+            raise _wrap_sqlite_error(err) from err
+
+    def _cursor_execute(self, sql, params, many=False, dict_rows=False):
+        cursor = self.raw.cursor()
+        if dict_rows:
+            cursor.row_factory = _dict_row
+        if many:
+            cursor.executemany(sql, params)
+        else:
+            cursor.execute(sql, params or ())
+        return cursor
+
+    async def execute(self, sql, params=None):
+        def run():
+            cursor = self._cursor_execute(sql, params)
+            return ExecResult(cursor.rowcount, cursor.lastrowid)
+        return await self._execute(sql, params, lambda: self._call(run))
+
+    async def executemany(self, sql, seq_params):
+        def run():
+            cursor = self._cursor_execute(sql, seq_params, many=True)
+            return ExecResult(cursor.rowcount, cursor.lastrowid)
+        return await self._execute(sql, seq_params, lambda: self._call(run))
+
+    async def fetchone(self, sql, params=None):
+        return await self._execute(
+            sql, params, lambda: self._call(lambda: self._cursor_execute(sql, params, dict_rows=True).fetchone())
+        )
+
+    async def fetchall(self, sql, params=None):
+        return await self._execute(
+            sql, params, lambda: self._call(lambda: self._cursor_execute(sql, params, dict_rows=True).fetchall())
+        )
+
+    async def fetchcolumn(self, sql, params=None):
+        def run():
+            return [row[0] for row in self._cursor_execute(sql, params).fetchall()]
+        return await self._execute(sql, params, lambda: self._call(run))
+
+    async def stream(self, sql, params=None, size=1000):
+        """Yields lists of up to ``size`` rows, stepping the statement as the caller consumes them."""
+        self.discard = True
+        cursor = await self._execute(
+            sql, params, lambda: self._call(lambda: self._cursor_execute(sql, params, dict_rows=True))
+        )
+        while True:
+            rows = await self._call(cursor.fetchmany, size)
+            if not rows:
+                break
+            yield rows
+        await self._call(cursor.close)
+        self.discard = False
+
+    async def begin_write(self):
+        # Takes the database write lock now, so reads that follow see what
+        # this transaction will update
+        def begin():
+            if not self.raw.in_transaction:
+                self.raw.execute("BEGIN IMMEDIATE")
+        await self._execute("BEGIN IMMEDIATE", None, lambda: self._call(begin))
+
+    async def commit(self):
+        await self._call(self.raw.commit)
+
+    async def rollback(self):
+        await self._call(self.raw.rollback)
+
+    async def ping(self):
+        await self._call(lambda: self.raw.execute("SELECT 1").fetchone())
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._executor.submit(self.raw.close)
+            self._executor.shutdown(wait=False)
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class SQLiteStorage:
+    dialect = SQLiteDialect()
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+    def _open(self, **kwargs):
+        conn = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, detect_types=sqlite3.PARSE_DECLTYPES,
+            factory=_SQLiteConnection, **kwargs
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Durable at checkpoints instead of every commit; safe with WAL
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def connect(self):
+        return self._open()
+
+    async def open_connection(self):
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        # Every write transaction takes the write lock up front (BEGIN
+        # IMMEDIATE), so two writers can't deadlock upgrading read locks
+        open_raw = lambda: self._open(isolation_level='IMMEDIATE')
+        try:
+            raw = await asyncio.get_running_loop().run_in_executor(executor, open_raw)
+        except sqlite3.Error as err:
+            executor.shutdown(wait=False)
+            raise DatabaseError(None, f"Can't open SQLite database {self.path}: {err}") from err
+        return SQLiteConnection(raw, executor)
+
+    @contextlib.contextmanager
+    def migration_lock(self, conn):
+        """Holds an exclusive transaction on a lock file next to the database.
+
+        Migrations commit after each step, so they can't hold a lock on the
+        database itself for the whole run.
+        """
+        lock = sqlite3.connect(f"{self.path}.migrate-lock", timeout=MIGRATION_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+        try:
+            try:
+                lock.execute("BEGIN EXCLUSIVE")
+            except sqlite3.OperationalError as err:
+                raise RuntimeError("Timed out waiting for the schema migration lock") from err
+            try:
+                yield
+            finally:
+                lock.execute("ROLLBACK")
+        finally:
+            lock.close()
+
+
+_storage = None
+
+def get_storage():
+    """Returns the backend selected by STORAGE_CONFIG."""
+    global _storage
+    if _storage is None:
+        backend = STORAGE_CONFIG['backend']
+        if backend == 'mysql':
+            _storage = MySQLStorage(DB_CONFIG)
+        elif backend == 'sqlite':
+            _storage = SQLiteStorage(STORAGE_CONFIG['sqlite_path'], STORAGE_CONFIG['sqlite_busy_timeout'])
+        else:
+            raise ValueError(f"Unknown DB_BACKEND {backend!r}; expected 'mysql' or 'sqlite'")
+    return _storage
+
+
+def get_replica_storages():
+    """Returns a backend per configured read replica (see replicas.py).
+
+    MySQL replicas are ``host[:port]`` entries sharing DB_CONFIG's
+    credentials and database name; SQLite replicas are file paths.
+    """
+    storages = []
+    for entry in REPLICA_CONFIG['replicas']:
+        if STORAGE_CONFIG['backend'] == 'sqlite':
+            storages.append(SQLiteStorage(entry, STORAGE_CONFIG['sqlite_busy_timeout']))
+        else:
+            host, _, port = entry.partition(':')
+            storages.append(MySQLStorage(dict(DB_CONFIG, host=host, port=int(port or 3306))))
+    return storages
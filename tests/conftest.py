@@ -0,0 +1,70 @@
+"""Runs the API against a throwaway SQLite database (DB_BACKEND=sqlite).
+
+The environment is set here, before any test imports config.py. One
+database and one app instance are shared by the whole session, so tests
+use their own serial numbers (unique_sn) and compare against versions
+they read first instead of assuming an empty database.
+"""
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix='flet-inv-tests-')
+os.environ.update({
+    'DB_BACKEND': 'sqlite',
+    'SQLITE_PATH': os.path.join(_DB_DIR, 'flet_inv.db'),
+    'SECRET_KEY': 'test-secret-key',
+    'BCRYPT_ROUNDS': '4',
+    'PASSWORD_HASH_WORKERS': '1',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_sn_counter = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+    import api
+
+    with TestClient(api.app) as test_client:
+        # Migrations run in the background (see health.py)
+        deadline = time.monotonic() + 30
+        while not test_client.get('/readyz').json()['ready']:
+            assert time.monotonic() < deadline, "database never became ready"
+            time.sleep(0.05)
+        yield test_client
+
+
+def _login(client, username, password):
+    response = client.post('/auth', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.text
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope='session')
+def admin(client):
+    """Authorization headers of the seeded admin user."""
+    return _login(client, 'admin', 'admin')
+
+
+@pytest.fixture(scope='session')
+def technician(client, admin):
+    """(user id, authorization headers) of a non-admin user."""
+    response = client.post('/users', headers=admin, json={
+        'username': 'tecnico_test', 'password': 'secreto', 'full_name': 'Tecnico Test',
+    })
+    assert response.status_code == 201, response.text
+    users = client.get('/users/technicians', headers=admin).json()
+    user_id = next(user['id'] for user in users if user['username'] == 'tecnico_test')
+    return user_id, _login(client, 'tecnico_test', 'secreto')
+
+
+@pytest.fixture
+def unique_sn():
+    """Returns a function making serial numbers no other test uses."""
+    return lambda prefix='T': f"{prefix}-{next(_sn_counter):06d}"
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+
+from jose import jwt
+
+import api
+
+
+def test_unknown_username_still_runs_a_password_check(client, monkeypatch):
+    checked = []
+    real_verify = api.verify_password
+
+    async def verify_password(password, hashed):
+        checked.append(hashed)
+        return await real_verify(password, hashed)
+
+    monkeypatch.setattr(api, 'verify_password', verify_password)
+    response = client.post('/auth', json={'username': 'nobody-by-this-name', 'password': 'admin'})
+    assert response.status_code == 401
+    assert checked == [api.DUMMY_HASH]
+
+
+def login(client, username, password):
+    response = client.post('/auth', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.text
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+def update_user(**assignments):
+    """Changes a user straight in the database, as another admin tool would."""
+    username = assignments.pop('username')
+    with sqlite3.connect(os.environ['SQLITE_PATH']) as conn:
+        if assignments.pop('delete', False):
+            conn.execute("DELETE FROM users WHERE username = ?", (username,))
+        for column, value in assignments.items():
+            conn.execute(f"UPDATE users SET {column} = ? WHERE username = ?", (value, username))
+
+
+def test_forged_and_malformed_tokens_are_rejected(client):
+    forged = jwt.encode({'sub': 'admin', 'id': 1, 'is_admin': True}, 'not-the-secret', algorithm='HS256')
+    for token in (forged, 'not-a-jwt'):
+        response = client.get('/item-codes', headers={'Authorization': f"Bearer {token}"})
+        assert response.status_code == 401
+
+
+def test_demoted_and_removed_users_lose_access_once_their_status_expires(client, admin):
+    response = client.post('/users', headers=admin, json={
+        'username': 'revocado', 'password': 'secreto', 'full_name': 'Revocado', 'is_admin': True,
+    })
+    assert response.status_code == 201
+    headers = login(client, 'revocado', 'secreto')
+    assert client.get('/users/technicians', headers=headers).status_code == 200
+
+    update_user(username='revocado', is_admin=0)
+    # Still admin until the cached status expires (TOKEN_REVOCATION_CHECK_TTL)
+    assert client.get('/users/technicians', headers=headers).status_code == 200
+    api._user_status_cache.clear()
+    assert client.get('/users/technicians', headers=headers).status_code == 403
+
+    update_user(username='revocado', delete=True)
+    api._user_status_cache.clear()
+    assert client.get('/item-codes', headers=headers).status_code == 401
@@ -0,0 +1,136 @@
+import asyncio
+
+import api
+from database import get_pool
+from events import ChangeRelay, EventBroker
+
+
+def event(version, asignado_a_id=None, previous_asignado_a_id=None):
+    return {'type': 'updated', 'version': version, 'item_id': version,
+            'asignado_a_id': asignado_a_id, 'previous_asignado_a_id': previous_asignado_a_id}
+
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+async def take(subscription):
+    return drain(subscription)
+
+
+async def poll(relay):
+    pool = get_pool()
+    conn = await pool.acquire()
+    try:
+        await relay._poll(conn)
+    finally:
+        await pool.release(conn)
+
+
+def test_technicians_only_get_events_of_their_items():
+    async def scenario():
+        broker = EventBroker()
+        admin = broker.subscribe({'id': 1, 'is_admin': True})
+        technician = broker.subscribe({'id': 7, 'is_admin': False})
+        for published in (event(1, asignado_a_id=7), event(2, asignado_a_id=8), event(3, 8, previous_asignado_a_id=7)):
+            broker.publish(published)
+        return [e['version'] for e in drain(admin)], [e['version'] for e in drain(technician)]
+
+    assert asyncio.run(scenario()) == ([1, 2, 3], [1, 3])
+
+
+def test_a_subscriber_that_falls_behind_is_disconnected():
+    async def scenario():
+        broker = EventBroker(queue_size=2)
+        slow = broker.subscribe({'id': 1, 'is_admin': True})
+        for version in range(1, 4):
+            broker.publish(event(version))
+        return drain(slow), broker.subscriber_count
+
+    events, subscribers = asyncio.run(scenario())
+    assert events[-1] is None
+    assert subscribers == 0
+
+
+def test_relay_publishes_committed_changes_in_version_order(client, admin, technician, unique_sn):
+    technician_id, _ = technician
+    broker = EventBroker()
+
+    async def subscribe():
+        return broker.subscribe({'id': technician_id, 'is_admin': False})
+
+    subscription = client.portal.call(subscribe)
+    relay = ChangeRelay(broker, api._row_to_dict)
+    # The first poll only records where to start from
+    client.portal.call(poll, relay)
+    start = relay.version
+
+    mine = client.post('/inventory', headers=admin, json={'sn': unique_sn('relay'), 'item_code_id': 1, 'asignado_a_id': technician_id}).json()
+    client.post('/inventory', headers=admin, json={'sn': unique_sn('relay'), 'item_code_id': 1})
+    client.put(f"/inventory/{mine['id']}", headers=admin, json=dict(mine, asignado_a_id=None))
+    client.portal.call(poll, relay)
+
+    events = client.portal.call(take, subscription)
+    assert relay.version == start + 3
+    # Coalesced: the item was created and reassigned away between polls
+    assert [(e['type'], e['item_id'], e['previous_asignado_a_id']) for e in events] == [('updated', mine['id'], technician_id)]
+    assert events[0]['item']['asignado_a_id'] is None
+
+
+def test_bulk_larger_than_a_queue_keeps_subscribers_connected(client, admin, technician, unique_sn):
+    technician_id, _ = technician
+    count = api.event_broker.queue_size + 50
+
+    async def subscribe():
+        return api.event_broker.subscribe({'id': technician_id, 'is_admin': False})
+
+    async def unsubscribe(subscription):
+        events = drain(subscription)
+        api.event_broker.unsubscribe(subscription)
+        return events
+
+    subscription = client.portal.call(subscribe)
+    items = [{'sn': unique_sn('sse'), 'item_code_id': 1, 'asignado_a_id': technician_id} for _ in range(count)]
+    response = client.post('/inventory/bulk', headers=admin, json={'items': items})
+    last = int(response.headers['X-Write-Position'])
+    assert subscription in api.event_broker._subscriptions
+
+    events = client.portal.call(unsubscribe, subscription)
+    assert None not in events
+    assert [(e['type'], e['from_version'], e['version'], e['asignado_a_ids']) for e in events] == [
+        ('bulk', last - count + 1, last, [technician_id]),
+    ]
+
+
+def test_relay_coalesces_large_pages(client, admin, unique_sn):
+    broker = EventBroker(queue_size=8)
+
+    async def subscribe():
+        return broker.subscribe({'id': 1, 'is_admin': True})
+
+    subscription = client.portal.call(subscribe)
+    relay = ChangeRelay(broker, api._row_to_dict)
+    client.portal.call(poll, relay)
+    start = relay.version
+    client.post('/inventory/bulk', headers=admin, json={'items': [{'sn': unique_sn('sse'), 'item_code_id': 1} for _ in range(20)]})
+    client.portal.call(poll, relay)
+
+    events = client.portal.call(take, subscription)
+    assert broker.subscriber_count == 1
+    assert [(e['type'], e['from_version'], e['version']) for e in events] == [('bulk', start + 1, start + 20)]
+
+
+def test_stream_that_never_starts_leaves_no_subscription(client):
+    from test_inventory_api import send_nothing
+
+    async def abort_stream():
+        before = api.event_broker.subscriber_count
+        response = await api.inventory_events(request=None, current_user={'id': 1, 'is_admin': True})
+        await send_nothing(response)
+        return before, api.event_broker.subscriber_count
+
+    before, after = client.portal.call(abort_stream)
+    assert after == before
@@ -0,0 +1,43 @@
+import api
+from history import StatusHistoryBuffer
+
+
+def record(buffer, item_id):
+    buffer.record(item_id, None, 'En Bodega', None, 1)
+
+
+def test_buffer_reports_room_and_drops_the_oldest_on_overflow():
+    buffer = StatusHistoryBuffer(max_pending=3)
+    for item_id in (1, 2):
+        record(buffer, item_id)
+    assert buffer.has_room(1) and not buffer.has_room(2)
+
+    record(buffer, 3)
+    record(buffer, 4)
+    assert buffer.dropped_total == 1
+    assert buffer.pending_for(1) == []
+    assert [entry['item_id'] for entry in buffer.pending_for(4)] == [4]
+
+
+def test_writes_are_refused_while_the_buffer_is_full(client, admin, unique_sn, monkeypatch):
+    monkeypatch.setattr(api.status_history, 'max_pending', api.status_history.pending_count)
+    response = client.post('/inventory', headers=admin, json={'sn': unique_sn(), 'item_code_id': 1})
+    assert response.status_code == 503
+    response = client.post('/inventory/bulk', headers=admin, json={'items': [{'sn': unique_sn(), 'item_code_id': 1}]})
+    assert response.status_code == 503
+
+
+def test_history_lists_each_transition_once(client, admin, technician, unique_sn):
+    technician_id, technician_headers = technician
+    item = client.post('/inventory', headers=admin, json={
+        'sn': unique_sn('hist'), 'item_code_id': 1, 'asignado_a_id': technician_id,
+    }).json()
+    for estado in ('Instalado', 'Instalado', 'En Bodega'):
+        response = client.patch(f"/inventory/{item['id']}/status", headers=technician_headers, json={'estado_actual': estado})
+        assert response.status_code == 200
+
+    # Whether or not the buffer was flushed in between
+    history = client.get(f"/inventory/{item['id']}/history", headers=technician_headers).json()
+    assert [(entry['estado_anterior'], entry['estado_nuevo']) for entry in history] == [
+        (None, 'En Bodega'), ('En Bodega', 'Instalado'), ('Instalado', 'En Bodega'),
+    ]
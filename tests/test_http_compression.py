@@ -0,0 +1,68 @@
+import asyncio
+import gzip
+
+import pytest
+
+from http_compression import brotli, negotiate, precompress
+
+
+@pytest.mark.parametrize('accept_encoding, available, expected', [
+    (None, ('br', 'gzip'), None),
+    ('', ('br', 'gzip'), None),
+    ('identity', ('br', 'gzip'), None),
+    ('gzip', ('br', 'gzip'), 'gzip'),
+    ('gzip, br', ('br', 'gzip'), 'br'),                  # server preference on a tie
+    ('br;q=0.5, gzip', ('br', 'gzip'), 'gzip'),
+    ('GZIP;q=0.8', ('br', 'gzip'), 'gzip'),
+    ('*', ('br', 'gzip'), 'br'),
+    ('*;q=0.1, gzip;q=0', ('br', 'gzip'), 'br'),
+    ('gzip;q=0', ('br', 'gzip'), None),
+    ('br;q=oops, gzip;q=0.1', ('br', 'gzip'), 'gzip'),
+    ('br', ('gzip',), None),
+])
+def test_negotiate(accept_encoding, available, expected):
+    assert negotiate(accept_encoding, available) == expected
+
+
+def test_precompress_builds_every_variant_above_the_minimum():
+    body = b'{"codigo": "POS-A920"}' * 200
+    assert asyncio.run(precompress(body[:10], minimum_size=1024)) == {}
+    variants = asyncio.run(precompress(body, minimum_size=1024))
+    assert gzip.decompress(variants['gzip']) == body
+    if brotli is not None:
+        assert brotli.decompress(variants['br']) == body
+
+
+def _inventory(client, headers, accept_encoding):
+    # A page big enough to be compressed
+    for n in range(20):
+        client.post('/inventory', headers=headers, json={'sn': f'gz-{accept_encoding}-{n}', 'item_code_id': 1})
+    return client.get('/inventory', headers=dict(headers, **{'Accept-Encoding': accept_encoding}))
+
+
+def test_large_responses_use_the_negotiated_encoding(client, admin):
+    plain = _inventory(client, admin, 'identity')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers.get_list('Vary') == ['Accept-Encoding']
+
+    gzipped = _inventory(client, admin, 'gzip')
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers.get_list('Vary') == ['Accept-Encoding']
+    # httpx decoded the body
+    assert gzipped.json()[0]['sn']
+
+    if brotli is not None:
+        assert _inventory(client, admin, 'br, gzip').headers['Content-Encoding'] == 'br'
+
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get('/healthz', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers.get_list('Vary') == ['Accept-Encoding']
+
+
+def test_precompressed_reference_data_sends_vary_once(client, admin):
+    for accept_encoding in ('identity', 'gzip', 'br'):
+        response = client.get('/item-codes', headers=dict(admin, **{'Accept-Encoding': accept_encoding}))
+        assert response.status_code == 200
+        assert response.headers.get_list('Vary') == ['Accept-Encoding']
@@ -0,0 +1,313 @@
+import itertools
+
+
+def write_position(response):
+    """The change version of a write, from its X-Write-Position header."""
+    return int(response.headers['X-Write-Position'])
+
+
+def create_item(client, headers, sn, **fields):
+    response = client.post('/inventory', headers=headers, json=dict({'sn': sn, 'item_code_id': 1}, **fields))
+    assert response.status_code == 201, response.text
+    return response
+
+
+def all_changes(client, headers, since, limit):
+    """Follows GET /inventory/changes pages; returns (pages, final version, deleted ids, items by id)."""
+    pages, deleted, items = 0, [], {}
+    while True:
+        page = client.get('/inventory/changes', headers=headers, params={'since': since, 'limit': limit}).json()
+        pages += 1
+        assert page['version'] >= since
+        assert len(page['items']) <= limit and len(page['deleted']) <= limit
+        deleted.extend(page['deleted'])
+        for item in page['items']:
+            items[item['id']] = item
+        since = page['version']
+        if not page['has_more']:
+            return pages, since, deleted, items
+
+
+# --- Create ----------------------------------------------------------------
+
+def test_create_returns_the_item_with_its_references(client, admin, technician, unique_sn):
+    technician_id, _ = technician
+    sn = unique_sn()
+    item = create_item(client, admin, sn, asignado_a_id=technician_id, terminal_comercio='T-1').json()
+    assert item['sn'] == sn
+    assert item['item_code']['id'] == 1
+    assert item['asignado_a']['username'] == 'tecnico_test'
+    assert client.get(f"/inventory/{item['id']}/history", headers=admin).json()[0]['estado_nuevo'] == 'En Bodega'
+
+
+def test_duplicate_sn_is_rejected_regardless_of_case(client, admin, unique_sn):
+    sn = unique_sn('dup')
+    create_item(client, admin, sn)
+    response = client.post('/inventory', headers=admin, json={'sn': sn.upper(), 'item_code_id': 1})
+    assert response.status_code == 400
+    assert response.json()['detail'] == f"Ya existe un ítem con el número de serie: {sn.upper()}"
+
+
+def test_unknown_references_get_the_same_errors_as_bulk(client, admin, unique_sn):
+    response = client.post('/inventory', headers=admin, json={'sn': unique_sn(), 'item_code_id': 999})
+    assert response.status_code == 400
+    assert response.json()['detail'] == "El código de ítem 999 no existe"
+
+    response = client.post('/inventory', headers=admin, json={'sn': unique_sn(), 'item_code_id': 1, 'asignado_a_id': 999})
+    assert response.status_code == 400
+    assert response.json()['detail'] == "El usuario 999 no existe"
+
+
+# --- Bulk ------------------------------------------------------------------
+
+def test_bulk_reports_each_rejected_row(client, admin, unique_sn):
+    stored = unique_sn('bulk')
+    create_item(client, admin, stored)
+    first, second = unique_sn('bulk'), unique_sn('bulk')
+    payload = [
+        {'sn': first, 'item_code_id': 1},
+        {'sn': stored, 'item_code_id': 1},                      # already registered
+        {'sn': first.upper(), 'item_code_id': 1},               # repeated in the payload
+        {'sn': unique_sn('bulk'), 'item_code_id': 999},         # unknown item code
+        {'sn': unique_sn('bulk'), 'item_code_id': 1, 'asignado_a_id': 999},
+        {'sn': second, 'item_code_id': 2},
+    ]
+    response = client.post('/inventory/bulk', headers=admin, json={'items': payload})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result['created'], result['failed']) == (2, 4)
+    assert [row['ok'] for row in result['results']] == [True, False, False, False, False, True]
+    errors = [row['error'] for row in result['results']]
+    assert errors[1] == f"Ya existe un ítem con el número de serie: {stored}"
+    assert errors[2] == f"Ya existe un ítem con el número de serie: {first.upper()}"
+    assert errors[3] == "El código de ítem 999 no existe"
+    assert errors[4] == "El usuario 999 no existe"
+
+    stored_sns = {item['sn'] for item in client.get('/inventory', headers=admin).json()}
+    assert {first, second} <= stored_sns
+
+
+def test_bulk_and_single_insert_apply_the_same_uniqueness_rule(client, admin, unique_sn):
+    def variants(base):
+        return [f"{base}-e", f"{base.upper()}-E", f"{base}-é"]
+
+    single = [
+        client.post('/inventory', headers=admin, json={'sn': sn, 'item_code_id': 1}).status_code == 201
+        for sn in variants(unique_sn('regla'))
+    ]
+    response = client.post('/inventory/bulk', headers=admin, json={
+        'items': [{'sn': sn, 'item_code_id': 1} for sn in variants(unique_sn('regla'))],
+    })
+    assert [row['ok'] for row in response.json()['results']] == single
+    # SQLite's NOCASE only folds ASCII letters
+    assert single == [True, False, True]
+
+
+def test_bulk_rows_the_database_rejects_are_retried_one_by_one(client, admin, unique_sn, monkeypatch):
+    import storage
+
+    # A key that misses what the collation folds, so only the INSERT notices
+    monkeypatch.setattr(storage.SQLiteDialect, 'collation_key', lambda self, value: value)
+    sn = unique_sn('fold')
+    response = client.post('/inventory/bulk', headers=admin, json={
+        'items': [{'sn': sn, 'item_code_id': 1}, {'sn': sn.upper(), 'item_code_id': 1}, {'sn': unique_sn('fold'), 'item_code_id': 1}],
+    })
+    result = response.json()
+    assert [row['ok'] for row in result['results']] == [True, False, True]
+    assert result['results'][1]['error'] == f"Ya existe un ítem con el número de serie: {sn.upper()}"
+
+
+def test_bulk_conflict_at_insert_fails_only_the_conflicting_row(client, admin, unique_sn, monkeypatch):
+    import api
+
+    stored = unique_sn('race')
+    create_item(client, admin, stored)
+    real_taken_sns = api.repository.taken_sns
+    calls = []
+
+    async def taken_sns(db, sns):
+        # The first (pre-insert) check misses it, as if another request
+        # registered the SN right after
+        calls.append(sns)
+        return [] if len(calls) == 1 else await real_taken_sns(db, sns)
+
+    monkeypatch.setattr(api.repository, 'taken_sns', taken_sns)
+    others = [unique_sn('race') for _ in range(3)]
+    response = client.post('/inventory/bulk', headers=admin, json={
+        'items': [{'sn': sn, 'item_code_id': 1} for sn in [others[0], stored, *others[1:]]],
+    })
+    result = response.json()
+    assert (result['created'], result['failed']) == (3, 1)
+    assert result['results'][1]['error'] == f"Ya existe un ítem con el número de serie: {stored}"
+    assert all(row['ok'] and row['id'] for i, row in enumerate(result['results']) if i != 1)
+
+
+def test_bulk_spanning_several_chunks_gets_one_version_per_row(client, admin, unique_sn):
+    import api
+
+    before = write_position(create_item(client, admin, unique_sn()))
+    count = api.BULK_CHUNK_SIZE * 2 + 7
+    response = client.post('/inventory/bulk', headers=admin, json={
+        'items': [{'sn': unique_sn('chunk'), 'item_code_id': 1} for _ in range(count)],
+    })
+    assert response.json()['created'] == count
+    assert write_position(response) == before + count
+    assert len({row['id'] for row in response.json()['results']}) == count
+
+
+# --- Keyset paging ---------------------------------------------------------
+
+def test_keyset_pages_cover_every_item_once_in_order(client, admin, unique_sn):
+    terminal = unique_sn('pages')
+    # Bulk rows share their fecha_ingreso, so the id tie-break is exercised
+    client.post('/inventory/bulk', headers=admin, json={
+        'items': [{'sn': unique_sn('page'), 'item_code_id': 1, 'terminal_comercio': terminal} for _ in range(23)],
+    })
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {'limit': 5, 'terminal_comercio': terminal}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get('/inventory', headers=admin, params=params)
+        assert response.status_code == 200
+        seen.extend(response.json())
+        pages += 1
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+
+    assert pages == 5
+    assert len(seen) == 23 and len({item['id'] for item in seen}) == 23
+    keys = [(item['fecha_ingreso'], item['id']) for item in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_technicians_only_page_through_their_own_items(client, admin, technician, unique_sn):
+    technician_id, technician_headers = technician
+    terminal = unique_sn('mine')
+    for assigned in (technician_id, None, technician_id):
+        create_item(client, admin, unique_sn(), asignado_a_id=assigned, terminal_comercio=terminal)
+    items = client.get('/inventory/my-items', headers=technician_headers,
+                       params={'limit': 1, 'terminal_comercio': terminal})
+    assert len(items.json()) == 1 and 'X-Next-Cursor' in items.headers
+    rest = client.get('/inventory/my-items', headers=technician_headers,
+                      params={'limit': 1, 'terminal_comercio': terminal, 'cursor': items.headers['X-Next-Cursor']})
+    assert 'X-Next-Cursor' not in rest.headers
+    assert {item['asignado_a_id'] for item in items.json() + rest.json()} == {technician_id}
+
+
+# --- Export ----------------------------------------------------------------
+
+async def send_nothing(response):
+    """Sends ``response`` to a client that is already gone."""
+    async def send(message):
+        raise OSError("client went away")
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    try:
+        await response({'type': 'http', 'asgi': {'spec_version': '2.4'}}, receive, send)
+    except Exception:
+        pass
+
+
+def test_export_streams_every_matching_row(client, admin, unique_sn):
+    terminal = unique_sn('export')
+    client.post('/inventory/bulk', headers=admin, json={
+        'items': [{'sn': unique_sn('export'), 'item_code_id': 1, 'terminal_comercio': terminal} for _ in range(3)],
+    })
+    response = client.get('/inventory/export', headers=admin, params={'terminal_comercio': terminal})
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert len(response.text.splitlines()) == 3
+
+
+def test_export_that_never_starts_returns_its_connection(client, admin):
+    import api
+
+    async def abort_export():
+        in_use = api.get_pool().stats()['in_use']
+        response = await api.export_inventory(api.InventoryFilters(), admin={'id': 1, 'is_admin': True})
+        held = api.get_pool().stats()['in_use']
+        await send_nothing(response)
+        return in_use, held, api.get_pool().stats()['in_use']
+
+    in_use, held, after = client.portal.call(abort_export)
+    assert held == in_use + 1
+    assert after == in_use
+
+
+# --- Delta sync ------------------------------------------------------------
+
+def test_changes_pages_include_updates_and_tombstones(client, admin, technician, unique_sn):
+    technician_id, technician_headers = technician
+    since = write_position(create_item(client, admin, unique_sn()))
+
+    kept, updated, deleted, reassigned = (
+        create_item(client, admin, unique_sn('sync'), asignado_a_id=technician_id).json() for _ in range(4)
+    )
+    for _ in range(5):
+        create_item(client, admin, unique_sn('sync'))
+    response = client.put(f"/inventory/{updated['id']}", headers=admin, json={
+        'sn': updated['sn'], 'item_code_id': 1, 'tipo_servicio': 'retiro',
+        'estado_actual': 'En Comercio', 'asignado_a_id': technician_id,
+    })
+    assert response.status_code == 200
+    assert client.delete(f"/inventory/{deleted['id']}", headers=admin).status_code == 204
+    response = client.put(f"/inventory/{reassigned['id']}", headers=admin, json={
+        'sn': reassigned['sn'], 'item_code_id': 1, 'tipo_servicio': 'implementacion', 'asignado_a_id': None,
+    })
+    last = write_position(response)
+
+    pages, version, deleted_ids, items = all_changes(client, admin, since, limit=3)
+    assert pages > 1
+    assert version == last
+    assert deleted_ids == [deleted['id']]
+    assert deleted['id'] not in items
+    assert items[updated['id']]['estado_actual'] == 'En Comercio'
+    assert len(items) == 3 + 5
+
+    # The technician also learns that the reassigned item left their view
+    _, _, deleted_ids, items = all_changes(client, technician_headers, since, limit=2)
+    assert sorted(deleted_ids) == sorted([deleted['id'], reassigned['id']])
+    assert set(items) == {kept['id'], updated['id']}
+
+    # Nothing new after the last version
+    page = client.get('/inventory/changes', headers=admin, params={'since': last}).json()
+    assert page == {'version': last, 'has_more': False, 'deleted': [], 'items': []}
+
+
+# --- Stats -----------------------------------------------------------------
+
+def test_incremental_stats_match_a_rebuild(client, admin, technician, unique_sn):
+    technician_id, technician_headers = technician
+    items = [create_item(client, admin, unique_sn('stats'), item_code_id=code).json()
+             for code in itertools.islice(itertools.cycle((1, 2, 3)), 6)]
+    client.post('/inventory/bulk', headers=admin, json={'items': [
+        {'sn': unique_sn('stats'), 'item_code_id': 2, 'estado_actual': 'Asignado a Tecnico', 'asignado_a_id': technician_id}
+        for _ in range(4)
+    ]})
+    client.put(f"/inventory/{items[0]['id']}", headers=admin, json={
+        'sn': items[0]['sn'], 'item_code_id': 3, 'tipo_servicio': 'x',
+        'estado_actual': 'Asignado a Tecnico', 'asignado_a_id': technician_id,
+    })
+    assert client.patch(f"/inventory/{items[0]['id']}/status", headers=technician_headers,
+                        json={'estado_actual': 'En Comercio'}).status_code == 200
+    client.delete(f"/inventory/{items[1]['id']}", headers=admin)
+
+    incremental = client.get('/inventory/stats', headers=admin).json()
+    assert client.post('/inventory/stats/rebuild', headers=admin).status_code == 200
+    rebuilt = client.get('/inventory/stats', headers=admin).json()
+
+    def normalized(stats):
+        # Buckets whose count went back to zero only exist incrementally
+        return {
+            'total': stats['total'],
+            'por_estado': {key: value for key, value in stats['por_estado'].items() if value},
+            'por_codigo': [entry for entry in stats['por_codigo'] if entry['total']],
+            'por_tecnico': [entry for entry in stats['por_tecnico'] if entry['total']],
+        }
+
+    assert normalized(incremental) == normalized(rebuilt)
+    assert rebuilt['total'] == len(client.get('/inventory', headers=admin).json())
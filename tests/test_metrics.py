@@ -0,0 +1,9 @@
+def test_requests_are_counted_per_route_template(client, admin):
+    for item_id in (999998, 999999):
+        client.get(f"/inventory/{item_id}/history", headers=admin)
+    body = client.get('/metrics').text
+
+    assert 'http_requests_total{method="GET",route="/inventory/{item_id}/history",status="404"}' in body
+    assert '/inventory/999999' not in body
+    assert 'db_queries_per_request_count{route="/inventory/{item_id}/history"}' in body
+    assert 'db_pool_checkout_seconds_count' in body
@@ -0,0 +1,34 @@
+import pytest
+
+import migrations
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = SQLiteStorage(str(tmp_path / 'fresh.db')).connect()
+    yield conn
+    conn.close()
+
+
+def applied_versions(conn):
+    return [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+
+
+def test_fresh_database_gets_every_migration_once(conn):
+    latest = migrations.latest_version()
+    assert migrations.migrate(conn) == latest
+    assert applied_versions(conn) == [module.VERSION for module in migrations.load_migrations()]
+
+    # Already current: nothing is applied again
+    assert migrations.migrate(conn) == latest
+    assert applied_versions(conn) == list(range(1, latest + 1))
+    assert conn.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'").fetchone()[0] == 1
+
+
+def test_schema_newer_than_the_code_is_refused(conn):
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO schema_version (version, description) VALUES (999, 'from the future')")
+    conn.commit()
+    with pytest.raises(RuntimeError, match="newer than this code"):
+        migrations.migrate(conn)
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from database import AsyncConnectionPool, PoolTimeout
+from storage import SQLiteStorage
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / 'pool.db'))
+
+
+def test_released_connection_is_reused(storage):
+    async def scenario():
+        pool = AsyncConnectionPool(storage.open_connection, min_size=0, max_size=2)
+        first = await pool.acquire()
+        assert await first.fetchone("SELECT 1 AS one") == {'one': 1}
+        await pool.release(first)
+        second = await pool.acquire()
+        stats = pool.stats()
+        await pool.release(second)
+        await pool.close()
+        return first, second, stats
+
+    first, second, stats = run(scenario())
+    assert second is first
+    assert stats['size'] == 1 and stats['in_use'] == 1 and stats['acquired_total'] == 2
+
+
+def test_acquire_times_out_when_exhausted(storage):
+    async def scenario():
+        pool = AsyncConnectionPool(storage.open_connection, min_size=0, max_size=1, acquire_timeout=0.05)
+        held = await pool.acquire()
+        try:
+            with pytest.raises(PoolTimeout):
+                await pool.acquire()
+        finally:
+            await pool.release(held)
+        stats = pool.stats()
+        await pool.close()
+        return stats
+
+    stats = run(scenario())
+    assert stats['timeouts_total'] == 1
+    assert stats['waits_total'] == 1
+    assert stats['in_use'] == 0 and stats['size'] == 1
+
+
+def test_waiter_gets_connection_released_by_another_request(storage):
+    async def scenario():
+        pool = AsyncConnectionPool(storage.open_connection, min_size=0, max_size=1, acquire_timeout=2)
+        held = await pool.acquire()
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert pool.stats()['waiting'] == 1
+        await pool.release(held)
+        conn = await waiter
+        await pool.release(conn)
+        await pool.close()
+        return held, conn
+
+    held, conn = run(scenario())
+    assert conn is held
+
+
+def test_old_connections_are_recycled_on_checkout(storage):
+    async def scenario():
+        pool = AsyncConnectionPool(storage.open_connection, min_size=0, max_size=1, recycle_seconds=0)
+        first = await pool.acquire()
+        await pool.release(first)
+        await asyncio.sleep(0.01)
+        second = await pool.acquire()
+        stats = pool.stats()
+        await pool.release(second)
+        await pool.close()
+        return first, second, stats
+
+    first, second, stats = run(scenario())
+    assert second is not first
+    assert first.closed
+    assert stats['recycled_total'] == 1
+    assert stats['size'] == 1
+
+
+def test_fill_opens_min_size_connections(storage):
+    async def scenario():
+        pool = AsyncConnectionPool(storage.open_connection, min_size=2, max_size=4)
+        await pool.fill()
+        stats = pool.stats()
+        await pool.close()
+        return stats
+
+    stats = run(scenario())
+    assert stats['size'] == 2 and stats['idle'] == 2
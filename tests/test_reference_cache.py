@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sqlite3
+
+import api
+
+
+def write_from_another_worker(username):
+    """Creates a user the way another worker process would: straight in the database."""
+    with sqlite3.connect(os.environ['SQLITE_PATH']) as conn:
+        conn.execute("UPDATE inventory_sync SET version = version + 1 WHERE id = 1")
+        version = conn.execute("SELECT version FROM inventory_sync WHERE id = 1").fetchone()[0]
+        conn.execute(
+            "INSERT INTO users (username, password_hash, full_name, is_admin) VALUES (?, 'x', ?, 0)",
+            (username, username.title())
+        )
+        conn.execute("UPDATE reference_versions SET version = ? WHERE name = 'technicians'", (version,))
+
+
+def usernames(client, admin):
+    return {user['username'] for user in client.get('/users/technicians', headers=admin).json()}
+
+
+def test_own_writes_invalidate_the_cache_right_away(client, admin):
+    usernames(client, admin)
+    response = client.post('/users', headers=admin, json={'username': 'local_write', 'password': 'x', 'full_name': 'Local'})
+    assert response.status_code == 201
+    assert 'local_write' in usernames(client, admin)
+
+
+def test_writes_by_other_workers_are_picked_up_on_the_next_poll(client, admin):
+    client.portal.call(api.reference_watcher.poll)
+    assert 'remote_write' not in usernames(client, admin)
+    write_from_another_worker('remote_write')
+    # Still served from this worker's cache
+    assert 'remote_write' not in usernames(client, admin)
+
+    client.portal.call(api.reference_watcher.poll)
+    assert 'remote_write' in usernames(client, admin)
+
+
+def test_load_overtaken_by_a_write_is_not_cached(client, admin, monkeypatch):
+    real_loader = api.REFERENCE_LOADERS['technicians']
+    loads = []
+
+    async def loader(db):
+        rows = await real_loader(db)
+        loads.append(len(rows))
+        if len(loads) == 1:
+            # A write lands while the first load is in flight
+            api.invalidate_reference_data('technicians')
+        return rows
+
+    monkeypatch.setitem(api.REFERENCE_LOADERS, 'technicians', loader)
+    api.invalidate_reference_data('technicians')
+    usernames(client, admin)
+    usernames(client, admin)
+    assert len(loads) == 2
+
+
+def test_concurrent_misses_share_one_load(client, monkeypatch):
+    real_loader = api.REFERENCE_LOADERS['item_codes']
+    loads = []
+
+    async def loader(db):
+        loads.append(1)
+        await asyncio.sleep(0.05)
+        return await real_loader(db)
+
+    async def load_concurrently():
+        api.invalidate_reference_data('item_codes')
+        return await asyncio.gather(*(api._reference_entry('item_codes') for _ in range(5)))
+
+    monkeypatch.setitem(api.REFERENCE_LOADERS, 'item_codes', loader)
+    entries = client.portal.call(load_concurrently)
+    assert len(loads) == 1
+    assert all(entry is entries[0] for entry in entries)
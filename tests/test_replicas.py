@@ -0,0 +1,96 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from replicas import ReadRouter
+from storage import SQLiteStorage
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def set_version(path, version):
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS inventory_sync (id INTEGER PRIMARY KEY, version INTEGER NOT NULL)")
+        conn.execute("INSERT OR REPLACE INTO inventory_sync (id, version) VALUES (1, ?)", (version,))
+
+
+def replicate(primary, replica):
+    """Brings ``replica`` up to date with ``primary``, like a replication thread would."""
+    with sqlite3.connect(primary) as source, sqlite3.connect(replica) as target:
+        source.backup(target)
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """(primary, replica) SQLite files, in sync at version 3."""
+    primary, replica = str(tmp_path / 'primary.db'), str(tmp_path / 'replica.db')
+    set_version(primary, 3)
+    replicate(primary, replica)
+    return primary, replica
+
+
+def make_router(*paths):
+    return ReadRouter([SQLiteStorage(path) for path in paths], list(paths), retry_seconds=60)
+
+
+async def route(router, position):
+    """'replica' or 'primary', returning the replica connection right away."""
+    replica = await router.acquire(position)
+    if replica is None:
+        return 'primary'
+    pool, conn = replica
+    await pool.release(conn)
+    return 'replica'
+
+
+def test_reads_stay_on_the_primary_until_the_replica_catches_up(databases):
+    primary, replica = databases
+    router = make_router(replica)
+
+    async def scenario():
+        routes = [await route(router, 0), await route(router, 3)]
+        # A write the replica hasn't applied yet
+        set_version(primary, 4)
+        router.note_write(7, 4)
+        routes.append(await route(router, router.required_position(7)))
+        replicate(primary, replica)
+        routes.append(await route(router, router.required_position(7)))
+        await router.close()
+        return routes
+
+    assert run(scenario()) == ['replica', 'replica', 'primary', 'replica']
+    assert router.routed == {"replica": 3, "primary_lagging": 1, "primary_unavailable": 0}
+
+
+def test_write_position_header_carries_writes_made_on_other_workers(databases):
+    primary, replica = databases
+    router = make_router(replica)
+    set_version(primary, 5)
+
+    async def scenario():
+        # This worker never saw the write; the client sent its position back
+        position = router.required_position(7, header_value='5')
+        routes = [await route(router, position)]
+        routes.append(await route(router, router.required_position(7, header_value='not-a-number')))
+        await router.close()
+        return position, routes
+
+    assert run(scenario()) == (5, ['primary', 'replica'])
+
+
+def test_unreachable_replica_falls_back_to_the_primary(tmp_path):
+    router = make_router(str(tmp_path / 'missing' / 'replica.db'))
+
+    async def scenario():
+        routes = [await route(router, 0), await route(router, 0)]
+        stats = router.stats()
+        await router.close()
+        return routes, stats
+
+    routes, stats = run(scenario())
+    assert routes == ['primary', 'primary']
+    assert router.routed['primary_unavailable'] == 2
+    assert stats['replicas'][0]['skipped'] and stats['replicas'][0]['last_error']
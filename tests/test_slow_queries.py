@@ -0,0 +1,32 @@
+from slow_queries import SlowQueryLog, fingerprint, param_shape
+
+
+def test_fingerprint_folds_in_lists_and_multi_row_values():
+    assert fingerprint("SELECT id FROM users\n   WHERE id IN (%s, %s, %s)") == "SELECT id FROM users WHERE id IN (...)"
+    assert fingerprint("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)") == "INSERT INTO t (a, b) VALUES (%s, %s), ..."
+
+
+def test_param_shape_never_includes_values():
+    assert param_shape([7, 'secreto', None]) == ['int', 'str(7)', 'None']
+    assert param_shape([(1, 'a'), (2, 'b')]) == "2 x ['int', 'str(1)']"
+
+
+def test_only_slow_statements_are_aggregated_by_shape():
+    log = SlowQueryLog(threshold_ms=100, explain=False)
+    log.observe("SELECT * FROM t WHERE id IN (%s)", [1], 0.05)
+    log.observe("SELECT * FROM t WHERE id IN (%s)", [1], 0.2)
+    log.observe("SELECT * FROM t WHERE id IN (%s, %s)", [1, 2], 0.4)
+    log.observe("UPDATE t SET a = %s", [1], 0.3)
+
+    top = log.top()
+    assert [(entry['statement'], entry['count']) for entry in top] == [
+        ("SELECT * FROM t WHERE id IN (...)", 2),
+        ("UPDATE t SET a = %s", 1),
+    ]
+    assert top[0]['avg_ms'] == 300.0 and top[0]['max_ms'] == 400.0
+    assert log.top(order_by='count', limit=1)[0]['count'] == 2
+
+
+def test_endpoint_is_404_unless_enabled(client, admin):
+    # SLOW_QUERY_LOG isn't set for the test session
+    assert client.get('/debug/slow-queries', headers=admin).status_code == 404